@@ -1,16 +1,23 @@
+import time
+_imports_started = time.perf_counter()
 import streamlit as st
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.graphs import Neo4jGraph
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from streamlit_agraph import agraph, Node, Edge, Config
+# LangChain, Chroma, Groq and streamlit_agraph are imported where they are first used
+# (see startup.py), so the page renders before they have loaded
+from graph_lookup import lookup_triples
+from semantic_cache import cache_from_env
+from graph_snapshot import snapshot_store_from_env
+from multi_hop import SnapshotBackend, Neo4jBackend, expand_paths
+from context_packer import context_budget, pack_context
+from lexical_index import retriever_for
+from startup import start_app_backends
+from telemetry import span, start_span, activate, submit, record_error, metrics, approx_tokens, timing_rows, exporters_from_env
 
 # Load environment variables
 load_dotenv()
+exporters_from_env()
 
 # --- CONFIGURATION ---
 st.set_page_config(layout="wide", page_title="MedGraph AI", page_icon="🧬")
@@ -21,98 +28,167 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
-if not GROQ_API_KEY or not NEO4J_PASSWORD:
+# Multi-hop retrieval (depth 1 keeps the plain neighbor lookup)
+GRAPH_DEPTH = int(os.getenv("MEDGRAPH_GRAPH_DEPTH", "1"))
+GRAPH_REL_TYPES = [t for t in os.getenv("MEDGRAPH_GRAPH_REL_TYPES", "").split(",") if t] or None
+GRAPH_TIME_BUDGET = float(os.getenv("MEDGRAPH_GRAPH_TIME_BUDGET", "0.5"))
+# How long a fetched subgraph is reused for the same entities (seconds)
+SUBGRAPH_TTL = int(os.getenv("MEDGRAPH_SUBGRAPH_TTL", "300"))
+# When set, the UI is a thin client of service.py and holds no database clients itself
+SERVICE_URL = os.getenv("MEDGRAPH_SERVICE_URL")
+CHROMA_PATH = os.getenv("MEDGRAPH_CHROMA_PATH", "./medical_chroma_db")
+# Using Llama 3.1 Instant for speed; its prompt gets a smaller packed context than the 70B engine's
+ANSWER_MODEL = "llama-3.1-8b-instant"
+CONTEXT_TOKENS = context_budget(ANSWER_MODEL)
+VECTOR_CANDIDATES = int(os.getenv("MEDGRAPH_VECTOR_CANDIDATES", "4"))
+
+if not SERVICE_URL and (not GROQ_API_KEY or not NEO4J_PASSWORD):
     st.error("🚨 API Keys not found! Please create a .env file with your credentials.")
     st.stop()
 
 # --- INITIALIZATION ---
 @st.cache_resource
-def setup_databases():
+def get_startup(_import_seconds):
+    # Returns at once: every client is built in parallel in the background (see startup.py)
     print("Loading Databases...")
-    embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vector_db = Chroma(persist_directory="./medical_chroma_db", embedding_function=embedding_function)
-    graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
-    # Using Llama 3.1 Instant for speed
-    llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-    return vector_db, graph, llm
+    return start_app_backends(CHROMA_PATH, ANSWER_MODEL, import_seconds=_import_seconds)
+
+@st.cache_resource
+def get_executor():
+    # Shared across sessions so vector retrieval can overlap with extraction
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="medgraph")
+
+@st.cache_resource
+def get_answer_cache(_embedding_function):
+    # One cache for every session: paraphrased repeat questions skip both LLM calls
+    return cache_from_env(_embedding_function.embed_query)
+
+@st.cache_resource
+def get_snapshot_store():
+    # None unless MEDGRAPH_GRAPH_BACKEND=snapshot and graph_snapshot.py has exported one
+    return snapshot_store_from_env()
+
+@st.cache_resource
+def get_service_client():
+    from service_client import ServiceClient
+    return ServiceClient(SERVICE_URL)
 
+def bind_backends():
+    """Waits for whatever is still loading (only the first questions after a cold start do) and binds the clients.
+    
+    The entity dictionary refreshes itself when the graph is rebuilt (see data_version.py).
+    """
+    global vector_db, graph, llm, answer_cache, entity_dictionary, snapshot_store, vector_retriever
+    vector_db = startup.get("chroma")
+    graph = startup.get("neo4j")
+    llm = startup.get("groq")
+    entity_dictionary = startup.get("dictionary")
+    answer_cache = get_answer_cache(startup.get("embeddings"))
+    snapshot_store = get_snapshot_store()
+    vector_retriever = retriever_for(vector_db, CHROMA_PATH, VECTOR_CANDIDATES)
+
+service = None
+startup = None
+model_label = "Llama 3.1 Instant"
 try:
-    vector_db, graph, llm = setup_databases()
-    vector_retriever = vector_db.as_retriever(search_kwargs={"k": 2})
-    db_status = "✅ Connected"
+    if SERVICE_URL:
+        service = get_service_client()
+        is_ready, readiness = service.ready()
+        db_status = f"✅ Service {SERVICE_URL}" if is_ready else f"⏳ Service not ready: {readiness['components']}"
+        model_label = "Llama 3.3 70B (service)"
+    else:
+        startup = get_startup(time.perf_counter() - _imports_started)
+        # The cached Startup outlives this run: backends that failed get another attempt
+        startup.retry_failed()
+        if startup.all_ready():
+            bind_backends()
+            db_status = "✅ Connected"
+        else:
+            db_status = startup.summary()
 except Exception as e:
     db_status = f"❌ Error: {e}"
 
 # --- LOGIC ---
-def sanitize(text):
-    text = text.replace("'s", "") 
-    text = text.replace("'", "\\'") 
-    return text.strip()
+def fetch_triples(entities, limit):
+    if snapshot_store:
+        return snapshot_store.get().lookup_triples(entities, limit=limit)
+    return lookup_triples(graph, entities, limit=limit)
+
+@st.cache_data(ttl=SUBGRAPH_TTL, max_entries=256, show_spinner=False)
+def fetch_subgraph(entities):
+    """One graph retrieval per entity set, shared by the prompt and the visualization.
+    
+    `entities` is a tuple so it can key Streamlit's TTL cache; reruns and repeated
+    questions about the same entities cost no database traffic. Errors propagate,
+    so a failed lookup is never cached.
+    """
+    if GRAPH_DEPTH > 1:
+        backend = SnapshotBackend(snapshot_store.get()) if snapshot_store else Neo4jBackend(graph)
+        paths, _ = expand_paths(backend, list(entities), depth=GRAPH_DEPTH, rel_types=GRAPH_REL_TYPES, time_budget=GRAPH_TIME_BUDGET)
+        return {"triples": {}, "paths": paths}
+    return {"triples": fetch_triples(list(entities), limit=20), "paths": []}
+
+def get_subgraph(entities):
+    with span("graph_retrieval", entities=len(entities), depth=GRAPH_DEPTH) as s:
+        try:
+            subgraph = fetch_subgraph(tuple(entities))
+        except Exception as e:
+            # Answer from the vector context alone, but count and trace the failure
+            record_error("graph_retrieval", e)
+            subgraph = {"triples": {}, "paths": []}
+        s.set(results=sum(len(t) for t in subgraph["triples"].values()) + len(subgraph["paths"]))
+    return subgraph
 
-def get_graph_data(entities):
+def subgraph_to_agraph(subgraph):
+    from streamlit_agraph import Node, Edge
     nodes = []
     edges = []
     node_ids = set()
     
-    for entity in entities:
-        clean_entity = sanitize(entity)
-        query = f"""
-        MATCH (n)-[r]-(m)
-        WHERE toLower(n.id) CONTAINS toLower('{clean_entity}') OR toLower(m.id) CONTAINS toLower('{clean_entity}')
-        RETURN n.id AS source, type(r) AS rel, m.id AS target
-        LIMIT 20
-        """
-        try:
-            results = graph.query(query)
-            for res in results:
-                source = res['source']
-                target = res['target']
-                rel = res['rel']
-                
-                if source not in node_ids:
-                    nodes.append(Node(id=source, label=source, size=25, color="#FF4B4B"))
-                    node_ids.add(source)
-                if target not in node_ids:
-                    nodes.append(Node(id=target, label=target, size=15, color="#4BFF4B"))
-                    node_ids.add(target)
-                edges.append(Edge(source=source, label=rel, target=target, color="#A0A0A0"))
-        except Exception as e:
-            print(f"Viz Error: {e}")
+    triples = [t for ts in subgraph["triples"].values() for t in ts]
+    triples += [{"source": s, "rel": rel, "target": t} for p in subgraph["paths"] for s, rel, t in p["hops"]]
+    for res in triples:
+        source = res['source']
+        target = res['target']
+        rel = res['rel']
+        
+        if source not in node_ids:
+            nodes.append(Node(id=source, label=source, size=25, color="#FF4B4B"))
+            node_ids.add(source)
+        if target not in node_ids:
+            nodes.append(Node(id=target, label=target, size=15, color="#4BFF4B"))
+            node_ids.add(target)
+        edges.append(Edge(source=source, label=rel, target=target, color="#A0A0A0"))
             
     return nodes, edges
 
-def get_graph_context_text(entities):
-    context_data = []
-    for entity in entities:
-        clean_entity = sanitize(entity)
-        query = f"""
-        MATCH (n)-[r]-(m)
-        WHERE toLower(n.id) CONTAINS toLower('{clean_entity}') OR toLower(m.id) CONTAINS toLower('{clean_entity}')
-        RETURN n.id AS source, type(r) AS rel, m.id AS target
-        LIMIT 10
-        """
-        try:
-            result = graph.query(query)
-            for record in result:
-                context_data.append(f"{record['source']} {record['rel']} {record['target']}")
-        except Exception:
-            continue
-    return "\n".join(context_data) if context_data else "No direct graph connections found."
+def get_vector_chunks(question):
+    with span("vector_retrieval") as s:
+        vector_docs = vector_retriever.invoke(question)
+        s.set(results=len(vector_docs))
+    return [doc.page_content for doc in vector_docs]
 
-def hybrid_search_logic(question):
-    # 1. Extract
+def extract_entities_llm(question):
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
     system_prompt = "You are a medical entity extractor. Extract the main medical concepts (diseases, drugs, procedures) from the user question. Return ONLY the entities as a comma-separated list."
     extraction_prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", "{question}")])
     extractor = extraction_prompt | llm | StrOutputParser()
-    entities = [e.strip() for e in extractor.invoke({"question": question}).split(",")]
-    
-    # 2. Retrieve
-    vector_docs = vector_retriever.invoke(question)
-    vector_context = "\n".join([doc.page_content for doc in vector_docs])
-    graph_context = get_graph_context_text(entities)
-    
-    # 3. Answer
-    template = """
+    return [e.strip() for e in extractor.invoke({"question": question}).split(",") if e.strip()]
+
+def extract_entities(question):
+    # Dictionary first, LLM only when nothing matched
+    with span("extraction") as s:
+        entities = entity_dictionary.extract(question)
+        source = "dictionary"
+        if not entities:
+            source = "llm"
+            entities = extract_entities_llm(question)
+        s.set(source=source, results=len(entities))
+    metrics.incr("medgraph_entity_extractions_total", source=source)
+    return entities
+
+ANSWER_TEMPLATE = """
     You are an advanced AI Medical Assistant. Answer the question using the provided context.
     
     CONTEXT FROM VECTOR DB (Literature):
@@ -124,14 +200,169 @@ def hybrid_search_logic(question):
     Question: {question}
     Answer:
     """
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"vector_context": vector_context, "graph_context": graph_context, "question": question})
+
+def retrieve_for_question(question):
+    # Vector retrieval only needs the question, so start it before extraction
+    vector_future = submit(get_executor(), get_vector_chunks, question)
+    
+    # 1. Extract
+    entities = extract_entities(question)
+    
+    # 2. Retrieve (one subgraph fetch feeds both the prompt and the graph panel)
+    subgraph = get_subgraph(entities)
+    chunks = vector_future.result()
+    
+    # 3. Pack: the graph panel shows all 20 triples per entity, the prompt only what fits the budget
+    with span("context_packing") as s:
+        vector_context, graph_context, stats = pack_context(question, chunks, subgraph, CONTEXT_TOKENS)
+        s.set(**stats)
+    inputs = {"vector_context": vector_context, "graph_context": graph_context, "question": question}
+    return entities, subgraph, inputs
+
+def get_answer_chain():
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    prompt = ChatPromptTemplate.from_template(ANSWER_TEMPLATE)
+    return prompt | llm | StrOutputParser()
+
+def cached_answer(question):
+    cached = answer_cache.get(question)
+    metrics.incr("medgraph_cache_hits_total" if cached is not None else "medgraph_cache_misses_total", cache="answer")
+    return cached
+
+def hybrid_search_logic(question):
+    if service:
+        entities, _, tokens, _ = service_search_stream(question)
+        return "".join(tokens), entities
+    with span("app.request") as s:
+        cached = cached_answer(question)
+        if cached is not None:
+            s.set(cache="hit")
+            return cached["answer"], cached["entities"]
+        
+        entities, _, inputs = retrieve_for_question(question)
+        # 4. Answer
+        with span("generation", prompt_tokens=approx_tokens(ANSWER_TEMPLATE.format(**inputs))) as gen:
+            response = get_answer_chain().invoke(inputs)
+            gen.set(completion_tokens=approx_tokens(response))
+        answer_cache.put(question, response, entities)
     return response, entities
 
+def hybrid_search_stream(question):
+    """Returns (entities, subgraph, token generator, trace) so the graph can render while the answer streams.
+    
+    The trace span stays open until the last token, so its timings cover generation too.
+    """
+    if service:
+        return service_search_stream(question)
+    root = start_span("app.request")
+    try:
+        with activate(root):
+            cached = cached_answer(question)
+            if cached is not None:
+                root.set(cache="hit")
+                subgraph = get_subgraph(cached["entities"])
+                root.end()
+                return cached["entities"], subgraph, iter([cached["answer"]]), root
+            entities, subgraph, inputs = retrieve_for_question(question)
+    except Exception as e:
+        root.fail(e)
+        root.end()
+        raise
+    
+    def tokens():
+        parts = []
+        with activate(root):
+            try:
+                with span("generation", prompt_tokens=approx_tokens(ANSWER_TEMPLATE.format(**inputs))) as gen:
+                    for token in get_answer_chain().stream(inputs):
+                        if not parts:
+                            gen.set(first_token_ms=round((time.perf_counter() - gen.start) * 1000, 1))
+                        parts.append(token)
+                        yield token
+                    gen.set(completion_tokens=approx_tokens("".join(parts)))
+            finally:
+                root.end()
+        answer_cache.put(question, "".join(parts), entities)
+    return entities, subgraph, tokens(), root
+
+class RemoteTrace:
+    """The service's trace for a request, nested under the client-side round trip."""
+    
+    def __init__(self, root):
+        self.root = root
+        self.remote = None
+    
+    def to_dict(self):
+        trace = self.root.to_dict()
+        if self.remote:
+            trace["children"].append(self.remote)
+        return trace
+
+def service_search_stream(question):
+    """hybrid_search_stream against service.py: one request returns the subgraph first, then the tokens."""
+    root = start_span("app.request", service=SERVICE_URL)
+    trace = RemoteTrace(root)
+    try:
+        events = service.stream_events(question, limit=20)
+        context = next(events)
+    except Exception as e:
+        root.fail(e)
+        root.end()
+        raise
+    
+    def tokens():
+        try:
+            for event in events:
+                if event["event"] == "token":
+                    yield event["text"]
+                elif event["event"] == "trace":
+                    trace.remote = event["trace"]
+        finally:
+            root.end()
+    return context["entities"], context["subgraph"], tokens(), trace
+
+def render_timings(placeholder, trace):
+    if trace:
+        placeholder.dataframe(timing_rows(trace), hide_index=True, use_container_width=True)
+    else:
+        placeholder.caption("Timings appear once the answer has finished streaming.")
+
+def render_graph_panel(entities, subgraph, trace):
+    """Returns the placeholder for the request timings (filled in when the answer completes)."""
+    st.subheader("🕸️ Neural Association Graph")
+    timings = None
+    if entities and subgraph:
+        with st.expander("Show Debug Details"):
+            st.write(f"Entities: {entities}")
+            timings = st.empty()
+            render_timings(timings, trace)
+        with st.spinner("Rendering 3D Network..."):
+            nodes, edges = subgraph_to_agraph(subgraph)
+            if nodes:
+                from streamlit_agraph import agraph, Config
+                config = Config(width=600, height=600, directed=True, physics=True, hierarchy=False, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
+                agraph(nodes=nodes, edges=edges, config=config)
+            else:
+                st.warning("No connections found.")
+    return timings
+
+# While backends are still loading, the status line polls instead of blocking the page
+booting = startup is not None and not startup.done()
+
+@st.fragment(run_every=1.0 if booting else None)
+def render_status():
+    status = startup.summary() if booting else db_status
+    if booting and startup.done():
+        st.rerun()  # everything has settled: a full rerun binds the clients and stops the polling
+    st.caption(f"System Status: {status} | Model: {model_label}")
+    if startup is not None:
+        with st.expander("Cold Start Timings"):
+            st.dataframe(startup.report(), hide_index=True, use_container_width=True)
+
 # --- UI ---
 st.title("🧬 MedGraph: Hybrid Reasoning Engine")
-st.caption(f"System Status: {db_status} | Model: Llama 3.1 Instant")
+render_status()
 
 col1, col2 = st.columns([55, 45])
 
@@ -139,28 +370,37 @@ with col1:
     st.subheader("💬 Clinical Query")
     if "messages" not in st.session_state: st.session_state.messages = []
     if "last_entities" not in st.session_state: st.session_state.last_entities = []
+    if "last_subgraph" not in st.session_state: st.session_state.last_subgraph = None
+    if "last_trace" not in st.session_state: st.session_state.last_trace = None
     
     for msg in st.session_state.messages:
         st.chat_message(msg["role"]).markdown(msg["content"])
         
-    if prompt := st.chat_input("Ex: What treats Hirschsprung's disease?"):
+    prompt = st.chat_input("Ex: What treats Hirschsprung's disease?")
+    if prompt:
         st.chat_message("user").markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
+        if startup is not None and not startup.all_ready():
+            with st.spinner("⏳ Waiting for the databases to finish loading..."):
+                try:
+                    bind_backends()
+                except Exception as e:
+                    st.error(f"❌ Backend failed to start: {e}")
+                    st.stop()
         with st.spinner("🧠 Triangulating Vector & Graph Data..."):
-            answer, entities = hybrid_search_logic(prompt)
+            entities, subgraph, answer_stream, request_span = hybrid_search_stream(prompt)
             st.session_state.last_entities = entities
-        st.chat_message("assistant").markdown(answer)
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+            st.session_state.last_subgraph = subgraph
+            st.session_state.last_trace = None
 
+# The graph panel renders before the answer stream starts, so both fill in together
 with col2:
-    st.subheader("🕸️ Neural Association Graph")
-    if st.session_state.last_entities:
-        with st.expander("Show Debug Details"):
-            st.write(f"Entities: {st.session_state.last_entities}")
-        with st.spinner("Rendering 3D Network..."):
-            nodes, edges = get_graph_data(st.session_state.last_entities)
-            if nodes:
-                config = Config(width=600, height=600, directed=True, physics=True, hierarchy=False, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
-                agraph(nodes=nodes, edges=edges, config=config)
-            else:
-                st.warning("No connections found.")
\ No newline at end of file
+    timings_placeholder = render_graph_panel(st.session_state.last_entities, st.session_state.last_subgraph, st.session_state.last_trace)
+
+if prompt:
+    with col1:
+        answer = st.chat_message("assistant").write_stream(answer_stream)
+        st.session_state.messages.append({"role": "assistant", "content": answer})
+        st.session_state.last_trace = request_span.to_dict()
+        if timings_placeholder is not None:
+            render_timings(timings_placeholder, st.session_state.last_trace)
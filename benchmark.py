@@ -0,0 +1,208 @@
+"""Offline benchmark for the query and ingestion pipelines.
+
+Runs `hybrid_rag.hybrid_search` and `full_scale_builder.process_in_batches`
+against the deterministic stand-ins in offline_backends.py (fake LLM,
+in-memory graph, throwaway local Chroma) over a synthetic corpus, so the
+numbers reflect our own code on this machine rather than Groq / AuraDB.
+
+    python benchmark.py --corpus-sizes 100,1000 --concurrency 1,4,16 --llm-latency 0.05
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+
+PERCENTILES = [50, 95, 99]
+
+
+def configure_environment(workdir):
+    """Must run before hybrid_rag / full_scale_builder are imported: they build their clients at import."""
+    # Checked by full_scale_builder; the in-memory graph ignores credentials
+    os.environ["NEO4J_PASSWORD"] = "offline"
+    os.environ["MEDGRAPH_CHROMA_PATH"] = os.path.join(workdir, "chroma")
+    os.environ["MEDGRAPH_CHECKPOINT_PATH"] = os.path.join(workdir, "checkpoints.db")
+    os.environ["MEDGRAPH_DATA_VERSION_FILE"] = os.path.join(workdir, "data_version")
+    os.environ["MEDGRAPH_GRAPH_BACKEND"] = "neo4j"  # the in-memory graph stands in for Neo4j
+    os.environ.pop("MEDGRAPH_CACHE_PATH", None)
+    # The limiter itself is part of the pipeline, but real quotas would only measure sleeping
+    os.environ["GROQ_RPM"] = "1000000"
+    os.environ["GROQ_TPM"] = "1000000000"
+
+
+def latency_summary(samples):
+    ms = np.asarray(samples) * 1000
+    summary = {f"p{p}": round(float(np.percentile(ms, p)), 2) for p in PERCENTILES}
+    summary["mean"] = round(float(ms.mean()), 2)
+    return summary
+
+
+def measured(fn, trace_memory):
+    """Runs fn(), returning (result, seconds, peak traced MB or None)."""
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 1) if trace_memory else None
+    return result, elapsed, peak
+
+
+class TimedTransformer:
+    """Wraps a graph transformer to record per-batch extraction latency."""
+
+    def __init__(self, transformer):
+        self.transformer = transformer
+        self.samples = []
+
+    def convert_to_graph_documents(self, documents):
+        start = time.perf_counter()
+        try:
+            return self.transformer.convert_to_graph_documents(documents)
+        finally:
+            self.samples.append(time.perf_counter() - start)
+
+
+def load_corpus(hybrid_rag, transformer, records):
+    """Adds records to the in-memory graph and the local Chroma store used by hybrid_rag."""
+    from lexical_index import chunk_id
+
+    documents = [Document(page_content=text, metadata={"record_id": record_id}) for record_id, text in records]
+    hybrid_rag.graph.add_graph_documents(transformer.convert_to_graph_documents(documents))
+    hybrid_rag.vector_db.add_texts(
+        [text for _, text in records],
+        metadatas=[{"record_id": record_id} for record_id, _ in records],
+        ids=[chunk_id(record_id, text) for record_id, text in records],
+    )
+    lexical_index = getattr(hybrid_rag.vector_retriever, "lexical_index", None)
+    if lexical_index is not None:
+        lexical_index.add([(chunk_id(record_id, text), text) for record_id, text in records])
+        lexical_index.commit()
+    hybrid_rag.entity_dictionary.refresh()
+
+
+def bench_hybrid_search(hybrid_rag, questions, concurrency, trace_memory):
+    def ask(question):
+        start = time.perf_counter()
+        hybrid_rag.hybrid_search(question, use_cache=False)
+        return time.perf_counter() - start
+
+    def run():
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(ask, questions))
+
+    ask(questions[0])  # warm-up: first Chroma query, first chain invocation
+    samples, elapsed, peak = measured(run, trace_memory)
+    return {
+        "benchmark": "hybrid_search",
+        "concurrency": concurrency,
+        "operations": len(questions),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(questions) / elapsed, 2),
+        "latency_ms": latency_summary(samples),
+        "peak_mem_mb": peak,
+    }
+
+
+def bench_ingestion(builder, records, workers, workdir, trace_memory):
+    from checkpoint_store import CheckpointStore
+
+    # Fresh graph and checkpoint store per run, so nothing is skipped as already done
+    builder.graph.query("MATCH (n) DETACH DELETE n")
+    builder.checkpoint = CheckpointStore(os.path.join(workdir, f"ingest-{len(records)}-{workers}.db"), namespace="benchmark")
+    timed = TimedTransformer(builder.llm_transformer.transformer if isinstance(builder.llm_transformer, TimedTransformer)
+                             else builder.llm_transformer)
+    builder.llm_transformer = timed
+
+    stats, elapsed, peak = measured(lambda: builder.process_in_batches(iter(records), workers=workers), trace_memory)
+    return {
+        "benchmark": "process_in_batches",
+        "concurrency": workers,
+        "operations": len(records),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(stats["written"] / elapsed, 2),
+        "latency_ms": latency_summary(timed.samples) if timed.samples else None,  # per extraction batch
+        "peak_mem_mb": peak,
+        "failed": len(stats["failed"]),
+    }
+
+
+def print_table(results):
+    print(f"\n{'benchmark':<20}{'corpus':>8}{'conc':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for r in results:
+        lat = r["latency_ms"] or {}
+        peak = "-" if r["peak_mem_mb"] is None else r["peak_mem_mb"]
+        print(f"{r['benchmark']:<20}{r['corpus_size']:>8}{r['concurrency']:>6}{r['throughput_per_s']:>10}"
+              f"{lat.get('p50', '-'):>10}{lat.get('p95', '-'):>10}{lat.get('p99', '-'):>10}{peak:>10}")
+
+
+def run_benchmarks(corpus_sizes, concurrency_levels, questions_per_run=100, llm_latency=0.0, token_latency=0.0,
+                   skip_query=False, skip_ingest=False, trace_memory=True, seed=0):
+    workdir = tempfile.mkdtemp(prefix="medgraph-bench-")
+    configure_environment(workdir)
+    from offline_backends import FakeGraphTransformer, install, synthetic_corpus, synthetic_questions
+    install(llm_latency, token_latency)
+    import hybrid_rag
+    import full_scale_builder
+
+    loader = FakeGraphTransformer(full_scale_builder.ALLOWED_NODES, full_scale_builder.ALLOWED_RELATIONSHIPS)
+
+    if trace_memory:
+        tracemalloc.start()
+    corpus = synthetic_corpus(max(corpus_sizes), seed)
+    results = []
+    loaded = 0
+    for size in sorted(corpus_sizes):
+        records = corpus[:size]
+        if not skip_query:
+            # Corpus sizes ascend, so each step only adds the new records
+            load_corpus(hybrid_rag, loader, records[loaded:])
+            loaded = size
+            questions = synthetic_questions(records, questions_per_run, seed)
+            for concurrency in concurrency_levels:
+                results.append({"corpus_size": size, **bench_hybrid_search(hybrid_rag, questions, concurrency, trace_memory)})
+        if not skip_ingest:
+            for workers in concurrency_levels:
+                results.append({"corpus_size": size, **bench_ingestion(full_scale_builder, records, workers, workdir, trace_memory)})
+    if trace_memory:
+        tracemalloc.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline MedGraph benchmark (no Groq / Neo4j needed).")
+    parser.add_argument("--corpus-sizes", default="100,1000", help="Comma-separated document counts")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels (threads / ingestion workers)")
+    parser.add_argument("--questions", type=int, default=100, help="hybrid_search calls per run")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake LLM seconds per call (0 = pure pipeline overhead)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake LLM seconds per generated word")
+    parser.add_argument("--skip-query", action="store_true")
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows allocation-heavy code)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        [int(s) for s in args.corpus_sizes.split(",")],
+        [int(c) for c in args.concurrency.split(",")],
+        questions_per_run=args.questions,
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        skip_query=args.skip_query,
+        skip_ingest=args.skip_ingest,
+        trace_memory=not args.no_memory,
+    )
+    print_table(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
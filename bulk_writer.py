@@ -0,0 +1,177 @@
+"""Bulk graph writes for extracted GraphDocuments, in place of add_graph_documents.
+
+add_graph_documents MERGEs row by row through APOC with no constraint on `id`,
+so every MERGE scans its label and writes slow down as the graph grows.
+BulkWriter writes differently:
+
+- It creates a uniqueness constraint on `id` (which is backed by an index)
+  for every node label before the first write.
+- It groups nodes by label and relationships by (source label, type, target
+  label), so each group is one static, index-backed MERGE.
+- It sends the rows as parameterized UNWIND batches of `tx_size`, one
+  transaction each, on a session from the driver's pool.
+- Every node gets the shared __Entity__ label, its indexed `norm_id` and the
+  union of its `aliases` (see canonicalize.py).
+
+CsvExporter takes the same GraphDocuments and writes them as CSV files for
+`neo4j-admin database import full`, for rebuilds from scratch where even
+batched MERGEs are too slow.
+"""
+import csv
+import os
+import re
+
+from canonicalize import ENTITY_LABEL, ensure_norm_index, norm_key
+
+# Every bulk query starts with this, so stand-in graphs (offline_backends.py) can recognize and parse them
+BULK_QUERY_PREFIX = "UNWIND $rows AS row"
+
+NODE_MERGE_QUERY = BULK_QUERY_PREFIX + """
+MERGE (n:{label} {{id: row.id}})
+ON CREATE SET n += row.properties
+SET n:""" + ENTITY_LABEL + """, n.norm_id = row.norm_id,
+    n.aliases = coalesce(n.aliases, []) + [a IN row.aliases WHERE NOT a IN coalesce(n.aliases, [])]
+"""
+
+RELATIONSHIP_MERGE_QUERY = BULK_QUERY_PREFIX + """
+MERGE (s:{source_label} {{id: row.source}})
+MERGE (t:{target_label} {{id: row.target}})
+MERGE (s)-[r:{type}]->(t)
+ON CREATE SET r += row.properties
+"""
+
+CONSTRAINT_QUERY = "CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE n.id IS UNIQUE"
+
+
+def quote(name):
+    """Backtick-quotes a label or relationship type (they cannot be query parameters)."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def group_graph_documents(graph_documents):
+    """({label: {id: properties}}, {(source_label, type, target_label): {(source, target): properties}}).
+
+    Duplicates across documents collapse into one row; the first properties seen win,
+    as with MERGE ... ON CREATE SET.
+    """
+    nodes, relationships = {}, {}
+    for doc in graph_documents:
+        for node in doc.nodes:
+            nodes.setdefault(node.type, {}).setdefault(str(node.id), node.properties or {})
+        for rel in doc.relationships:
+            for endpoint in (rel.source, rel.target):
+                nodes.setdefault(endpoint.type, {}).setdefault(str(endpoint.id), endpoint.properties or {})
+            key = (rel.source.type, rel.type, rel.target.type)
+            relationships.setdefault(key, {}).setdefault((str(rel.source.id), str(rel.target.id)), rel.properties or {})
+    return nodes, relationships
+
+
+def node_row(node_id, properties):
+    """One node MERGE row; `aliases` (set by Canonicalizer) is kept out of the plain properties."""
+    properties = dict(properties)
+    aliases = properties.pop("aliases", None) or [node_id]
+    return {"id": node_id, "norm_id": norm_key(node_id), "aliases": list(aliases), "properties": properties}
+
+
+class BulkWriter:
+    """write(graph_documents) with index-backed UNWIND MERGEs; a drop-in write_fn for IngestionEngine."""
+
+    def __init__(self, graph, labels=(), tx_size=1000):
+        self.graph = graph
+        self.tx_size = tx_size
+        self.constrained = set()
+        ensure_norm_index(graph)
+        self.ensure_constraints(labels)
+
+    def ensure_constraints(self, labels):
+        """Uniqueness constraints on `id` (idempotent). Labels that fail are retried on the next call."""
+        for label in labels:
+            if label in self.constrained:
+                continue
+            name = "medgraph_" + re.sub(r"\W", "_", label).lower() + "_id"
+            try:
+                self.graph.query(CONSTRAINT_QUERY.format(name=quote(name), label=quote(label)))
+                self.constrained.add(label)
+            except Exception as e:
+                # E.g. duplicate ids from earlier add_graph_documents runs: writes still work, just unindexed
+                print(f"⚠️  No uniqueness constraint on :{label}(id): {e}")
+
+    def run(self, query, rows):
+        """One UNWIND batch per transaction."""
+        driver = getattr(self.graph, "_driver", None)
+        for start in range(0, len(rows), self.tx_size):
+            params = {"rows": rows[start:start + self.tx_size]}
+            if driver is None:
+                self.graph.query(query, params)
+                continue
+            with driver.session(database=getattr(self.graph, "_database", None)) as session:
+                # execute_write retries transient errors (deadlocks, leader switches) itself
+                session.execute_write(lambda tx: tx.run(query, params).consume())
+
+    def write(self, graph_documents):
+        nodes, relationships = group_graph_documents(graph_documents)
+        self.ensure_constraints(list(nodes))
+        for label, rows in nodes.items():
+            self.run(NODE_MERGE_QUERY.format(label=quote(label)),
+                     [node_row(node_id, props) for node_id, props in rows.items()])
+        for (source_label, rel_type, target_label), rows in relationships.items():
+            query = RELATIONSHIP_MERGE_QUERY.format(source_label=quote(source_label), type=quote(rel_type), target_label=quote(target_label))
+            self.run(query, [{"source": s, "target": t, "properties": props} for (s, t), props in rows.items()])
+        return {"nodes": sum(len(r) for r in nodes.values()), "relationships": sum(len(r) for r in relationships.values())}
+
+
+class CsvExporter:
+    """Same write(graph_documents) contract, but appends to nodes.csv and relationships.csv
+    for neo4j-admin import.
+
+    Ids are unique per label (as with MERGE), so the import ID is "Label:id";
+    the plain id becomes the `id` property, next to `norm_id` and `aliases`.
+    Duplicates across calls are skipped. Other properties are not exported,
+    since the builders do not extract any.
+    close() writes the import command to import_command.txt.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.handles = []
+        self.nodes = self._open("nodes.csv", [":ID", "id", "norm_id", "aliases:string[]", ":LABEL"])
+        self.relationships = self._open("relationships.csv", [":START_ID", ":END_ID", ":TYPE"])
+        self.seen_nodes = set()
+        self.seen_relationships = set()
+
+    def _open(self, name, header):
+        handle = open(os.path.join(self.out_dir, name), "w", newline="", encoding="utf-8")
+        self.handles.append(handle)
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        return writer
+
+    def write(self, graph_documents):
+        nodes, relationships = group_graph_documents(graph_documents)
+        for label, rows in nodes.items():
+            for node_id, props in rows.items():
+                key = f"{label}:{node_id}"
+                if key not in self.seen_nodes:
+                    self.seen_nodes.add(key)
+                    row = node_row(node_id, props)
+                    # ";" is neo4j-admin's default array delimiter
+                    self.nodes.writerow([key, node_id, row["norm_id"], ";".join(row["aliases"]), f"{label};{ENTITY_LABEL}"])
+        for (source_label, rel_type, target_label), rows in relationships.items():
+            for source, target in rows:
+                row = (f"{source_label}:{source}", f"{target_label}:{target}", rel_type)
+                if row not in self.seen_relationships:
+                    self.seen_relationships.add(row)
+                    self.relationships.writerow(row)
+        for handle in self.handles:
+            handle.flush()
+        return {"nodes": sum(len(r) for r in nodes.values()), "relationships": sum(len(r) for r in relationships.values())}
+
+    def close(self, database="neo4j"):
+        """Returns the import command. Run it from out_dir with the database stopped; it replaces its contents."""
+        for handle in self.handles:
+            handle.close()
+        command = f"neo4j-admin database import full --nodes=nodes.csv --relationships=relationships.csv --overwrite-destination {database}"
+        with open(os.path.join(self.out_dir, "import_command.txt"), "w", encoding="utf-8") as f:
+            f.write(command + "\n")
+        return command
@@ -0,0 +1,261 @@
+"""Entity canonicalization between extraction and the graph writes.
+
+LLMGraphTransformer names one entity several ways ("GVHD", "Graft-Versus-Host
+Disease", "graft versus host disease"), and each spelling used to become its
+own node. Canonicalizer maps every spelling to one id:
+
+- norm_key() case-folds and turns punctuation into spaces, so spelling variants share a key.
+- entity_aliases.json maps abbreviations and synonyms to a canonical name. Merges
+  cannot be undone, so it only holds unambiguous ones ("MI" is also mitral
+  insufficiency, "RA" the right atrium, "CT" chemotherapy).
+- Otherwise the first spelling seen (in the graph, then in this run) is the id.
+
+Every written node carries its lowercase `norm_id` (indexed on the shared
+__Entity__ label) and the `aliases` it was seen under, so lookups are equality
+matches and the entity dictionary recognizes every alias.
+
+    python canonicalize.py --dry-run   # duplicate groups in the live graph
+    python canonicalize.py             # merge them (needs APOC) and backfill norm_id / aliases
+"""
+import argparse
+import json
+import os
+import threading
+
+from entity_dictionary import NODE_IDS_QUERY, normalize_text
+
+ALIAS_TABLE = os.getenv("MEDGRAPH_ALIAS_TABLE", "./entity_aliases.json")
+# LangChain's base entity label (add_graph_documents(baseEntityLabel=True)): one index covers every node type
+ENTITY_LABEL = "__Entity__"
+NORM_INDEX = "entity_norm_id"
+NORM_INDEX_QUERY = f"CREATE INDEX {NORM_INDEX} IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.norm_id)"
+
+EXISTING_NODES_QUERY = f"""
+MATCH (n) WHERE n.id IS NOT NULL
+RETURN elementId(n) AS eid, n.id AS id, [l IN labels(n) WHERE l <> '{ENTITY_LABEL}'] AS labels,
+       coalesce(n.aliases, []) AS aliases, COUNT {{ (n)--() }} AS degree
+"""
+
+# The first node of each group survives and mergeRels folds duplicate relationships
+# together. Relationships between two duplicates would become self-loops, so they are
+# deleted first (as canonicalize() drops them); self-loops the graph already had stay.
+MERGE_QUERY = """
+UNWIND $groups AS g
+CALL {
+    WITH g
+    UNWIND g.eids AS eid
+    MATCH (n) WHERE elementId(n) = eid
+    RETURN collect(n) AS nodes
+}
+CALL {
+    WITH nodes
+    UNWIND nodes AS a
+    MATCH (a)-[r]->(b) WHERE b <> a AND b IN nodes
+    DELETE r
+    RETURN count(r) AS collapsed
+}
+CALL apoc.refactor.mergeNodes(nodes, {properties: "discard", mergeRels: true}) YIELD node
+RETURN count(DISTINCT node) AS merged
+"""
+
+BACKFILL_QUERY = f"""
+UNWIND $nodes AS row
+MATCH (n) WHERE elementId(n) = row.eid
+SET n:{ENTITY_LABEL}, n.id = row.id, n.norm_id = row.norm_id, n.aliases = row.aliases
+"""
+
+
+def norm_key(text):
+    """The `norm_id` of a spelling: what the entity dictionary matches on, too."""
+    return normalize_text(str(text))
+
+
+def load_aliases(path=ALIAS_TABLE):
+    """{canonical: [alias, ...]} from the alias table; empty when there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ensure_norm_index(graph):
+    """Range index on __Entity__(norm_id) (idempotent)."""
+    try:
+        graph.query(NORM_INDEX_QUERY)
+        return True
+    except Exception as e:
+        print(f"⚠️  No index on {ENTITY_LABEL}(norm_id), exact lookups will scan: {e}")
+        return False
+
+
+class Canonicalizer:
+    def __init__(self, aliases=None):
+        self.lock = threading.Lock()
+        self.canonical = {}  # norm key -> canonical id
+        self.aliases = {}  # norm key of a canonical id -> spellings it was seen under
+        for canonical, names in (aliases or {}).items():
+            for name in [canonical, *names]:
+                if self.canonical.setdefault(norm_key(name), canonical) != canonical:
+                    raise ValueError(f"Alias {name!r} is claimed by both {self.canonical[norm_key(name)]!r} and {canonical!r}")
+            self.aliases[norm_key(canonical)] = {canonical, *names}
+        self.table_keys = set(self.canonical)
+
+    @classmethod
+    def from_file(cls, path=ALIAS_TABLE):
+        return cls(load_aliases(path))
+
+    def seed(self, graph):
+        """Ids already in the graph stay canonical for their key (the alias table still wins)."""
+        rows = graph.query(NODE_IDS_QUERY)
+        with self.lock:
+            for row in rows:
+                canonical = self._register(str(row["id"]))
+                if canonical is not None:
+                    self.aliases[norm_key(canonical)].update(row.get("aliases") or [])
+        return self
+
+    def _register(self, spelling):
+        """Canonical id for `spelling`, recording it as an alias (caller holds the lock)."""
+        spelling = spelling.strip()
+        key = norm_key(spelling)
+        if not key:
+            return None
+        canonical = self.canonical.setdefault(key, spelling)
+        self.aliases.setdefault(norm_key(canonical), set()).add(spelling)
+        return canonical
+
+    def table_canonical(self, text):
+        """The alias table's canonical name for `text`, if it has one."""
+        key = norm_key(text)
+        return self.canonical[key] if key in self.table_keys else None
+
+    def lookup_key(self, text):
+        """The norm_id `text` resolves to, without recording it (query time)."""
+        key = norm_key(text)
+        return norm_key(self.canonical[key]) if key in self.canonical else key
+
+    def canonicalize(self, graph_documents):
+        """Copies of `graph_documents` with canonical ids and `aliases` properties.
+
+        Spellings that merge within a document become one node; relationships
+        that collapse onto a single node ("GVHD" IS_A "Graft-Versus-Host Disease")
+        are dropped.
+        """
+        from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+        with self.lock:
+            # All spellings first, so every node of this batch carries the full alias list
+            for doc in graph_documents:
+                for node in doc.nodes:
+                    self._register(str(node.id))
+                for rel in doc.relationships:
+                    self._register(str(rel.source.id))
+                    self._register(str(rel.target.id))
+
+            result = []
+            for doc in graph_documents:
+                nodes = {}
+
+                def canonical_node(node):
+                    node_id = self.canonical.get(norm_key(node.id), str(node.id))
+                    if (node.type, node_id) not in nodes:
+                        properties = dict(node.properties or {})
+                        properties["aliases"] = sorted(self.aliases.get(norm_key(node_id), {node_id}))
+                        nodes[(node.type, node_id)] = Node(id=node_id, type=node.type, properties=properties)
+                    return nodes[(node.type, node_id)]
+
+                for node in doc.nodes:
+                    canonical_node(node)
+                relationships = []
+                for rel in doc.relationships:
+                    source, target = canonical_node(rel.source), canonical_node(rel.target)
+                    if source is not target:
+                        relationships.append(Relationship(source=source, target=target, type=rel.type, properties=rel.properties))
+                result.append(GraphDocument(nodes=list(nodes.values()), relationships=relationships, source=doc.source))
+        return result
+
+
+_lookup_canonicalizer = None
+_lookup_lock = threading.Lock()
+
+
+def lookup_canonicalizer():
+    """Alias table only, shared by the query-time lookups."""
+    global _lookup_canonicalizer
+    with _lookup_lock:
+        if _lookup_canonicalizer is None:
+            _lookup_canonicalizer = Canonicalizer.from_file()
+        return _lookup_canonicalizer
+
+
+# --- One-off job: merge the duplicates already in the graph ---
+def plan_merge(rows, canonicalizer):
+    """(groups, backfill rows). Nodes group by (label, canonical key), as MERGE on (label, id) would.
+
+    The survivor is the node already named canonically (alias table), else the
+    best connected one; its id becomes the group's id.
+    """
+    by_key = {}
+    for row in rows:
+        label = row["labels"][0] if row["labels"] else ""
+        key = canonicalizer.lookup_key(row["id"])
+        if key:
+            by_key.setdefault((label, key), []).append(row)
+
+    groups, backfill = [], []
+    for (label, key), members in by_key.items():
+        canonical = canonicalizer.table_canonical(members[0]["id"])
+        members.sort(key=lambda r: (str(r["id"]) != canonical, -r["degree"], str(r["id"])))
+        node_id = canonical or str(members[0]["id"])
+        aliases = {node_id}
+        for r in members:
+            aliases.add(str(r["id"]))
+            aliases.update(r["aliases"])
+        aliases.update(canonicalizer.aliases.get(key, ()))
+        if len(members) > 1:
+            groups.append({"label": label, "id": node_id, "eids": [r["eid"] for r in members],
+                           "merged": [str(r["id"]) for r in members[1:]]})
+        backfill.append({"eid": members[0]["eid"], "id": node_id, "norm_id": key, "aliases": sorted(aliases)})
+    return groups, backfill
+
+
+def merge_existing(graph, canonicalizer=None, dry_run=False, batch_size=100):
+    """Merges duplicate nodes in the live graph and backfills norm_id / aliases. Returns stats."""
+    canonicalizer = canonicalizer or Canonicalizer.from_file()
+    rows = graph.query(EXISTING_NODES_QUERY)
+    groups, backfill = plan_merge(rows, canonicalizer)
+    stats = {"nodes": len(rows), "groups": len(groups), "removed": sum(len(g["merged"]) for g in groups)}
+    print(f"🔎 {stats['nodes']} nodes: {stats['groups']} duplicate groups, {stats['removed']} nodes to merge away.")
+    for g in sorted(groups, key=lambda g: -len(g["merged"]))[:20]:
+        print(f"   :{g['label']} {g['id']!r} <- {g['merged']}")
+    if dry_run:
+        return stats
+
+    for start in range(0, len(groups), batch_size):
+        try:
+            graph.query(MERGE_QUERY, {"groups": groups[start:start + batch_size]})
+        except Exception as e:
+            raise RuntimeError(f"Merging needs APOC (apoc.refactor.mergeNodes): {e}") from e
+    for start in range(0, len(backfill), batch_size * 10):
+        graph.query(BACKFILL_QUERY, {"nodes": backfill[start:start + batch_size * 10]})
+    ensure_norm_index(graph)
+    print(f"✅ Merged {stats['removed']} duplicates; {len(backfill)} nodes now carry norm_id and aliases.")
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_community.graphs import Neo4jGraph
+    from data_version import bump_data_version
+
+    parser = argparse.ArgumentParser(description="Merge duplicate entities in the live graph.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the duplicate groups")
+    parser.add_argument("--aliases", default=ALIAS_TABLE, help="Alias table (JSON: {canonical: [alias, ...]})")
+    args = parser.parse_args()
+
+    load_dotenv()
+    graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"),
+                       password=os.getenv("NEO4J_PASSWORD"), refresh_schema=False)
+    stats = merge_existing(graph, Canonicalizer.from_file(args.aliases), dry_run=args.dry_run)
+    if not args.dry_run:
+        bump_data_version("duplicate entities merged")
@@ -0,0 +1,149 @@
+"""Local checkpoint store for graph ingestion, keyed by a hash of each document.
+
+Every document's extraction result (or failure) is kept in SQLite, so reruns
+skip finished work, retry failures, and can replay cached extractions into a
+wiped database without calling the LLM again.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+CHECKPOINT_PATH = os.getenv("MEDGRAPH_CHECKPOINT_PATH", "./ingestion_checkpoints.db")
+
+STATUS_EXTRACTED = "extracted"
+STATUS_FAILED = "failed"
+
+
+def _node_to_dict(node):
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+
+def _node_from_dict(data):
+    return Node(id=data["id"], type=data["type"], properties=data.get("properties") or {})
+
+
+def graph_document_to_dict(graph_doc):
+    return {
+        "nodes": [_node_to_dict(n) for n in graph_doc.nodes],
+        "relationships": [
+            {"source": _node_to_dict(r.source), "target": _node_to_dict(r.target),
+             "type": r.type, "properties": r.properties}
+            for r in graph_doc.relationships
+        ],
+        "source": {"page_content": graph_doc.source.page_content, "metadata": graph_doc.source.metadata},
+    }
+
+
+def graph_document_from_dict(data):
+    return GraphDocument(
+        nodes=[_node_from_dict(n) for n in data["nodes"]],
+        relationships=[
+            Relationship(source=_node_from_dict(r["source"]), target=_node_from_dict(r["target"]),
+                         type=r["type"], properties=r.get("properties") or {})
+            for r in data["relationships"]
+        ],
+        source=Document(**data["source"]),
+    )
+
+
+class CheckpointStore:
+    def __init__(self, path=CHECKPOINT_PATH, namespace=""):
+        # namespace = extraction config (model + schema); changing it invalidates old hashes
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                doc_key TEXT,
+                status TEXT NOT NULL,
+                written INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                graph_json TEXT,
+                error TEXT,
+                updated REAL
+            )
+        """)
+        self.conn.commit()
+
+    def doc_hash(self, text):
+        return hashlib.sha256(f"{self.namespace}\n{text}".encode("utf-8")).hexdigest()
+
+    def _status(self, doc_hash):
+        return self.conn.execute("SELECT status, written FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()
+
+    # --- Planning ---
+    def plan(self, items, rewrite=False):
+        """Splits (key, text) items into (to_replay, to_extract, skipped_count).
+
+        to_replay: already extracted but not (or no longer) in the graph.
+        to_extract: never seen, or failed last time.
+        """
+        to_replay, to_extract, skipped = [], [], 0
+        with self.lock:
+            for key, text in items:
+                row = self._status(self.doc_hash(text))
+                if row is None or row[0] == STATUS_FAILED:
+                    to_extract.append((key, text))
+                elif row[1] and not rewrite:
+                    skipped += 1
+                else:
+                    to_replay.append((key, text))
+        return to_replay, to_extract, skipped
+
+    def cached_graph_documents(self, texts):
+        with self.lock:
+            graph_docs = []
+            for text in texts:
+                row = self.conn.execute("SELECT graph_json FROM documents WHERE doc_hash = ?",
+                                        (self.doc_hash(text),)).fetchone()
+                if row and row[0]:
+                    graph_docs.extend(graph_document_from_dict(d) for d in json.loads(row[0]))
+            return graph_docs
+
+    # --- Recording ---
+    def record_extracted(self, key, text, graph_docs):
+        payload = json.dumps([graph_document_to_dict(g) for g in graph_docs])
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO documents (doc_hash, doc_key, status, written, attempts, graph_json, error, updated)
+                VALUES (?, ?, ?, 0, 1, ?, NULL, ?)
+                ON CONFLICT(doc_hash) DO UPDATE SET
+                    doc_key = excluded.doc_key, status = excluded.status, written = 0,
+                    attempts = attempts + 1, graph_json = excluded.graph_json, error = NULL, updated = excluded.updated
+            """, (self.doc_hash(text), str(key), STATUS_EXTRACTED, payload, time.time()))
+            self.conn.commit()
+
+    def record_failed(self, key, text, error):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO documents (doc_hash, doc_key, status, attempts, error, updated)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT(doc_hash) DO UPDATE SET
+                    status = excluded.status, attempts = attempts + 1, error = excluded.error, updated = excluded.updated
+            """, (self.doc_hash(text), str(key), STATUS_FAILED, str(error)[:2000], time.time()))
+            self.conn.commit()
+
+    def mark_written(self, texts):
+        with self.lock:
+            self.conn.executemany("UPDATE documents SET written = 1, updated = ? WHERE doc_hash = ?",
+                                  [(time.time(), self.doc_hash(t)) for t in texts])
+            self.conn.commit()
+
+    def reset_written(self):
+        """Call after wiping the graph: every cached extraction becomes replayable."""
+        with self.lock:
+            self.conn.execute("UPDATE documents SET written = 0")
+            self.conn.commit()
+
+    def summary(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, written, COUNT(*) FROM documents GROUP BY status, written").fetchall()
+        return {f"{status}{'_written' if written else ''}": count for status, written, count in rows}
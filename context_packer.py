@@ -0,0 +1,189 @@
+"""Token-budgeted context for the answer prompt.
+
+Retrieval returns more than the prompt should carry. Neighbouring Chroma
+chunks share 200 characters of overlap, and entities that resolve to the
+same nodes return the same triple more than once. pack_context works in
+three steps:
+
+1. Dedupe the triples, paths and sentences.
+2. Rank what is left against the question.
+3. Keep the best items until the answer model's token budget is spent.
+
+Smaller prompts mean faster generation and fewer Groq 429s.
+
+    MEDGRAPH_CONTEXT_TOKENS=1500                                # every model
+    MEDGRAPH_CONTEXT_TOKENS=llama-3.1-8b-instant=1000,2500      # per model, bare number = others
+"""
+import math
+import os
+import re
+
+from graph_lookup import format_triples
+from multi_hop import format_paths
+from telemetry import approx_tokens
+from text_tokens import WORD, terms
+
+# Context tokens per answer model (instructions and question not included). The 8B
+# model answers from less and is the one app.py streams to users on the free tier.
+MODEL_BUDGETS = {"llama-3.1-8b-instant": 1200, "llama-3.3-70b-versatile": 2500}
+DEFAULT_BUDGET = 1500
+# Share of the budget reserved for graph facts; whatever one side leaves unused goes to the other
+GRAPH_SHARE = 0.35
+NO_GRAPH_CONTEXT = "No direct graph connections found."
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def context_budget(model):
+    """Context tokens for `model`, from MEDGRAPH_CONTEXT_TOKENS when set, else MODEL_BUDGETS."""
+    configured, default = {}, None
+    for entry in filter(None, (e.strip() for e in os.getenv("MEDGRAPH_CONTEXT_TOKENS", "").split(","))):
+        name, _, value = entry.rpartition("=")
+        if name:
+            configured[name.strip()] = int(value)
+        else:
+            default = int(value)
+    if model in configured:
+        return configured[model]
+    return default if default is not None else MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+
+
+def graph_share():
+    """MEDGRAPH_GRAPH_CONTEXT_SHARE (default GRAPH_SHARE), read per call so a value from .env counts."""
+    return float(os.getenv("MEDGRAPH_GRAPH_CONTEXT_SHARE", str(GRAPH_SHARE)))
+
+
+def _normalize(text):
+    """Lowercase words, space-padded, so containment tests only match whole words."""
+    words = WORD.findall(text.lower())
+    return f" {' '.join(words)} " if words else ""
+
+
+def split_sentences(chunks):
+    """(chunk_rank, position, sentence) for every distinct sentence of the retrieved chunks.
+
+    Neighbouring chunks overlap, and the overlap is usually cut mid-sentence:
+    a chunk's first sentence may be the end of a longer one, and a last
+    sentence without a full stop the start of one. Only such fragments are
+    dropped when a kept sentence starts (or ends) with the same words, and a
+    full sentence replaces the fragments it completes. Other sentences are
+    dropped only as exact (normalized) repeats.
+    """
+    kept = []  # [rank, position, text, normalized, fragment kind]
+    for rank, chunk in enumerate(chunks):
+        parts = _SENTENCE_END.split(chunk.strip())
+        for position, sentence in enumerate(parts):
+            sentence = sentence.strip()
+            norm = _normalize(sentence)
+            if not norm:
+                continue
+            if position == len(parts) - 1 and sentence[-1] not in ".!?":
+                kind = "head"  # may be the start of a sentence the chunk cuts off
+            elif position == 0:
+                kind = "tail"  # may be the end of a sentence cut off before the chunk
+            else:
+                kind = None
+            if any(norm == k[3] or (kind == "head" and k[3].startswith(norm)) or (kind == "tail" and k[3].endswith(norm))
+                   for k in kept):
+                continue
+            covered = [i for i, k in enumerate(kept) if k[3] != norm and (
+                (k[4] == "head" and norm.startswith(k[3])) or (k[4] == "tail" and norm.endswith(k[3])))]
+            if covered:
+                # The earlier copies were fragments: the first keeps its place and takes the full text
+                kept[covered[0]][2:] = [sentence, norm, kind]
+                kept = [k for i, k in enumerate(kept) if i not in covered[1:]]
+            else:
+                kept.append([rank, position, sentence, norm, kind])
+    return [(rank, position, text) for rank, position, text, _, _ in kept]
+
+
+def dedupe_triples(triples_by_entity):
+    """Unique (source, rel, target) across entities, keeping the best score."""
+    best = {}
+    for triples in triples_by_entity.values():
+        for t in triples:
+            key = (t["source"], t["rel"], t["target"])
+            if key not in best or t.get("score", 0) > best[key].get("score", 0):
+                best[key] = t
+    return list(best.values())
+
+
+class Ranker:
+    """Scores text by the IDF-weighted question terms it contains.
+
+    IDF is taken over this request's candidates, so a term every chunk mentions
+    (usually the entity itself) counts less than the one that sets a chunk apart.
+    """
+
+    def __init__(self, question, candidates):
+        self.question = terms(question)
+        df = {}
+        for text in candidates:
+            for term in terms(text) & self.question:
+                df[term] = df.get(term, 0) + 1
+        self.idf = {t: math.log(1 + len(candidates) / df[t]) for t in df}
+
+    def score(self, text):
+        return sum(self.idf.get(t, 0.0) for t in terms(text) & self.question)
+
+
+def fill(items, budget):
+    """Greedy by score: (kept items, tokens used). Items that do not fit are skipped, smaller ones still can."""
+    kept, used = [], 0
+    for item in sorted(items, key=lambda i: i["score"], reverse=True):
+        if used + item["tokens"] <= budget:
+            kept.append(item)
+            used += item["tokens"]
+    return kept, used
+
+
+def pack_context(question, chunks, subgraph, budget):
+    """Returns (vector_context, graph_context, stats) within `budget` tokens.
+
+    `chunks` are the retrieved texts, best first; `subgraph` is the
+    {"triples", "paths"} dict the retrieval functions return.
+    """
+    sentences = split_sentences(chunks)
+    if subgraph["paths"]:
+        graph_items = [{"text": format_paths([p]), "prior": p["score"], "path": p} for p in subgraph["paths"]]
+        format_graph = lambda kept: format_paths([i["path"] for i in kept])
+    else:
+        triples = dedupe_triples(subgraph["triples"])
+        graph_items = [{"text": format_triples({"": [t]}), "prior": t.get("score", 0), "triple": t} for t in triples]
+        format_graph = lambda kept: format_triples({"": [i["triple"] for i in kept]})
+    vector_items = [
+        {"text": text, "prior": 1.0 / (1 + rank), "order": (rank, position)}
+        for rank, position, text in sentences
+    ]
+
+    ranker = Ranker(question, [i["text"] for i in vector_items + graph_items])
+    for items in (graph_items, vector_items):
+        top_prior = max((i["prior"] for i in items), default=0) or 1.0
+        for item in items:
+            # Question overlap decides; the retriever's own ranking breaks ties
+            item["score"] = ranker.score(item["text"]) + 0.5 * item["prior"] / top_prior
+            item["tokens"] = approx_tokens(item["text"]) + 1
+
+    graph_kept, graph_used = fill(graph_items, int(budget * graph_share()))
+    vector_kept, vector_used = fill(vector_items, budget - graph_used)
+    if budget - graph_used - vector_used > 0:
+        # Vector side left room: top up with the graph items that did not fit their share
+        extra, extra_used = fill([i for i in graph_items if i not in graph_kept], budget - graph_used - vector_used)
+        graph_kept, graph_used = graph_kept + extra, graph_used + extra_used
+    graph_kept.sort(key=lambda i: i["score"], reverse=True)
+
+    # Sentences go back in reading order, one line per source chunk
+    by_chunk = {}
+    for item in sorted(vector_kept, key=lambda i: i["order"]):
+        by_chunk.setdefault(item["order"][0], []).append(item["text"])
+    vector_context = "\n".join(" ".join(parts) for parts in by_chunk.values())
+
+    stats = {
+        "budget": budget,
+        "tokens": graph_used + vector_used,
+        "sentences": f"{len(vector_kept)}/{len(vector_items)}",
+        "graph_items": f"{len(graph_kept)}/{len(graph_items)}",
+        # What the prompt would have carried unpacked
+        "raw_tokens": approx_tokens("\n".join(chunks)) + approx_tokens(format_paths(subgraph["paths"]) or format_triples(subgraph["triples"])),
+    }
+    return vector_context, format_graph(graph_kept) if graph_kept else NO_GRAPH_CONTEXT, stats
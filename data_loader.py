@@ -1,22 +1,53 @@
+from itertools import islice
 from datasets import load_dataset
-import pandas as pd
 
-def load_medical_data():
+# "pqa_labeled" is the 1k expert-annotated set; the other two are much larger (211k / 61k)
+SUBSETS = ("pqa_labeled", "pqa_artificial", "pqa_unlabeled")
+
+COLUMNS = ["pubid", "question", "context", "long_answer"]
+
+def format_record(question, contexts, long_answer):
+    # We combine the context (abstract) with the question context
+    context = " ".join(contexts)
+    return f"Question: {question}\nAbstract: {context}\nAnswer: {long_answer}"
+
+def iter_medical_records(subset="pqa_labeled", num_shards=1, shard_index=0, offset=0, limit=None, batch_size=256):
+    """Yields (record_id, text) pairs without materializing the corpus.
+
+    The dataset stays in its memory-mapped Arrow cache; only `batch_size` rows are
+    converted to Python objects at a time. Record ids are "<subset>:<pubid>", so
+    they are stable across runs, shards and offsets.
+    """
+    if subset not in SUBSETS:
+        raise ValueError(f"Unknown PubMedQA subset '{subset}'. Choose one of {SUBSETS}.")
+    dataset = load_dataset("pubmed_qa", subset, split="train").select_columns(COLUMNS)
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards=num_shards, index=shard_index, contiguous=True)
+
+    end = len(dataset) if limit is None else min(len(dataset), offset + limit)
+    if offset >= end:
+        return
+    # A contiguous range is a zero-copy slice of the Arrow table
+    dataset = dataset.select(range(offset, end))
+
+    for batch in dataset.iter(batch_size=batch_size):
+        for pubid, question, context, long_answer in zip(batch["pubid"], batch["question"], batch["context"], batch["long_answer"]):
+            yield f"{subset}:{pubid}", format_record(question, context["contexts"], long_answer)
+
+def iter_batches(records, size):
+    """Groups any iterable into lists of at most `size` items."""
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+def load_medical_data(subset="pqa_labeled", limit=None):
     print("Loading PubMedQA dataset from HuggingFace...")
-    # Loading the "pqa_labeled" subset (expert annotated)
-    dataset = load_dataset("pubmed_qa", "pqa_labeled", split="train")
-    
-    # Convert to a simpler format for us to use
-    documents = []
-    for item in dataset:
-        # We combine the context (abstract) with the question context
-        context = " ".join(item['context']['contexts'])
-        combined_text = f"Question: {item['question']}\nAbstract: {context}\nAnswer: {item['long_answer']}"
-        documents.append(combined_text)
-    
+    # Kept for callers that want a plain list of texts; prefer iter_medical_records for big subsets
+    documents = [text for _, text in iter_medical_records(subset, limit=limit)]
+
     print(f"Successfully loaded {len(documents)} medical research records.")
     return documents
 
 if __name__ == "__main__":
-    docs = load_medical_data()
-    print("Sample Document:\n", docs[0][:500], "...")
\ No newline at end of file
+    record_id, text = next(iter_medical_records(limit=1))
+    print(f"Sample Document ({record_id}):\n", text[:500], "...")
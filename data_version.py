@@ -0,0 +1,37 @@
+"""Marker file the builders bump after rebuilding Neo4j or Chroma.
+
+Anything derived from the stored data (answer cache, entity dictionary, ...)
+records the version it was built against and refreshes when it changes.
+"""
+import os
+import time
+import uuid
+
+DEFAULT_DATA_VERSION_FILE = "./.medgraph_data_version"
+
+
+def data_version_file():
+    """MEDGRAPH_DATA_VERSION_FILE, read per call: entry points load .env after importing this."""
+    return os.getenv("MEDGRAPH_DATA_VERSION_FILE", DEFAULT_DATA_VERSION_FILE)
+
+
+def current_data_version():
+    """Returns the current version string ("" if nothing was ever built)."""
+    try:
+        with open(data_version_file(), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_data_version(reason=""):
+    """Marks the graph / vector store as changed. Call after every rebuild."""
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    path = data_version_file()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    if reason:
+        print(f"🔄 Data version bumped ({reason}): {version}")
+    return version
@@ -0,0 +1,249 @@
+"""Persistent embedding cache shared by index builds and query time.
+
+Vectors live in one memory-mapped float32 matrix per model, with an
+append-only index file mapping sha256(model + text) -> row. Several processes
+(Streamlit, evaluation, index builds) can share it: writes take a file lock
+and readers pick up rows appended by others. Queries read the store but are
+only cached in memory (bounded), so user questions never grow the file.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch" (sentence-transformers via langchain_huggingface) or "onnx" (int8, onnx_embeddings.py)
+BACKENDS = ("torch", "onnx")
+# Query vectors kept in memory per process (they are never written to the store)
+QUERY_CACHE_SIZE = 1024
+
+
+# The MEDGRAPH_* settings are read when used: entry points call load_dotenv() after importing this
+def embedding_backend():
+    """MEDGRAPH_EMBEDDING_BACKEND (default "torch")."""
+    return os.getenv("MEDGRAPH_EMBEDDING_BACKEND", "torch")
+
+
+def embedding_cache_dir():
+    """MEDGRAPH_EMBEDDING_CACHE (default ./embedding_cache)."""
+    return os.getenv("MEDGRAPH_EMBEDDING_CACHE", "./embedding_cache")
+
+
+def text_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` across processes (flock, or msvcrt on Windows)."""
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # itself retries for ~10s
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingStore:
+    def __init__(self, model_name, cache_dir=None):
+        self.model_name = model_name
+        self.dir = os.path.join(cache_dir or embedding_cache_dir(), re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.index_path = os.path.join(self.dir, "index.tsv")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self.lock = threading.Lock()
+        self.rows = {}  # key -> row
+        self.index_offset = 0  # bytes of index.tsv already read
+        self.dim = None
+        self.vectors = None
+        self._load_meta()
+        self._sync()
+
+    # --- File helpers ---
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _sync(self):
+        """Reads index lines appended since the last sync (possibly by another process)."""
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == self.index_offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_offset)
+            data = f.read()
+        complete = data[: data.rfind(b"\n") + 1]  # ignore a half-written last line
+        for line in complete.decode("utf-8").splitlines():
+            key, row = line.split("\t")
+            self.rows[key] = int(row)
+        self.index_offset += len(complete)
+        if self.dim is None:
+            self._load_meta()
+
+    def _map(self, min_rows=0):
+        """(Re)maps the vector file, growing it to hold at least min_rows."""
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if min_rows * row_bytes > size:
+            size = max(min_rows, 2 * (size // row_bytes), 1024) * row_bytes
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(size)
+        if self.vectors is None or self.vectors.shape[0] * row_bytes != size:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(size // row_bytes, self.dim))
+
+    # --- Public API ---
+    def get_many(self, texts):
+        """Returns a list aligned with texts: cached vector (np.ndarray) or None."""
+        keys = [text_key(self.model_name, t) for t in texts]
+        with self.lock:
+            if any(k not in self.rows for k in keys):
+                self._sync()
+            if self.dim is None:
+                return [None] * len(texts)
+            max_row = max((self.rows[k] for k in keys if k in self.rows), default=-1)
+            if max_row >= 0 and (self.vectors is None or max_row >= self.vectors.shape[0]):
+                self._map()
+            return [np.array(self.vectors[self.rows[k]]) if k in self.rows else None for k in keys]
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock, file_lock(self.lock_path):
+            self._sync()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = text_key(self.model_name, text)
+                if key not in self.rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            first_row = len(self.rows)
+            self._map(first_row + len(new))
+            self.vectors[first_row : first_row + len(new)] = np.stack(list(new.values()))
+            self.vectors.flush()
+            # Index lines go last: a row is only visible once its vector is on disk
+            lines = "".join(f"{key}\t{first_row + i}\n" for i, key in enumerate(new))
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._sync()
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in for HuggingFaceEmbeddings that only computes vectors it has never seen.
+
+    The wrapped model is built lazily, so a fully cached workload never loads it.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, model_factory=None, cache_dir=None):
+        self.model_name = model_name
+        self.model_factory = model_factory or (lambda: _huggingface(model_name))
+        self.store = EmbeddingStore(model_name, cache_dir)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.queries = OrderedDict()  # text -> vector, least recently used first
+        self.query_cache_size = int(os.getenv("MEDGRAPH_QUERY_EMBEDDING_CACHE", str(QUERY_CACHE_SIZE)))
+        self._queries_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = self.model_factory()
+            return self._model
+
+    def embed_documents(self, texts):
+        cached = self.store.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = self.model.embed_documents(missing)
+            self.store.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            cached = [v if v is not None else np.asarray(by_text[t], dtype=np.float32) for t, v in zip(texts, cached)]
+        # Always hand out the stored float32 values, so hits and misses are identical
+        return [v.tolist() for v in cached]
+
+    def embed_query(self, text):
+        """Served from memory or the store; computed vectors stay in memory only (no file lock per question)."""
+        with self._queries_lock:
+            if text in self.queries:
+                self.queries.move_to_end(text)
+                self.hits += 1
+                return self.queries[text]
+        # MiniLM embeds queries and documents the same way, so a stored chunk vector is reused
+        cached = self.store.get_many([text])[0]
+        if cached is not None:
+            self.hits += 1
+            vector = cached.tolist()
+        else:
+            self.misses += 1
+            vector = np.asarray(self.model.embed_query(text), dtype=np.float32).tolist()
+        with self._queries_lock:
+            self.queries[text] = vector
+            while len(self.queries) > self.query_cache_size:
+                self.queries.popitem(last=False)
+        return vector
+
+
+def _huggingface(model_name):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def load_model(model_name=MODEL_NAME, backend=None, **onnx_options):
+    """The uncached embedding model for `backend`. onnx_options go to OnnxEmbeddings."""
+    backend = backend or embedding_backend()
+    if backend == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings.from_model_name(model_name, **onnx_options)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend {backend!r} (choose from {', '.join(BACKENDS)})")
+    return _huggingface(model_name)
+
+
+def cache_name(model_name=MODEL_NAME, backend=None):
+    """Cache namespace: int8 vectors differ slightly from the PyTorch ones, so the two never share entries."""
+    backend = backend or embedding_backend()
+    return model_name if backend == "torch" else f"{model_name}@{backend}-int8"
+
+
+def get_embedding_function(model_name=MODEL_NAME, backend=None):
+    """The embedding function every entry point should use (Chroma, answer cache, index builds)."""
+    backend = backend or embedding_backend()
+    return CachedEmbeddings(cache_name(model_name, backend), lambda: load_model(model_name, backend))
@@ -0,0 +1,148 @@
+"""In-process entity extractor built from the node ids stored in Neo4j.
+
+Replaces the per-question LLM extraction call: every node id becomes a pattern
+in an Aho-Corasick automaton, so a question is scanned once regardless of how
+many ids the graph holds.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+from data_version import current_data_version
+
+NODE_IDS_QUERY = "MATCH (n) WHERE n.id IS NOT NULL RETURN DISTINCT n.id AS id, coalesce(n.aliases, []) AS aliases"
+
+# Ids shorter than this ("T", "Hb") match inside too many questions to be useful
+MIN_PATTERN_LENGTH = 3
+
+
+def normalize_text(text):
+    """Case-folds, strips possessives (like graph_lookup.clean_entity) and turns punctuation into spaces."""
+    text = text.casefold().replace("'s", "").replace("’s", "")
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: goto/fail/output tables over characters."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # state -> lengths of the patterns ending here
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append(len(pattern))
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yields (start, end) for every pattern occurrence, overlaps included."""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length in self.out[state]:
+                yield i + 1 - length, i + 1
+
+
+class EntityDictionary:
+    def __init__(self, graph, refresh_seconds=600):
+        self.graph = graph
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.automaton = None
+        self.ids_by_pattern = {}
+        self.data_version = None
+        self.loaded_at = 0.0
+
+    def refresh(self):
+        """Reloads node ids from Neo4j and rebuilds the automaton."""
+        version = current_data_version()
+        rows = self.graph.query(NODE_IDS_QUERY)
+        ids_by_pattern = {}
+        for row in rows:
+            node_id = str(row["id"])
+            # Aliases recorded by canonicalize.py ("GVHD") point at the canonical node
+            for name in [node_id, *(row.get("aliases") or [])]:
+                pattern = normalize_text(str(name))
+                if len(pattern) >= MIN_PATTERN_LENGTH and node_id not in ids_by_pattern.get(pattern, []):
+                    ids_by_pattern.setdefault(pattern, []).append(node_id)
+        automaton = AhoCorasick(ids_by_pattern)
+        with self.lock:
+            self.automaton = automaton
+            self.ids_by_pattern = ids_by_pattern
+            self.data_version = version
+            self.loaded_at = time.time()
+        print(f"📖 Entity dictionary loaded: {len(ids_by_pattern)} patterns.")
+
+    def _needs_refresh(self):
+        stale = time.time() - self.loaded_at > self.refresh_seconds
+        return self.automaton is None or stale or current_data_version() != self.data_version
+
+    def _maybe_refresh(self):
+        if not self._needs_refresh():
+            return
+        with self.refresh_lock:
+            if not self._needs_refresh():
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the old dictionary (or none); retry after refresh_seconds
+                print(f"⚠️  Entity dictionary refresh failed: {e}")
+                self.loaded_at = time.time()
+                self.data_version = current_data_version()
+
+    def extract(self, question):
+        """Returns node ids mentioned in the question, keeping the longest match where matches overlap."""
+        self._maybe_refresh()
+        with self.lock:
+            automaton, ids_by_pattern = self.automaton, self.ids_by_pattern
+        if automaton is None:
+            return []
+        text = normalize_text(question)
+
+        # Only keep matches that start and end on word boundaries
+        matches = []
+        for start, end in automaton.iter_matches(text):
+            if (start == 0 or text[start - 1] == " ") and (end == len(text) or text[end] == " "):
+                matches.append((start, end))
+
+        # Leftmost-longest: "graft versus host disease" wins over "host disease"
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        entities = []
+        last_end = -1
+        for start, end in matches:
+            if start < last_end:
+                continue
+            last_end = end
+            for node_id in ids_by_pattern[text[start:end]]:
+                if node_id not in entities:
+                    entities.append(node_id)
+        return entities
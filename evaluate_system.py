@@ -1,102 +1,192 @@
 import pandas as pd
+import argparse
+import json
+import re
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from ingestion_engine import RateLimiter, estimate_tokens
 # Import your actual system
-from hybrid_rag import hybrid_search 
+from hybrid_rag import hybrid_search
 
 load_dotenv()
 
 # Judge needs to be smart, so we use the 70b model (or 8b if you hit limits)
 judge_llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
 
-# --- EXPANDED DATASET (10 Questions) ---
-test_dataset = [
-    # Original 5 (To verify consistency)
-    {"question": "What treatments are associated with Hirschsprung Disease?", "ground_truth": "Transanal Endorectal Pull-Through and Transabdominal Pull-Through."},
-    {"question": "What condition is Transanal Endorectal Pull-Through used for?", "ground_truth": "Hirschsprung Disease."},
-    {"question": "Does Aquagenic Urticaria affect infants?", "ground_truth": "Yes, it can manifest as a pediatric form."},
-    {"question": "What are the treatments for hypertension?", "ground_truth": "Lifestyle changes, beta-blockers (propranolol), diuretics."},
-    {"question": "What is the connection between Landolt C and Strabismus?", "ground_truth": "Landolt C is associated with Strabismus Amblyopia measurement."},
-    
-    # New 5 (To test the "Scaled" Graph)
-    {"question": "What drugs are used to treat Graft-Versus-Host Disease (GVHD)?", "ground_truth": "Cyclosporine and Chloroquine."},
-    {"question": "Is there a link between obesity and insulin resistance?", "ground_truth": "Yes, obesity is often associated with insulin resistance and diabetes."},
-    {"question": "What are the potential side effects of statins?", "ground_truth": "Muscle pain, increased risk of diabetes, liver damage."},
-    {"question": "Does asthma cause systemic inflammation?", "ground_truth": "Yes, asthma is associated with systemic inflammation and increased CRP levels."},
-    {"question": "What is the relationship between Helicobacter pylori and gastric cancer?", "ground_truth": "H. pylori infection is a major cause/risk factor for gastric cancer."}
-]
-
-def calculate_score(question, generated_answer, ground_truth):
-    grading_template = """
+# Questions + ground truths live in a file so the set can grow past a handful
+DATASET_PATH = "evaluation_dataset.json"
+RESULTS_PREFIX = "research_results_scaled"
+STAGES = ["extraction", "vector", "graph", "packing", "generation", "judging"]
+PERCENTILES = [50, 95, 99]
+
+grading_template = """
     You are an academic grader. Compare the ACTUAL ANSWER with the GROUND TRUTH.
-    
+
     Question: {question}
     Ground Truth: {ground_truth}
     Actual Answer: {generated_answer}
-    
+
     Criteria:
     - 5: Perfect fact retrieval + correct reasoning.
     - 3: Partially correct but missed key link.
     - 1: Wrong or Hallucinated.
-    
-    Output ONLY the integer score (1-5).
+
+    Reply with ONLY "Score: " followed by the integer score (1-5).
     """
-    prompt = ChatPromptTemplate.from_template(grading_template)
-    grader = prompt | judge_llm | StrOutputParser()
-    
-    try:
-        score = grader.invoke({
-            "question": question, 
-            "ground_truth": ground_truth, 
+grader = ChatPromptTemplate.from_template(grading_template) | judge_llm | StrOutputParser()
+
+def load_dataset(path=DATASET_PATH):
+    """Reads [{"question", "ground_truth"}, ...] from .json, .jsonl or .csv."""
+    if path.endswith(".csv"):
+        rows = pd.read_csv(path).to_dict("records")
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+
+    for i, row in enumerate(rows):
+        if not row.get("question") or not row.get("ground_truth"):
+            raise ValueError(f"{path}: row {i} needs both 'question' and 'ground_truth'")
+    return rows
+
+def parse_score(raw):
+    """The 1-5 after "Score", or a reply that starts with one; else None.
+
+    Other digits (and "1-5" ranges) are ignored, so "On a scale of 1-5
+    I'd give 4" is None (and retried), not 1.
+    """
+    raw = re.sub(r"\b[1-5]\s*-\s*[1-5]\b", " ", raw)
+    match = (re.search(r"\bscore\W*([1-5])\b", raw, re.IGNORECASE)
+             or re.match(r"\s*([1-5])\b", raw))
+    return int(match.group(1)) if match else None
+
+def calculate_score(question, generated_answer, ground_truth, attempts=2):
+    """The judge's 1-5 score. Raises ValueError if no reply contains a usable score."""
+    raw = ""
+    for _ in range(attempts):
+        raw = grader.invoke({
+            "question": question,
+            "ground_truth": ground_truth,
             "generated_answer": generated_answer
         })
-        return int(score.strip())
-    except:
-        return 3 # Neutral default
+        score = parse_score(raw)
+        if score is not None:
+            return score
+    raise ValueError(f"Unparseable judge reply: {raw[:80]!r}")
 
-def run_evaluation():
+def evaluate_one(item, limiter, use_cache):
+    timings = {}
+    row = {"Question": item['question'], "Ground Truth": item['ground_truth']}
+
+    # Extraction + generation: up to two Groq calls
+    limiter.acquire(2, 2 * estimate_tokens(item['question']))
+    start_time = time.perf_counter()
+    try:
+        # The System Answer
+        generated_answer = hybrid_search(item['question'], use_cache=use_cache, timings=timings)
+        row["Error"] = ""
+    except Exception as e:
+        generated_answer = f"ERROR: {str(e)}"
+        row["Error"] = str(e)
+    row["Latency"] = time.perf_counter() - start_time
+
+    # The Judge's Score (None when the judge failed; never a made-up default)
+    limiter.acquire(1, estimate_tokens(item['question'] + item['ground_truth'] + generated_answer))
+    start_time = time.perf_counter()
+    try:
+        row["Score"] = calculate_score(item['question'], generated_answer, item['ground_truth'])
+        row["Judge Error"] = ""
+    except Exception as e:
+        row["Score"] = None
+        row["Judge Error"] = str(e)
+    timings["judging"] = time.perf_counter() - start_time
+
+    row["Generated Answer"] = generated_answer
+    for stage in STAGES:
+        row[f"{stage}_s"] = round(timings[stage], 3) if stage in timings else None
+    row["Latency"] = round(row["Latency"], 3)
+    return row
+
+def summarize(df, wall_time):
+    scored = df["Score"].dropna()
+    summary = {
+        "questions": len(df),
+        "scored": len(scored),
+        "unscored": int(df["Score"].isna().sum()),
+        "pipeline_errors": int((df["Error"] != "").sum()),
+        "avg_score": round(float(scored.mean()), 3) if len(scored) else None,
+        "wall_time_s": round(wall_time, 2),
+        "throughput_qpm": round(len(df) / wall_time * 60, 2) if wall_time else 0.0,
+        "latency_s": {},
+    }
+    for column in ["Latency"] + [f"{stage}_s" for stage in STAGES]:
+        values = df[column].dropna()
+        if len(values):
+            name = "total" if column == "Latency" else column[:-2]
+            summary["latency_s"][name] = {f"p{p}": round(float(values.quantile(p / 100)), 3) for p in PERCENTILES}
+    return summary
+
+def run_evaluation(dataset_path=DATASET_PATH, concurrency=4, requests_per_minute=30, tokens_per_minute=12000,
+                   use_cache=False, output_prefix=RESULTS_PREFIX):
+    test_dataset = load_dataset(dataset_path)
+    # Every Groq call (pipeline and judge) draws from the same quota
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    print_lock = threading.Lock()
     results = []
-    print(f"Starting Evaluation on {len(test_dataset)} questions...")
-    
-    for i, item in enumerate(test_dataset):
-        print(f"\nRunning Q{i+1}: {item['question']}")
-        
-        start_time = time.time()
-        try:
-            # The System Answer
-            generated_answer = hybrid_search(item['question'])
-        except Exception as e:
-            generated_answer = f"ERROR: {str(e)}"
-        
-        latency = time.time() - start_time
-        
-        # The Judge's Score
-        score = calculate_score(item['question'], generated_answer, item['ground_truth'])
-        
-        print(f"   -> Score: {score}/5 | Time: {latency:.2f}s")
-        
-        results.append({
-            "Question": item['question'],
-            "Ground Truth": item['ground_truth'],
-            "Generated Answer": generated_answer,
-            "Score": score,
-            "Latency": round(latency, 2)
-        })
-        
-    # --- SAVE TO NEW CSV ---
-    filename = "research_results_scaled.csv"
-    df = pd.DataFrame(results)
-    df.to_csv(filename, index=False)
-    
+    print(f"Starting Evaluation on {len(test_dataset)} questions (concurrency {concurrency})...")
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="eval") as pool:
+        futures = {pool.submit(evaluate_one, item, limiter, use_cache): i for i, item in enumerate(test_dataset)}
+        for future in as_completed(futures):
+            row = future.result()
+            row["Index"] = futures[future]
+            results.append(row)
+            with print_lock:
+                score = row["Score"] if row["Score"] is not None else "n/a"
+                print(f"   Q{row['Index'] + 1} -> Score: {score}/5 | Time: {row['Latency']:.2f}s | {row['Question'][:60]}")
+    wall_time = time.perf_counter() - wall_start
+
+    # --- SAVE CSV + JSON ---
+    df = pd.DataFrame(sorted(results, key=lambda r: r["Index"]))
+    summary = summarize(df, wall_time)
+    csv_path = f"{output_prefix}.csv"
+    json_path = f"{output_prefix}.json"
+    df.to_csv(csv_path, index=False)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "dataset": dataset_path,
+            "config": {"concurrency": concurrency, "requests_per_minute": requests_per_minute,
+                       "tokens_per_minute": tokens_per_minute, "use_cache": use_cache},
+            "summary": summary,
+            "results": json.loads(df.to_json(orient="records")),
+        }, f, indent=2)
+
     print("\n" + "="*30)
     print("SCALED EVALUATION COMPLETE")
-    print(f"Avg Score: {df['Score'].mean()}/5")
-    print(f"Results saved to: {filename}")
+    print(f"Avg Score: {summary['avg_score']}/5 ({summary['unscored']} unscored, {summary['pipeline_errors']} pipeline errors)")
+    print(f"Throughput: {summary['throughput_qpm']} questions/min over {summary['wall_time_s']}s")
+    for stage, stats in summary["latency_s"].items():
+        print(f"   {stage:<10} " + " | ".join(f"{k}: {v:.2f}s" for k, v in stats.items()))
+    print(f"Results saved to: {csv_path}, {json_path}")
     print("="*30)
+    return summary
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Score hybrid_search answers against a ground-truth dataset.")
+    parser.add_argument("--dataset", default=DATASET_PATH, help=".json, .jsonl or .csv with question + ground_truth")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight at once")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("GROQ_RPM", "30")), help="Groq requests per minute (pipeline + judge)")
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("GROQ_TPM", "12000")), help="Groq tokens per minute")
+    parser.add_argument("--use-cache", action="store_true", help="Allow answers from the semantic cache")
+    parser.add_argument("--output", default=RESULTS_PREFIX, help="Output path prefix (.csv and .json are written)")
+    args = parser.parse_args()
+    run_evaluation(args.dataset, args.concurrency, args.rpm, args.tpm, args.use_cache, args.output)
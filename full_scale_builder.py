@@ -1,20 +1,34 @@
 import os
-import time
-import re
+import argparse
 from dotenv import load_dotenv
 from langchain_community.graphs import Neo4jGraph
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_groq import ChatGroq
-from langchain_core.documents import Document
-from data_loader import load_medical_data
+from data_loader import iter_medical_records, iter_batches, SUBSETS
+from ingestion_engine import IngestionEngine, FatalIngestionError
+from checkpoint_store import CheckpointStore, CHECKPOINT_PATH
+from data_version import bump_data_version
+from bulk_writer import BulkWriter, CsvExporter
+from canonicalize import Canonicalizer
+from telemetry import span, exporters_from_env
 
 # Load secrets
 load_dotenv()
+exporters_from_env()
 
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 
+# Groq quotas for llama-3.3-70b-versatile (free tier defaults; raise for paid plans)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))
+# Rows per UNWIND transaction for graph writes
+WRITE_TX_SIZE = int(os.getenv("MEDGRAPH_WRITE_TX_SIZE", "1000"))
+
+ALLOWED_NODES = ["Disease", "Drug", "Symptom", "Anatomy", "Test", "Treatment"]
+ALLOWED_RELATIONSHIPS = ["CAUSES", "TREATS", "ASSOCIATED_WITH", "AFFECTS", "PREVENTS", "IS_A"]
+
 if not NEO4J_PASSWORD:
     raise ValueError("❌ NEO4J_PASSWORD not found in .env")
 
@@ -31,8 +45,14 @@ except Exception as e:
 
 llm_transformer = LLMGraphTransformer(
     llm=llm,
-    allowed_nodes=["Disease", "Drug", "Symptom", "Anatomy", "Test", "Treatment"],
-    allowed_relationships=["CAUSES", "TREATS", "ASSOCIATED_WITH", "AFFECTS", "PREVENTS", "IS_A"]
+    allowed_nodes=ALLOWED_NODES,
+    allowed_relationships=ALLOWED_RELATIONSHIPS
+)
+
+# Extractions are cached per document hash; the namespace ties them to this model + schema
+checkpoint = CheckpointStore(
+    CHECKPOINT_PATH,
+    namespace=f"llama-3.3-70b-versatile|{','.join(ALLOWED_NODES)}|{','.join(ALLOWED_RELATIONSHIPS)}"
 )
 
 def clear_database():
@@ -40,58 +60,88 @@ def clear_database():
     print("\n⚠️  WARNING: Wiping existing Graph Database...")
     try:
         graph.query("MATCH (n) DETACH DELETE n")
-        print("✅ Database Cleared. Starting fresh.")
+        checkpoint.reset_written()
+        print("✅ Database Cleared. Cached extractions will be replayed.")
     except Exception as e:
         print(f"❌ Error clearing DB: {e}")
 
-def extract_wait_time(error_message):
-    msg = str(error_message)
-    match_min = re.search(r"try again in (\d+)m(\d+)", msg)
-    match_sec = re.search(r"try again in (\d+\.?\d*)s", msg)
+def plan_records(records, engine, window=200, rewrite=False):
+    """Streams records through the checkpoint store, one window at a time.
     
-    if match_min:
-        return (int(match_min.group(1)) * 60) + int(match_min.group(2)) + 5
-    if match_sec:
-        return float(match_sec.group(1)) + 5
-    return 30 
+    Finished docs are skipped (replayed too with rewrite=True), cached extractions
+    are handed straight to the graph writer, and only new / previously failed
+    docs are yielded to the LLM workers.
+    """
+    done = replayed = 0
+    for chunk in iter_batches(records, window):
+        to_replay, to_extract, skipped = checkpoint.plan(chunk, rewrite=rewrite)
+        done += skipped
+        for batch in iter_batches(to_replay, 20):
+            engine.enqueue_write(batch, checkpoint.cached_graph_documents([text for _, text in batch]))
+            replayed += len(batch)
+        yield from to_extract
+    print(f"Checkpoint: {done} already done, {replayed} replayed from cache.")
 
-def process_in_batches(docs, start_index=0, limit=50, batch_size=1):
-    # CRITICAL: Batch size 1 prevents hitting TPM (Tokens Per Minute) limits
-    target_docs = docs[start_index : limit]
-    print(f"\n--- FRESH INGESTION: Processing Docs {start_index} to {limit} ---")
+def process_in_batches(records, batch_size=4, workers=4, export_dir=None):
+    """Ingests (record_id, text) pairs with a worker pool under Groq's RPM/TPM quotas.
     
-    for i in range(0, len(target_docs), batch_size):
-        current_idx = start_index + i
-        batch = target_docs[i : i + batch_size]
-        print(f"Processing Batch {(i // batch_size) + 1} (Doc {current_idx})...")
-        
-        success = False
-        while not success:
-            try:
-                lc_docs = [Document(page_content=d) for d in batch]
-                graph_docs = llm_transformer.convert_to_graph_documents(lc_docs)
-                graph.add_graph_documents(graph_docs)
-                print(f"   > ✅ Success! Graph Updated.")
-                success = True
-            except Exception as e:
-                error_str = str(e)
-                if "429" in error_str:
-                    wait = extract_wait_time(error_str)
-                    print(f"   > ⏳ Quota Limit. Sleeping {wait:.0f}s...")
-                    time.sleep(wait)
-                elif "model_decommissioned" in error_str:
-                     print("   > ❌ Critical: Model Decommissioned. Groq changed models again.")
-                     exit()
-                else:
-                    print(f"   > ❌ Error: {e}")
-                    success = True # Skip bad batches
-        
-        # Polite pause to cool down rate limiter
-        time.sleep(1)
+    `records` can be any iterable (e.g. data_loader.iter_medical_records), so
+    memory stays bounded whatever the corpus size. With `export_dir`, every
+    document (cached ones included) goes to CSV files for neo4j-admin import
+    instead of to Neo4j.
+    """
+    print(f"\n--- INGESTION: {workers} workers ---")
+    
+    writer = CsvExporter(export_dir) if export_dir else BulkWriter(graph, ALLOWED_NODES, tx_size=WRITE_TX_SIZE)
+    # Spellings of one entity become one node; ids already in the graph keep their spelling
+    canonicalizer = Canonicalizer.from_file()
+    if not export_dir:
+        canonicalizer.seed(graph)
+    engine = IngestionEngine(
+        extract_fn=llm_transformer.convert_to_graph_documents,
+        write_fn=lambda graph_documents: writer.write(canonicalizer.canonicalize(graph_documents)),
+        requests_per_minute=GROQ_RPM,
+        tokens_per_minute=GROQ_TPM,
+        workers=workers,
+        max_batch_size=batch_size,
+        checkpoint=checkpoint,
+        # Exported documents only reach Neo4j once someone runs the import
+        mark_written=not export_dir,
+    )
+    try:
+        # Per-batch extract/write spans are their own traces (they run on worker threads)
+        with span("ingestion", workers=workers, batch_size=batch_size) as s:
+            stats = engine.run(plan_records(records, engine, rewrite=bool(export_dir)))
+            s.set(extracted=stats["extracted"], written=stats["written"], failed=len(stats["failed"]), retries=stats["retries"])
+    except FatalIngestionError as e:
+        print(f"   > ❌ Critical: {e}")
+        exit()
+    
+    if stats["failed"]:
+        print(f"⚠️  {len(stats['failed'])} docs failed after retries: {stats['failed']}")
+    if export_dir:
+        print(f"📦 CSV files in {export_dir}. Stop Neo4j, then run from that directory:\n   {writer.close()}")
+    return stats
 
 if __name__ == "__main__":
-    all_docs = load_medical_data()
-    # 1. Clear Data
-    clear_database()
-    # 2. Run 50 docs slowly
-    process_in_batches(all_docs, start_index=0, limit=50, batch_size=1)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the MedGraph knowledge graph.")
+    parser.add_argument("--fresh", action="store_true", help="Wipe Neo4j first (cached extractions are replayed, not re-extracted)")
+    parser.add_argument("--subset", default="pqa_labeled", choices=SUBSETS)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--num-shards", type=int, default=1)
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--export-csv", metavar="DIR", help="Write neo4j-admin import CSVs for a full rebuild instead of writing to Neo4j")
+    args = parser.parse_args()
+    
+    records = iter_medical_records(args.subset, num_shards=args.num_shards, shard_index=args.shard_index,
+                                   offset=args.offset, limit=args.limit)
+    # 1. Clear Data (only when asked; reruns resume from the checkpoint store)
+    if args.fresh and not args.export_csv:
+        clear_database()
+    # 2. Stream the selected records through the rate-limited worker pool
+    process_in_batches(records, export_dir=args.export_csv)
+    print(f"Checkpoint summary: {checkpoint.summary()}")
+    if not args.export_csv:
+        # An export changes nothing until it is imported
+        bump_data_version("knowledge graph rebuilt")
@@ -4,7 +4,11 @@ from langchain_community.graphs import Neo4jGraph
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_groq import ChatGroq
 from langchain_core.documents import Document
-from data_loader import load_medical_data
+from data_loader import iter_medical_records
+from data_version import bump_data_version
+from checkpoint_store import CheckpointStore, CHECKPOINT_PATH
+from bulk_writer import BulkWriter
+from canonicalize import Canonicalizer
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,32 +35,52 @@ graph = Neo4jGraph(
 llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
 
 # 3. Initialize the Graph Transformer
+ALLOWED_NODES = ["Disease", "Drug", "Symptom", "Anatomy", "Test"]
+ALLOWED_RELATIONSHIPS = ["CAUSES", "TREATS", "ASSOCIATED_WITH", "AFFECTS", "PREVENTS"]
+
 llm_transformer = LLMGraphTransformer(
     llm=llm,
-    allowed_nodes=["Disease", "Drug", "Symptom", "Anatomy", "Test"],
-    allowed_relationships=["CAUSES", "TREATS", "ASSOCIATED_WITH", "AFFECTS", "PREVENTS"]
+    allowed_nodes=ALLOWED_NODES,
+    allowed_relationships=ALLOWED_RELATIONSHIPS
+)
+
+# 4. Checkpoints: documents extracted on a previous run are not sent to the LLM again
+checkpoint = CheckpointStore(
+    CHECKPOINT_PATH,
+    namespace=f"llama-3.3-70b-versatile|{','.join(ALLOWED_NODES)}|{','.join(ALLOWED_RELATIONSHIPS)}"
 )
 
 def build_knowledge_graph():
-    # Load raw text
-    raw_docs = load_medical_data()
+    # Stream just 50 documents for the demo run (nothing else is loaded into memory)
+    records = list(iter_medical_records(limit=50))
+    subset_docs = [text for _, text in records]
     
-    # Process just 50 documents for the demo run
-    subset_docs = raw_docs[:50] 
+    # The bulk writer MERGEs, so rewriting cached extractions is idempotent
+    _, to_extract, _ = checkpoint.plan(records)
     
-    documents = [Document(page_content=text) for text in subset_docs]
+    print(f"Extracting graph entities from {len(to_extract)} new documents ({len(subset_docs) - len(to_extract)} cached)...")
     
-    print(f"Extracting graph entities from {len(documents)} documents...")
-    
-    # Convert Text -> Graph Documents
-    graph_documents = llm_transformer.convert_to_graph_documents(documents)
+    # Convert Text -> Graph Documents, one at a time so a failure only costs that document
+    for key, text in to_extract:
+        try:
+            graph_docs = llm_transformer.convert_to_graph_documents([Document(page_content=text)])
+            checkpoint.record_extracted(key, text, graph_docs)
+        except Exception as e:
+            print(f"   > ❌ Doc {key} failed (will retry next run): {e}")
+            checkpoint.record_failed(key, text, e)
     
+    graph_documents = checkpoint.cached_graph_documents(subset_docs)
     print(f"Extraction complete. Found {len(graph_documents)} graph structures.")
     print("Pushing to Neo4j Database...")
     
-    # Store in Neo4j
-    graph.add_graph_documents(graph_documents)
+    # Merge spellings of the same entity ("GVHD" / "Graft-Versus-Host Disease") into one node
+    graph_documents = Canonicalizer.from_file().seed(graph).canonicalize(graph_documents)
+    
+    # Store in Neo4j (index-backed UNWIND batches)
+    BulkWriter(graph, ALLOWED_NODES).write(graph_documents)
+    checkpoint.mark_written(subset_docs)
     print("SUCCESS! Knowledge Graph populated.")
+    bump_data_version("knowledge graph rebuilt")
 
 if __name__ == "__main__":
     build_knowledge_graph()
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""Index-backed entity -> triple lookup shared by hybrid_rag.py and app.py."""
+from canonicalize import ENTITY_LABEL, ensure_norm_index, lookup_canonicalizer
+
+# Every label the builders are allowed to create (plus the manual repair label)
+NODE_LABELS = ["Disease", "Drug", "Symptom", "Anatomy", "Test", "Treatment", "Cell"]
+
+FULLTEXT_INDEX = "node_id_fulltext"
+
+# Lucene treats these as query syntax, so they must be escaped inside entity text
+_LUCENE_SPECIAL = set('+-&|!(){}[]^"~*?:\\/')
+
+# Canonical entities (canonicalize.py) resolve by equality on the indexed norm_id;
+# only the entities this finds nothing for go on to the full-text query below.
+EXACT_LOOKUP_QUERY = f"""
+UNWIND $entities AS entity
+CALL {{
+    WITH entity
+    MATCH (node:{ENTITY_LABEL} {{norm_id: entity.key}})
+    WITH node LIMIT $node_limit
+    MATCH (node)-[r]-(m)
+    RETURN startNode(r).id AS source, type(r) AS rel, endNode(r).id AS target, 2.0 AS score
+    LIMIT $limit
+}}
+RETURN entity.name AS entity, collect({{source: source, rel: rel, target: target, score: score}}) AS triples
+"""
+
+# One round trip for every entity: the full-text index resolves candidate nodes,
+# then only their own relationships are expanded (no scan over all edges).
+INDEXED_LOOKUP_QUERY = """
+UNWIND $entities AS entity
+CALL {
+    WITH entity
+    CALL db.index.fulltext.queryNodes($index_name, entity.query, {limit: $node_limit}) YIELD node, score
+    MATCH (node)-[r]-(m)
+    RETURN startNode(r).id AS source, type(r) AS rel, endNode(r).id AS target, score
+    ORDER BY score DESC
+    LIMIT $limit
+}
+RETURN entity.name AS entity, collect({source: source, rel: rel, target: target, score: score}) AS triples
+"""
+
+# Used only while the index is missing or still populating. Still one round trip,
+# but the CONTAINS filter has to scan node ids.
+SCAN_LOOKUP_QUERY = """
+UNWIND $entities AS entity
+CALL {
+    WITH entity
+    MATCH (node)
+    WHERE toLower(node.id) CONTAINS toLower(entity.name)
+    WITH node LIMIT $node_limit
+    MATCH (node)-[r]-(m)
+    RETURN startNode(r).id AS source, type(r) AS rel, endNode(r).id AS target, 1.0 AS score
+    LIMIT $limit
+}
+RETURN entity.name AS entity, collect({source: source, rel: rel, target: target, score: score}) AS triples
+"""
+
+_index_ready = False
+
+
+def clean_entity(text):
+    """Strips possessives and whitespace. Quoting is no longer needed since values go in as parameters."""
+    return text.replace("'s", "").strip()
+
+
+def to_lucene_query(entity):
+    """Builds a full-text query that prefers the exact phrase but still matches all terms."""
+    escaped = "".join(f"\\{ch}" if ch in _LUCENE_SPECIAL else ch for ch in entity)
+    terms = [t for t in escaped.split() if t.upper() not in ("AND", "OR", "NOT")]
+    if not terms:
+        return None
+    phrase = " ".join(terms)
+    if len(terms) == 1:
+        return phrase
+    return f'"{phrase}"^2 OR ({" AND ".join(terms)})'
+
+
+def ensure_node_index(graph, wait_seconds=30):
+    """Creates the norm_id and full-text indexes over node ids (idempotent) and waits for the latter to come online."""
+    global _index_ready
+    ensure_norm_index(graph)
+    try:
+        existing = [row["label"] for row in graph.query("CALL db.labels() YIELD label RETURN label")]
+    except Exception:
+        existing = []
+    labels = list(dict.fromkeys(NODE_LABELS + existing))
+    label_expr = "|".join(f"`{label}`" for label in labels)
+    try:
+        graph.query(f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} IF NOT EXISTS FOR (n:{label_expr}) ON EACH [n.id]")
+        graph.query("CALL db.awaitIndex($name, $seconds)", {"name": FULLTEXT_INDEX, "seconds": wait_seconds})
+        _index_ready = True
+    except Exception as e:
+        print(f"⚠️  Full-text index unavailable, falling back to scans: {e}")
+        _index_ready = False
+    return _index_ready
+
+
+def lookup_params(entities):
+    """The `$entities` rows of the lookup queries: name, full-text query and norm_id key."""
+    canonicalizer = lookup_canonicalizer()
+    params = []
+    for entity in entities:
+        name = clean_entity(entity)
+        query = to_lucene_query(name) if name else None
+        if query:
+            params.append({"name": name, "query": query, "key": canonicalizer.lookup_key(name)})
+    return params
+
+
+def lookup_triples(graph, entities, limit=10, node_limit=5):
+    """Resolves all entities by norm_id, then the rest by full-text, one query each.
+
+    Returns {entity: [triple, ...]} ranked by match score.
+    """
+    params = lookup_params(entities)
+    if not params:
+        return {}
+
+    args = {"entities": params, "limit": limit, "node_limit": node_limit, "index_name": FULLTEXT_INDEX}
+    rows = graph.query(EXACT_LOOKUP_QUERY, args)
+    found = {row["entity"] for row in rows}
+    args["entities"] = [p for p in params if p["name"] not in found]
+    if args["entities"]:
+        query = INDEXED_LOOKUP_QUERY if _index_ready else SCAN_LOOKUP_QUERY
+        try:
+            rows += graph.query(query, args)
+        except Exception as e:
+            if not _index_ready:
+                raise
+            print(f"⚠️  Indexed lookup failed ({e}), retrying with scan.")
+            rows += graph.query(SCAN_LOOKUP_QUERY, args)
+
+    results = {}
+    for row in rows:
+        best = {}
+        for triple in row["triples"]:
+            key = (triple["source"], triple["rel"], triple["target"])
+            if key not in best or triple["score"] > best[key]["score"]:
+                best[key] = triple
+        results[row["entity"]] = sorted(best.values(), key=lambda t: t["score"], reverse=True)
+    return results
+
+
+def format_triples(triples_by_entity):
+    """Renders lookup results as the plain "source REL target" lines the prompts expect."""
+    lines = []
+    for triples in triples_by_entity.values():
+        for t in triples:
+            lines.append(f"{t['source']} {t['rel']} {t['target']}")
+    return "\n".join(lines)
@@ -0,0 +1,252 @@
+"""In-memory CSR snapshot of the knowledge graph for local neighbor lookups.
+
+Neo4j stays the system of record. `export_snapshot` pulls the graph into
+NumPy arrays (interned node ids, CSR adjacency, relationship-type codes)
+under a new version directory; `GraphSnapshot` serves lookups from them
+without a network round trip.
+
+    python graph_snapshot.py            # export a new version from Neo4j
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from data_version import current_data_version
+from canonicalize import ENTITY_LABEL, lookup_canonicalizer, norm_key
+from graph_lookup import clean_entity
+
+DEFAULT_SNAPSHOT_DIR = "./graph_snapshot"
+
+NODES_QUERY = "MATCH (n) RETURN elementId(n) AS eid, n.id AS id, labels(n) AS labels"
+EDGES_QUERY = "MATCH (a)-[r]->(b) RETURN elementId(a) AS source, type(r) AS rel, elementId(b) AS target"
+
+# Every edge is stored at both endpoints; this flag says which way it points
+OUTGOING, INCOMING = 1, -1
+
+
+def snapshot_dir():
+    """MEDGRAPH_GRAPH_SNAPSHOT, read per call: entry points load .env after importing this."""
+    return os.getenv("MEDGRAPH_GRAPH_SNAPSHOT", DEFAULT_SNAPSHOT_DIR)
+
+
+def build_csr(num_nodes, sources, targets, rel_codes):
+    """Returns (indptr, neighbors, rel_types, directions) with both directions of every edge."""
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    rel_codes = np.asarray(rel_codes, dtype=np.int16)
+    owners = np.concatenate([sources, targets])
+    neighbors = np.concatenate([targets, sources])
+    rel_types = np.concatenate([rel_codes, rel_codes])
+    directions = np.concatenate([np.full(len(sources), OUTGOING, np.int8), np.full(len(targets), INCOMING, np.int8)])
+
+    order = np.argsort(owners, kind="stable")
+    counts = np.bincount(owners, minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, neighbors[order], rel_types[order], directions[order]
+
+
+def export_snapshot(graph, root=None):
+    """Pulls every node and relationship from Neo4j into a new snapshot version."""
+    root = root or snapshot_dir()
+    start = time.time()
+    node_rows = graph.query(NODES_QUERY)
+    index_of = {}
+    node_ids, node_labels, labels = [], [], []
+    label_code = {}
+    for row in node_rows:
+        index_of[row["eid"]] = len(node_ids)
+        node_ids.append(str(row["id"]) if row["id"] is not None else row["eid"])
+        label = next((l for l in row["labels"] if l != ENTITY_LABEL), "")
+        if label not in label_code:
+            label_code[label] = len(labels)
+            labels.append(label)
+        node_labels.append(label_code[label])
+
+    sources, targets, rel_codes, rel_types = [], [], [], []
+    rel_code = {}
+    for row in graph.query(EDGES_QUERY):
+        if row["rel"] not in rel_code:
+            rel_code[row["rel"]] = len(rel_types)
+            rel_types.append(row["rel"])
+        sources.append(index_of[row["source"]])
+        targets.append(index_of[row["target"]])
+        rel_codes.append(rel_code[row["rel"]])
+
+    indptr, neighbors, edge_rel, directions = build_csr(len(node_ids), sources, targets, rel_codes)
+
+    os.makedirs(root, exist_ok=True)
+    existing = [int(d[1:]) for d in os.listdir(root) if d.startswith("v") and d[1:].isdigit()]
+    version = max(existing, default=0) + 1
+    path = os.path.join(root, f"v{version}")
+    os.makedirs(path)
+    np.save(os.path.join(path, "indptr.npy"), indptr)
+    np.save(os.path.join(path, "neighbors.npy"), neighbors)
+    np.save(os.path.join(path, "rel_types.npy"), edge_rel)
+    np.save(os.path.join(path, "directions.npy"), directions)
+    np.save(os.path.join(path, "node_labels.npy"), np.asarray(node_labels, dtype=np.int16))
+    meta = {
+        "version": version,
+        "created": time.time(),
+        "data_version": current_data_version(),
+        "node_count": len(node_ids),
+        "edge_count": len(sources),
+        "labels": labels,
+        "rel_types": rel_types,
+    }
+    with open(os.path.join(path, "node_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(node_ids, f)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # Flip the pointer last so readers never see a half-written version
+    tmp_path = os.path.join(root, "CURRENT.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"v{version}")
+    os.replace(tmp_path, os.path.join(root, "CURRENT"))
+    print(f"📸 Snapshot v{version}: {len(node_ids)} nodes, {len(sources)} relationships ({time.time() - start:.1f}s)")
+    return path
+
+
+class GraphSnapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "node_ids.json"), encoding="utf-8") as f:
+            self.node_ids = json.load(f)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.indptr = load("indptr")
+        self.neighbors = load("neighbors")
+        self.rel_types = load("rel_types")
+        self.directions = load("directions")
+        self.node_labels = load("node_labels")
+        self.rel_names = self.meta["rel_types"]
+        self.label_names = self.meta["labels"]
+
+        # Interned lookups: lowercase id / norm_id / word -> node indices
+        self.by_lower_id = {}
+        self.by_norm_id = {}
+        self.by_token = {}
+        self.node_tokens = []
+        for i, node_id in enumerate(self.node_ids):
+            key = norm_key(node_id)
+            self.by_lower_id.setdefault(node_id.lower(), []).append(i)
+            self.by_norm_id.setdefault(key, []).append(i)
+            tokens = frozenset(key.split())
+            self.node_tokens.append(tokens)
+            for token in tokens:
+                self.by_token.setdefault(token, []).append(i)
+        # Shortest ids first, like a full-text score: "Aspirin" before "Aspirin Overdose"
+        for nodes in self.by_token.values():
+            nodes.sort(key=lambda i: (len(self.node_tokens[i]), i))
+
+    @property
+    def version(self):
+        return self.meta["version"]
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def neighbors_of(self, node):
+        """Yields (neighbor, rel_code, direction) for every relationship touching node."""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        for j in range(start, end):
+            yield int(self.neighbors[j]), int(self.rel_types[j]), int(self.directions[j])
+
+    def resolve(self, entity, node_limit=5):
+        """Exact matches (canonical norm_id or case-insensitive id) score 2.0; ids containing all
+        of the entity's words score 1.0, as with the full-text query Neo4j gets."""
+        name = clean_entity(entity).lower()
+        if not name:
+            return []
+        key = lookup_canonicalizer().lookup_key(name)
+        if key in self.by_norm_id:
+            return [(i, 2.0) for i in self.by_norm_id[key][:node_limit]]
+        if name in self.by_lower_id:
+            return [(i, 2.0) for i in self.by_lower_id[name][:node_limit]]
+        tokens = set(norm_key(name).split())
+        postings = [self.by_token.get(token, ()) for token in tokens]
+        if not postings:
+            return []
+        # Walk the rarest word's nodes; the cost is bounded by its frequency, not the graph size
+        rarest = min(postings, key=len)
+        matches = []
+        for i in rarest:
+            if tokens <= self.node_tokens[i]:
+                matches.append((i, 1.0))
+                if len(matches) >= node_limit:
+                    break
+        return matches
+
+    def triple(self, node, neighbor, rel, direction):
+        source, target = (node, neighbor) if direction == OUTGOING else (neighbor, node)
+        return {"source": self.node_ids[source], "rel": self.rel_names[rel], "target": self.node_ids[target]}
+
+    def lookup_triples(self, entities, limit=10, node_limit=5):
+        """Same contract as graph_lookup.lookup_triples, served from memory."""
+        results = {}
+        for entity in entities:
+            name = clean_entity(entity)
+            seen, triples = set(), []
+            for node, score in self.resolve(entity, node_limit):
+                for neighbor, rel, direction in self.neighbors_of(node):
+                    t = self.triple(node, neighbor, rel, direction)
+                    key = (t["source"], t["rel"], t["target"])
+                    if key not in seen:
+                        seen.add(key)
+                        triples.append({**t, "score": score})
+                    if len(triples) >= limit:
+                        break
+                if len(triples) >= limit:
+                    break
+            if name:
+                results[name] = triples
+        return results
+
+
+def snapshot_store_from_env():
+    """Returns a SnapshotStore when MEDGRAPH_GRAPH_BACKEND=snapshot and one was exported, else None."""
+    store = SnapshotStore()
+    if os.getenv("MEDGRAPH_GRAPH_BACKEND", "neo4j") == "snapshot" and store.available():
+        return store
+    return None
+
+
+class SnapshotStore:
+    """Holds the current snapshot and swaps in a newer version when CURRENT changes."""
+
+    def __init__(self, root=None):
+        self.root = root or snapshot_dir()
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.current = None
+
+    def available(self):
+        return os.path.exists(os.path.join(self.root, "CURRENT"))
+
+    def get(self):
+        with open(os.path.join(self.root, "CURRENT"), encoding="utf-8") as f:
+            current = f.read().strip()
+        with self.lock:
+            if current != self.current:
+                self.snapshot = GraphSnapshot(os.path.join(self.root, current))
+                self.current = current
+                if self.snapshot.meta["data_version"] != current_data_version():
+                    print("⚠️  Graph snapshot is older than the graph. Re-run graph_snapshot.py.")
+            return self.snapshot
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_community.graphs import Neo4jGraph
+
+    load_dotenv()
+    graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"), password=os.getenv("NEO4J_PASSWORD"))
+    snapshot = GraphSnapshot(export_snapshot(graph))
+    entity = "GVHD"
+    start = time.perf_counter()
+    triples = snapshot.lookup_triples([entity])
+    print(f"Lookup '{entity}' in {(time.perf_counter() - start) * 1000:.3f} ms: {triples}")
@@ -1,75 +1,104 @@
 import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.graphs import Neo4jGraph
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from graph_lookup import ensure_node_index, lookup_triples
+from semantic_cache import cache_from_env
+from entity_dictionary import EntityDictionary
+from embedding_cache import get_embedding_function
+from graph_snapshot import snapshot_store_from_env
+from multi_hop import SnapshotBackend, Neo4jBackend, expand_paths
+from llm_batcher import BatchedEntityExtractor, SingleFlight
+from context_packer import context_budget, pack_context
+from lexical_index import retriever_for
+from telemetry import span, submit, record_error, metrics, approx_tokens, exporters_from_env
 
 # Load secrets
 load_dotenv()
+exporters_from_env()
 
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+CHROMA_PATH = os.getenv("MEDGRAPH_CHROMA_PATH", "./medical_chroma_db")
+NEO4J_POOL_SIZE = int(os.getenv("MEDGRAPH_NEO4J_POOL_SIZE", "50"))
 
-# Setup Databases
-embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vector_db = Chroma(persist_directory="./medical_chroma_db", embedding_function=embedding_function)
-vector_retriever = vector_db.as_retriever(search_kwargs={"k": 2})
+# Multi-hop retrieval (depth 1 keeps the plain neighbor lookup)
+GRAPH_DEPTH = int(os.getenv("MEDGRAPH_GRAPH_DEPTH", "1"))
+GRAPH_REL_TYPES = [t for t in os.getenv("MEDGRAPH_GRAPH_REL_TYPES", "").split(",") if t] or None
+GRAPH_TIME_BUDGET = float(os.getenv("MEDGRAPH_GRAPH_TIME_BUDGET", "0.5"))
+
+# Extractor calls arriving within this window share one Groq request (0 disables batching)
+LLM_BATCH_WINDOW = float(os.getenv("MEDGRAPH_LLM_BATCH_WINDOW", "0.02"))
+LLM_MAX_BATCH = int(os.getenv("MEDGRAPH_LLM_MAX_BATCH", "8"))
 
-graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
+# The answer prompt is packed to this model's context budget (see context_packer.py)
+ANSWER_MODEL = "llama-3.3-70b-versatile"
+CONTEXT_TOKENS = context_budget(ANSWER_MODEL)
+# Chunks retrieved per question; packing keeps the sentences that fit the budget
+VECTOR_CANDIDATES = int(os.getenv("MEDGRAPH_VECTOR_CANDIDATES", "4"))
 
+# Setup Databases
+# Disk-cached MiniLM embeddings (shared with app.py and the index builder)
+embedding_function = get_embedding_function()
+# One pooled driver shared by every thread (and by service.py's request handlers)
+graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD,
+                   driver_config={"max_connection_pool_size": NEO4J_POOL_SIZE}, refresh_schema=False)
 # Use the SMART model for the reasoning engine
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
-
-def sanitize(text):
-    """Cleans entities to match Neo4j format."""
-    text = text.replace("'s", "") 
-    text = text.replace("'", "\\'") 
-    return text.strip()
-
-def get_graph_context(entities):
-    """Retrieves structured data from Neo4j."""
-    context_data = []
-    for entity in entities:
-        clean_entity = sanitize(entity)
-        query = f"""
-        MATCH (n)-[r]-(m)
-        WHERE toLower(n.id) CONTAINS toLower('{clean_entity}') OR toLower(m.id) CONTAINS toLower('{clean_entity}')
-        RETURN n.id AS source, type(r) AS rel, m.id AS target
-        LIMIT 10
-        """
-        try:
-            result = graph.query(query)
-            for record in result:
-                context_data.append(f"{record['source']} {record['rel']} {record['target']}")
-        except Exception:
-            continue
-    
-    if not context_data:
-        return "No direct graph connections found."
-    return "\n".join(context_data)
+llm = ChatGroq(model=ANSWER_MODEL, temperature=0)
 
-def hybrid_search(question):
-    """The core RAG pipeline: Extract -> Retrieve (Vector+Graph) -> Generate."""
-    
-    # 1. Extract Entities
-    system_prompt = "Extract the main medical entities (diseases, drugs) from the question as a comma-separated list."
-    extractor = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", "{question}")]) | llm | StrOutputParser()
-    entities = [e.strip() for e in extractor.invoke({"question": question}).split(",")]
-    
-    # 2. Retrieve Context
-    # Vector
-    vector_docs = vector_retriever.invoke(question)
-    vector_context = "\n".join([doc.page_content for doc in vector_docs])
-    
-    # Graph
-    graph_context = get_graph_context(entities)
+vector_db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+# Dense + BM25 fused to the same k (MEDGRAPH_RETRIEVAL=dense for Chroma alone)
+vector_retriever = retriever_for(vector_db, CHROMA_PATH, VECTOR_CANDIDATES)
+ensure_node_index(graph)
+
+# MEDGRAPH_GRAPH_BACKEND=snapshot serves lookups from the local CSR snapshot (see graph_snapshot.py)
+snapshot_store = snapshot_store_from_env()
+
+def fetch_triples(entities, limit):
+    """Local snapshot when one is configured, otherwise one indexed Neo4j query."""
+    if snapshot_store:
+        return snapshot_store.get().lookup_triples(entities, limit=limit)
+    return lookup_triples(graph, entities, limit=limit)
+
+def get_subgraph(entities, depth=GRAPH_DEPTH, limit=10):
+    """{"triples": {entity: [triple, ...]}, "paths": [...], "truncated": bool}. Errors propagate.
     
-    # 3. Generate Answer
-    template = """
+    Depth 1 is one indexed lookup (up to `limit` triples per entity); deeper
+    searches return ranked paths bounded by fan-out, hub pruning and a time budget.
+    """
+    if depth > 1:
+        backend = SnapshotBackend(snapshot_store.get()) if snapshot_store else Neo4jBackend(graph)
+        paths, truncated = expand_paths(backend, entities, depth=depth, rel_types=GRAPH_REL_TYPES, time_budget=GRAPH_TIME_BUDGET)
+        return {"triples": {}, "paths": paths, "truncated": truncated}
+    return {"triples": fetch_triples(entities, limit=limit), "paths": [], "truncated": False}
+
+def retrieve_subgraph(entities, depth=GRAPH_DEPTH, limit=10):
+    """get_subgraph, traced; a failed lookup yields an empty subgraph."""
+    with span("graph_retrieval", entities=len(entities), depth=depth, backend="snapshot" if snapshot_store else "neo4j") as s:
+        try:
+            subgraph = get_subgraph(entities, depth, limit)
+            s.set(truncated=subgraph["truncated"])
+        except Exception as e:
+            # Answer from the vector context alone, but count and trace the failure
+            record_error("graph_retrieval", e)
+            subgraph = {"triples": {}, "paths": [], "truncated": False}
+        s.set(results=sum(len(t) for t in subgraph["triples"].values()) + len(subgraph["paths"]))
+    return subgraph
+
+# --- PIPELINE STAGES ---
+extractor = ChatPromptTemplate.from_messages([
+    ("system", "Extract the main medical entities (diseases, drugs) from the question as a comma-separated list."),
+    ("human", "{question}")
+]) | llm | StrOutputParser()
+
+answer_template = """
     Answer the question using the provided context.
     
     VECTOR CONTEXT (Literature):
@@ -81,15 +110,175 @@ def hybrid_search(question):
     Question: {question}
     Answer:
     """
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | StrOutputParser()
+answer_chain = ChatPromptTemplate.from_template(answer_template) | llm | StrOutputParser()
+
+# Node ids from the graph, matched locally so most questions skip the extractor LLM
+entity_dictionary = EntityDictionary(graph)
+
+# Paraphrased repeat questions are answered from here instead of re-running the pipeline
+answer_cache = cache_from_env(embedding_function.embed_query)
+
+# Shared pool so independent network calls (Groq, Chroma, Neo4j) overlap
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("MEDGRAPH_RETRIEVAL_WORKERS", "8")), thread_name_prefix="hybrid")
+
+def timed(timings, stage, fn, *args):
+    """Runs fn(*args), adding its wall time (seconds) to timings[stage] when timings is a dict."""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def parse_entities(raw):
+    return [e.strip() for e in raw.split(",") if e.strip()]
+
+# Concurrent questions share extractor calls; identical in-flight answer prompts share one generation
+batched_extractor = BatchedEntityExtractor(
+    llm, lambda question: parse_entities(extractor.invoke({"question": question})),
+    window=LLM_BATCH_WINDOW, max_batch=LLM_MAX_BATCH
+)
+answer_flight = SingleFlight("generation")
+
+def extract_entities(question):
+    with span("extraction") as s:
+        entities = entity_dictionary.extract(question)
+        source = "dictionary"
+        if not entities:
+            # Nothing in the dictionary matched: fall back to the LLM extractor
+            source = "llm"
+            entities = batched_extractor.extract(question)
+            s.set(prompt_tokens=approx_tokens(question), completion_tokens=approx_tokens(", ".join(entities)))
+        s.set(source=source, results=len(entities))
+    metrics.incr("medgraph_entity_extractions_total", source=source)
+    return entities
+
+def get_vector_chunks(question):
+    with span("vector_retrieval") as s:
+        vector_docs = vector_retriever.invoke(question)
+        s.set(results=len(vector_docs))
+    return [doc.page_content for doc in vector_docs]
+
+def pack_inputs(question, chunks, subgraph):
+    """answer_chain inputs: deduped, ranked chunks and graph facts within CONTEXT_TOKENS."""
+    with span("context_packing") as s:
+        vector_context, graph_context, stats = pack_context(question, chunks, subgraph, CONTEXT_TOKENS)
+        s.set(**stats)
+    return {"vector_context": vector_context, "graph_context": graph_context, "question": question}
+
+def generate_answer(inputs):
+    prompt = answer_template.format(**inputs)
+    with span("generation", prompt_tokens=approx_tokens(prompt)) as s:
+        answer = answer_flight.run(prompt, lambda: answer_chain.invoke(inputs))
+        s.set(completion_tokens=approx_tokens(answer))
+    return answer
+
+def cached_answer(question):
+    cached = answer_cache.get(question)
+    metrics.incr("medgraph_cache_hits_total" if cached is not None else "medgraph_cache_misses_total", cache="answer")
+    return cached
+
+def retrieve_context(question, concurrent=True, timings=None, graph_limit=10):
+    """Extract + retrieve. Returns (entities, subgraph, answer_chain inputs).
+    
+    With concurrent=True the vector search (which only needs the question) runs
+    while the entities are extracted and the graph is queried. Pass a dict as
+    `timings` to get per-stage seconds ("extraction", "vector", "graph", "packing").
+    `graph_limit` triples per entity are fetched; packing keeps what fits the budget.
+    """
+    if concurrent:
+        vector_future = submit(executor, timed, timings, "vector", get_vector_chunks, question)
+        entities = timed(timings, "extraction", extract_entities, question)
+        subgraph = timed(timings, "graph", retrieve_subgraph, entities, GRAPH_DEPTH, graph_limit)
+        chunks = vector_future.result()
+    else:
+        entities = timed(timings, "extraction", extract_entities, question)
+        chunks = timed(timings, "vector", get_vector_chunks, question)
+        subgraph = timed(timings, "graph", retrieve_subgraph, entities, GRAPH_DEPTH, graph_limit)
+    
+    return entities, subgraph, timed(timings, "packing", pack_inputs, question, chunks, subgraph)
+
+def hybrid_search(question, concurrent=True, use_cache=True, timings=None):
+    """The core RAG pipeline: Extract -> Retrieve (Vector+Graph) -> Generate.
     
-    return chain.invoke({
-        "vector_context": vector_context,
-        "graph_context": graph_context,
-        "question": question
-    })
+    `timings` (optional dict) receives per-stage seconds, "generation" included.
+    """
+    with span("hybrid_search", concurrent=concurrent) as s:
+        if use_cache:
+            cached = cached_answer(question)
+            if cached is not None:
+                s.set(cache="hit")
+                return cached["answer"]
+        
+        entities, _, inputs = retrieve_context(question, concurrent, timings)
+        answer = timed(timings, "generation", generate_answer, inputs)
+        if use_cache:
+            answer_cache.put(question, answer, entities)
+    return answer
+
+def stream_events(question, use_cache=True, with_context=False, graph_limit=10):
+    """The streaming pipeline as events: {"event": "context", "entities", "subgraph"} (only
+    with_context=True), then {"event": "token", "text"} per token, then {"event": "done", "cached"}.
+    
+    Clients that visualize the graph (service.py) get the same subgraph the prompt was built from.
+    """
+    with span("stream_hybrid_search") as s:
+        if use_cache:
+            cached = cached_answer(question)
+            if cached is not None:
+                s.set(cache="hit")
+                if with_context:
+                    # The cache keeps the entities, so only the graph for the panel is looked up again
+                    entities = cached["entities"]
+                    yield {"event": "context", "entities": entities, "subgraph": retrieve_subgraph(entities, GRAPH_DEPTH, graph_limit)}
+                yield {"event": "token", "text": cached["answer"]}
+                yield {"event": "done", "cached": True}
+                return
+        
+        entities, subgraph, inputs = retrieve_context(question, graph_limit=graph_limit)
+        if with_context:
+            yield {"event": "context", "entities": entities, "subgraph": subgraph}
+        parts = []
+        with span("generation", prompt_tokens=approx_tokens(answer_template.format(**inputs))) as gen:
+            for token in answer_chain.stream(inputs):
+                if not parts:
+                    gen.set(first_token_ms=round((time.perf_counter() - gen.start) * 1000, 1))
+                parts.append(token)
+                yield {"event": "token", "text": token}
+            gen.set(completion_tokens=approx_tokens("".join(parts)))
+        if use_cache:
+            answer_cache.put(question, "".join(parts), entities)
+        yield {"event": "done", "cached": False}
+
+def stream_hybrid_search(question, use_cache=True):
+    """Same pipeline as hybrid_search, but yields answer tokens as Groq produces them."""
+    for event in stream_events(question, use_cache):
+        if event["event"] == "token":
+            yield event["text"]
+
+async def ahybrid_search(question, use_cache=True):
+    """Async version of hybrid_search for callers serving many questions at once."""
+    with span("ahybrid_search") as s:
+        if use_cache:
+            cached = await asyncio.to_thread(cached_answer, question)
+            if cached is not None:
+                s.set(cache="hit")
+                return cached["answer"]
+        
+        # to_thread and tasks copy the context, so these spans nest under ahybrid_search
+        vector_task = asyncio.create_task(asyncio.to_thread(get_vector_chunks, question))
+        entities = await asyncio.to_thread(extract_entities, question)
+        subgraph = await asyncio.to_thread(retrieve_subgraph, entities)
+        inputs = pack_inputs(question, await vector_task, subgraph)
+        with span("generation", prompt_tokens=approx_tokens(answer_template.format(**inputs))) as gen:
+            answer = await answer_chain.ainvoke(inputs)
+            gen.set(completion_tokens=approx_tokens(answer))
+        if use_cache:
+            await asyncio.to_thread(answer_cache.put, question, answer, entities)
+    return answer
 
 if __name__ == "__main__":
-    # Quick Test
-    print(hybrid_search("What treats GVHD?"))
\ No newline at end of file
+    # Quick Test (streamed, so the first tokens show up right away)
+    for token in stream_hybrid_search("What treats GVHD?"):
+        print(token, end="", flush=True)
+    print()
@@ -0,0 +1,277 @@
+"""Rate-limit-aware concurrent ingestion: Groq extraction workers + one Neo4j writer.
+
+A token bucket per quota (requests/min and tokens/min) decides how many
+documents a worker may take at once. Failures are retried with jittered
+backoff, and graph writes are pipelined on a separate thread so extraction
+never waits on the database.
+"""
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from telemetry import span, metrics
+
+# LLMGraphTransformer's system prompt + schema + JSON output, on top of the document itself
+PROMPT_OVERHEAD_TOKENS = 1500
+
+
+def estimate_tokens(text):
+    """Rough token count for quota planning (~4 characters per token)."""
+    return PROMPT_OVERHEAD_TOKENS + len(text) // 4
+
+
+def extract_wait_time(error_message):
+    """Parses Groq's "try again in 1m2.3s" hint. Returns None when there is no hint."""
+    msg = str(error_message)
+    match_min = re.search(r"try again in (\d+)m(\d+)", msg)
+    match_sec = re.search(r"try again in (\d+\.?\d*)s", msg)
+
+    if match_min:
+        return (int(match_min.group(1)) * 60) + int(match_min.group(2)) + 1
+    if match_sec:
+        return float(match_sec.group(1)) + 1
+    return None
+
+
+class FatalIngestionError(RuntimeError):
+    """Raised for errors that retrying cannot fix (e.g. a decommissioned model)."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        missing = amount - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute + tokens-per-minute limiter shared by all workers."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def affordable(self, tokens_per_item):
+        """How many items fit in what is left of both quotas right now."""
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return int(min(self.requests.tokens, self.tokens.tokens / max(tokens_per_item, 1)))
+
+    def acquire(self, requests, tokens):
+        """Blocks until both quotas allow the call, then consumes them."""
+        requests = min(requests, self.requests.capacity)
+        tokens = min(tokens, self.tokens.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(self.blocked_until - now, self.requests.wait_for(requests), self.tokens.wait_for(tokens))
+                if wait <= 0:
+                    self.requests.tokens -= requests
+                    self.tokens.tokens -= tokens
+                    return
+            time.sleep(min(wait, 5.0))
+
+    def pause(self, seconds):
+        """Provider said 429: hold every worker back, not just the one that got it."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens.tokens = min(self.tokens.tokens, 0.0)
+
+
+class IngestionEngine:
+    def __init__(self, extract_fn, write_fn, requests_per_minute=30, tokens_per_minute=12000,
+                 workers=4, max_batch_size=4, max_retries=5, write_batch_size=20,
+                 backoff_base=2.0, backoff_cap=120.0, checkpoint=None, mark_written=True):
+        self.extract_fn = extract_fn  # list[Document] -> list[GraphDocument]
+        self.write_fn = write_fn  # list[GraphDocument] -> None
+        self.checkpoint = checkpoint  # optional CheckpointStore
+        # False when write_fn does not reach the graph (CSV export): extractions are still
+        # checkpointed, but the documents stay unwritten for the next graph run
+        self.mark_written = mark_written
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.write_batch_size = write_batch_size
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.source = None
+        self.source_lock = threading.Lock()
+        self.write_queue = queue.Queue(maxsize=workers * 8)
+        self.stop = threading.Event()
+        self.fatal_error = None
+        self.stats_lock = threading.Lock()
+        self.stats = {"extracted": 0, "written": 0, "failed": [], "retries": 0}
+        self.avg_doc_tokens = PROMPT_OVERHEAD_TOKENS + 400
+
+    # --- Work distribution ---
+    def take(self, n):
+        """Pulls up to n (key, text) items from the shared source."""
+        with self.source_lock:
+            batch = []
+            for item in self.source:
+                batch.append(item)
+                if len(batch) >= n:
+                    break
+            return batch
+
+    def next_batch_size(self):
+        # Adapt to what the quota can absorb right now, but always make progress
+        affordable = self.limiter.affordable(self.avg_doc_tokens)
+        return max(1, min(self.max_batch_size, affordable))
+
+    def backoff(self, attempt, error):
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        hint = extract_wait_time(error)
+        return max(delay, hint) if hint else delay
+
+    # --- Extraction workers ---
+    def extract_batch(self, batch):
+        """Returns (graph_docs, None) on success or (None, last_error) once retries run out."""
+        docs = [Document(page_content=text, metadata={"key": key}) for key, text in batch]
+        tokens = sum(estimate_tokens(text) for _, text in batch)
+        self.avg_doc_tokens = 0.8 * self.avg_doc_tokens + 0.2 * (tokens / len(batch))
+        for attempt in range(self.max_retries + 1):
+            if self.stop.is_set():
+                return None, "stopped"
+            self.limiter.acquire(len(docs), tokens)
+            try:
+                with span("ingest.extract", docs=len(docs), prompt_tokens=tokens, attempt=attempt) as s:
+                    graph_docs = self.extract_fn(docs)
+                    s.set(nodes=sum(len(g.nodes) for g in graph_docs), relationships=sum(len(g.relationships) for g in graph_docs))
+                return graph_docs, None
+            except Exception as e:
+                error_str = str(e)
+                if "model_decommissioned" in error_str:
+                    raise FatalIngestionError("Model Decommissioned. Groq changed models again.") from e
+                if attempt == self.max_retries:
+                    print(f"   > ❌ Giving up on {[k for k, _ in batch]}: {e}")
+                    return None, e
+                wait = self.backoff(attempt, error_str)
+                if "429" in error_str:
+                    print(f"   > ⏳ Quota Limit. Pausing workers {wait:.0f}s...")
+                    self.limiter.pause(wait)
+                else:
+                    print(f"   > ⚠️  Error ({e}). Retry {attempt + 1}/{self.max_retries} in {wait:.0f}s...")
+                    time.sleep(wait)
+                with self.stats_lock:
+                    self.stats["retries"] += 1
+                metrics.incr("medgraph_ingest_retries_total", reason="rate_limit" if "429" in error_str else "error")
+
+    def worker(self):
+        try:
+            while not self.stop.is_set():
+                batch = self.take(self.next_batch_size())
+                if not batch:
+                    return
+                graph_docs, error = self.extract_batch(batch)
+                keys = [key for key, _ in batch]
+                if graph_docs is None:
+                    metrics.incr("medgraph_ingest_docs_total", len(keys), status="failed")
+                    with self.stats_lock:
+                        self.stats["failed"].extend(keys)
+                    if self.checkpoint:
+                        for key, text in batch:
+                            self.checkpoint.record_failed(key, text, error)
+                    continue
+                if self.checkpoint:
+                    # One GraphDocument per input document, in order
+                    for (key, text), graph_doc in zip(batch, graph_docs):
+                        self.checkpoint.record_extracted(key, text, [graph_doc])
+                with self.stats_lock:
+                    self.stats["extracted"] += len(batch)
+                metrics.incr("medgraph_ingest_docs_total", len(batch), status="extracted")
+                print(f"   > 🧠 Extracted docs {keys}")
+                self.write_queue.put((batch, graph_docs))
+        except FatalIngestionError as e:
+            self.fatal_error = e
+            self.stop.set()
+
+    # --- Graph writer ---
+    def enqueue_write(self, batch, graph_docs):
+        """Queues already-extracted results (e.g. replayed from checkpoints) for the writer."""
+        self.write_queue.put((batch, graph_docs))
+
+    def write_pending(self, pending):
+        items = [item for batch, _ in pending for item in batch]
+        keys = [key for key, _ in items]
+        graph_docs = [g for _, gs in pending for g in gs]
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("ingest.write", docs=len(keys), attempt=attempt):
+                    self.write_fn(graph_docs)
+                if self.checkpoint and self.mark_written:
+                    self.checkpoint.mark_written([text for _, text in items])
+                with self.stats_lock:
+                    self.stats["written"] += len(keys)
+                metrics.incr("medgraph_ingest_docs_total", len(keys), status="written")
+                print(f"   > ✅ Graph Updated ({len(keys)} docs).")
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"   > ❌ Write failed for {keys}: {e}")
+                    metrics.incr("medgraph_ingest_docs_total", len(keys), status="failed")
+                    with self.stats_lock:
+                        self.stats["failed"].extend(keys)
+                    return
+                time.sleep(self.backoff(attempt, e))
+
+    def writer(self):
+        pending = []
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            pending.append(item)
+            # Group whatever is already waiting into one write
+            if self.write_queue.empty() or sum(len(batch) for batch, _ in pending) >= self.write_batch_size:
+                self.write_pending(pending)
+                pending = []
+        if pending:
+            self.write_pending(pending)
+
+    def run(self, items):
+        """Ingests (key, text) pairs. Returns stats with the keys that failed after all retries."""
+        self.source = iter(items)
+        start = time.time()
+        writer_thread = threading.Thread(target=self.writer, name="graph-writer", daemon=True)
+        writer_thread.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract") as pool:
+                futures = [pool.submit(self.worker) for _ in range(self.workers)]
+            for future in futures:
+                future.result()
+        finally:
+            self.write_queue.put(None)
+            writer_thread.join()
+
+        elapsed = time.time() - start
+        self.stats["elapsed_s"] = round(elapsed, 1)
+        self.stats["docs_per_min"] = round(self.stats["written"] / elapsed * 60, 1) if elapsed else 0.0
+        print(f"\n📊 Extracted {self.stats['extracted']} | Written {self.stats['written']} | "
+              f"Failed {len(self.stats['failed'])} | {self.stats['docs_per_min']} docs/min")
+        if self.fatal_error:
+            raise self.fatal_error
+        return self.stats
@@ -1,31 +1,322 @@
+"""Graph health and retrieval-cost diagnostics, as JSON.
+
+    python inspect_graph.py                                   # report on stdout
+    python inspect_graph.py --output graph_health.json --sample 50
+    python inspect_graph.py --fail-on-scan                    # exit 1 when a retrieval query scans
+
+The report covers:
+
+- node counts per label and relationship counts per type
+- the degree distribution, the top hubs (multi-hop never expands through
+  nodes above HUB_DEGREE) and orphan nodes
+- duplicate-id candidates: one id on several nodes, and the groups that
+  canonicalize.py would merge
+- index and constraint coverage for what ingestion and retrieval rely on
+- PROFILE of the retrieval queries (db hits, rows, time, operators) for a
+  sample of entities, with the parameters hybrid_rag.retrieve_context and
+  app.fetch_subgraph pass
+"""
+import argparse
+import json
 import os
-from dotenv import load_dotenv
-from langchain_community.graphs import Neo4jGraph
+import sys
+import time
+
+from bulk_writer import quote
+from canonicalize import ENTITY_LABEL, EXISTING_NODES_QUERY, NORM_INDEX, Canonicalizer, plan_merge
+from data_version import current_data_version
+from graph_lookup import EXACT_LOOKUP_QUERY, FULLTEXT_INDEX, INDEXED_LOOKUP_QUERY, SCAN_LOOKUP_QUERY, lookup_params
+from multi_hop import CANDIDATE_FACTOR, Neo4jBackend
+
+# expand_paths' default max_degree
+HUB_DEGREE = 100
 
-# Load environment variables
-load_dotenv()
+# Plan operators that read every node, relationship or index entry of their kind
+SCAN_OPERATORS = {
+    "AllNodesScan", "NodeByLabelScan", "NodeIndexScan", "NodeIndexContainsScan", "NodeIndexEndsWithScan",
+    "DirectedAllRelationshipsScan", "UndirectedAllRelationshipsScan",
+    "DirectedRelationshipTypeScan", "UndirectedRelationshipTypeScan",
+}
 
-# --- CONFIGURATION ---
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+DEGREE_QUERY = "MATCH (n) WITH COUNT { (n)--() } AS degree RETURN degree, count(*) AS nodes"
 
-if not NEO4J_PASSWORD:
-    raise ValueError("❌ NEO4J_PASSWORD not found. Please check your .env file.")
+TOP_HUBS_QUERY = f"""
+MATCH (n)
+WITH n, COUNT {{ (n)--() }} AS degree
+ORDER BY degree DESC
+LIMIT $top
+RETURN n.id AS id, [l IN labels(n) WHERE l <> '{ENTITY_LABEL}'] AS labels, degree
+"""
+
+ORPHANS_QUERY = f"""
+MATCH (n) WHERE NOT (n)--()
+RETURN n.id AS id, [l IN labels(n) WHERE l <> '{ENTITY_LABEL}'] AS labels
+LIMIT $limit
+"""
+
+DUPLICATE_IDS_QUERY = f"""
+MATCH (n) WHERE n.id IS NOT NULL
+WITH n.id AS id, collect([l IN labels(n) WHERE l <> '{ENTITY_LABEL}']) AS labels, count(*) AS nodes
+WHERE nodes > 1
+RETURN id, labels, nodes
+ORDER BY nodes DESC
+LIMIT $limit
+"""
 
-graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
+MISSING_NORM_ID_QUERY = "MATCH (n) WHERE n.id IS NOT NULL AND n.norm_id IS NULL RETURN count(n) AS count"
 
-print("--- TOP 10 CONNECTED NODES IN YOUR DATABASE ---")
-query = """
-MATCH (n)-[r]->(m)
-RETURN n.id AS Source, type(r) AS Relationship, m.id AS Target
-LIMIT 10
+SAMPLE_ENTITIES_QUERY = """
+MATCH (n) WHERE n.id IS NOT NULL AND (n)--()
+WITH n.id AS id, rand() AS r
+ORDER BY r
+LIMIT $sample
+RETURN id
 """
 
-results = graph.query(query)
 
-if not results:
-    print("Graph is empty! Did graph_builder.py finish successfully?")
-else:
-    for res in results:
-        print(f"{res['Source']} --[{res['Relationship']}]--> {res['Target']}")
\ No newline at end of file
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# --- Shape of the graph ---
+def counts(graph):
+    labels = [r["label"] for r in graph.query("CALL db.labels() YIELD label RETURN label")]
+    types = [r["relationshipType"] for r in graph.query("CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType")]
+    # Single-label / single-type counts come from the count store, not a scan
+    by_label = {l: graph.query(f"MATCH (n:{quote(l)}) RETURN count(n) AS count")[0]["count"] for l in labels}
+    by_type = {t: graph.query(f"MATCH ()-[r:{quote(t)}]->() RETURN count(r) AS count")[0]["count"] for t in types}
+    return {
+        "nodes": graph.query("MATCH (n) RETURN count(n) AS count")[0]["count"],
+        "relationships": graph.query("MATCH ()-[r]->() RETURN count(r) AS count")[0]["count"],
+        "nodes_by_label": dict(sorted(by_label.items(), key=lambda kv: -kv[1])),
+        "relationships_by_type": dict(sorted(by_type.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def degrees(graph, top=20, orphan_limit=20):
+    histogram = dict(sorted((r["degree"], r["nodes"]) for r in graph.query(DEGREE_QUERY)))
+    total = sum(histogram.values())
+
+    def histogram_percentile(q):
+        seen = 0
+        for degree, nodes in histogram.items():
+            seen += nodes
+            if seen > q * total:
+                return degree
+        return None
+
+    # Power-of-two buckets: "0", "1", "2-3", "4-7", ...
+    buckets = {}
+    for degree, nodes in histogram.items():
+        low = 0 if degree == 0 else 1 << (degree.bit_length() - 1)
+        label = str(low) if low <= 1 else f"{low}-{2 * low - 1}"
+        buckets[label] = buckets.get(label, 0) + nodes
+    return {
+        "mean": round(sum(d * n for d, n in histogram.items()) / total, 2) if total else None,
+        "p50": histogram_percentile(0.5),
+        "p90": histogram_percentile(0.9),
+        "p99": histogram_percentile(0.99),
+        "max": max(histogram, default=None),
+        "histogram": buckets,
+        "hub_degree": HUB_DEGREE,
+        "hubs": sum(n for d, n in histogram.items() if d > HUB_DEGREE),
+        "top_hubs": graph.query(TOP_HUBS_QUERY, {"top": top}),
+        "orphans": histogram.get(0, 0),
+        "orphan_examples": graph.query(ORPHANS_QUERY, {"limit": orphan_limit}),
+    }
+
+
+def duplicates(graph, limit=20):
+    groups, _ = plan_merge(graph.query(EXISTING_NODES_QUERY), Canonicalizer.from_file())
+    groups.sort(key=lambda g: -len(g["merged"]))
+    return {
+        "same_id": graph.query(DUPLICATE_IDS_QUERY, {"limit": limit}),
+        "canonical_groups": len(groups),
+        "canonical_nodes_to_merge": sum(len(g["merged"]) for g in groups),
+        "canonical_examples": [{"label": g["label"], "id": g["id"], "merged": g["merged"]} for g in groups[:limit]],
+        "missing_norm_id": graph.query(MISSING_NORM_ID_QUERY)[0]["count"],
+    }
+
+
+def index_coverage(graph, labels):
+    indexes = graph.query("SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, state, populationPercent")
+    constraints = graph.query("SHOW CONSTRAINTS YIELD name, type, labelsOrTypes, properties")
+    by_name = {i["name"]: i for i in indexes}
+    labels = [l for l in labels if l != ENTITY_LABEL]
+    unique_id = {c["labelsOrTypes"][0] for c in constraints
+                 if "UNIQUENESS" in c["type"] and c["properties"] == ["id"] and c["labelsOrTypes"]}
+    fulltext, norm = by_name.get(FULLTEXT_INDEX), by_name.get(NORM_INDEX)
+    return {
+        "indexes": indexes,
+        "constraints": constraints,
+        "labels_without_id_constraint": [l for l in labels if l not in unique_id],
+        "fulltext_index": fulltext["state"] if fulltext else "MISSING",
+        "labels_outside_fulltext_index": [l for l in labels if not fulltext or l not in fulltext["labelsOrTypes"]],
+        "norm_id_index": norm["state"] if norm else "MISSING",
+        "not_online": [i["name"] for i in indexes if i["state"] != "ONLINE"],
+    }
+
+
+# --- Retrieval cost ---
+def profile(graph, query, params):
+    """Runs PROFILE on one query: rows, total db hits, server time and the plan's operators."""
+    with graph._driver.session(database=getattr(graph, "_database", None)) as session:
+        result = session.run("PROFILE " + query, params)
+        rows = len(list(result))
+        summary = result.consume()
+    operators, stack = [], [summary.profile]
+    while stack:
+        op = stack.pop()
+        operators.append(op)
+        stack.extend(op.get("children", []))
+    return {
+        "rows": rows,
+        "db_hits": sum(op.get("dbHits", 0) for op in operators),
+        "ms": (summary.result_available_after or 0) + (summary.result_consumed_after or 0),
+        "operators": [op["operatorType"].split("@")[0] for op in operators],
+        "runtime": summary.profile.get("args", {}).get("runtime"),
+    }
+
+
+def summarize(runs):
+    """Per-query aggregate over the sampled entities; `worst` is the entity with the most db hits."""
+    hits = sorted(r["db_hits"] for r in runs)
+    ms = sorted(r["ms"] for r in runs)
+    operators = sorted({op for r in runs for op in r["operators"]})
+    worst = max(runs, key=lambda r: r["db_hits"])
+    return {
+        "runs": len(runs),
+        "runtime": runs[0]["runtime"],
+        "db_hits": {"mean": round(sum(hits) / len(hits), 1), "p95": percentile(hits, 0.95), "max": hits[-1]},
+        "ms": {"mean": round(sum(ms) / len(ms), 2), "p95": percentile(ms, 0.95), "max": ms[-1]},
+        "rows_mean": round(sum(r["rows"] for r in runs) / len(runs), 2),
+        "operators": operators,
+        "scans": [op for op in operators if op in SCAN_OPERATORS],
+        "worst": {"entity": worst["entity"], "db_hits": worst["db_hits"], "ms": worst["ms"]},
+    }
+
+
+def retrieval_queries(fulltext_online):
+    """(call site, query name, query, parameters besides $entities) as the retrieval code runs them.
+
+    The full-text query only runs for entities the norm_id lookup misses, and
+    falls back to the scan query while the index is unavailable.
+    """
+    fallback = ("fulltext", INDEXED_LOOKUP_QUERY) if fulltext_online else ("scan", SCAN_LOOKUP_QUERY)
+    queries = []
+    for site, limit in (("hybrid_rag.retrieve_context", 10), ("app.fetch_subgraph", 20)):
+        params = {"limit": limit, "node_limit": 5, "index_name": FULLTEXT_INDEX}
+        queries.append((site, "exact", EXACT_LOOKUP_QUERY, params))
+        queries.append((site, fallback[0], fallback[1], params))
+    # MEDGRAPH_GRAPH_DEPTH > 1: expand_paths' defaults (node_limit 3, fan_out 10)
+    multi_hop = {"index_name": FULLTEXT_INDEX, "node_limit": 3}
+    queries.append(("multi_hop.Neo4jBackend", "resolve_exact", Neo4jBackend.EXACT_RESOLVE_QUERY, multi_hop))
+    queries.append(("multi_hop.Neo4jBackend", "resolve_fulltext", Neo4jBackend.RESOLVE_QUERY, multi_hop))
+    return queries
+
+
+def retrieval_profile(graph, entities, fulltext_online):
+    if getattr(graph, "_driver", None) is None:
+        return {"error": "PROFILE needs a Neo4j driver (Neo4jGraph)"}
+    report = {}
+    expand_runs = []
+    for site, name, query, params in retrieval_queries(fulltext_online):
+        runs = []
+        for entity in entities:
+            args = {"entities": lookup_params([entity]), **params}
+            if not args["entities"]:
+                continue
+            runs.append({"entity": entity, **profile(graph, query, args)})
+            if name == "resolve_exact" and runs[-1]["rows"]:
+                # One hop from the resolved nodes, as expand_paths' first step does
+                keys = [n["key"] for row in graph.query(query, args) for n in row["nodes"]]
+                expand = {"frontier": keys, "rel_types": None, "fan_out": 10, "candidates": 10 * CANDIDATE_FACTOR}
+                expand_runs.append({"entity": entity, **profile(graph, Neo4jBackend.EXPAND_QUERY, expand)})
+        if runs:
+            report.setdefault(site, {})[name] = summarize(runs)
+    if expand_runs:
+        report["multi_hop.Neo4jBackend"]["expand"] = summarize(expand_runs)
+    return report
+
+
+def sample_entities(graph, sample, hubs):
+    """Random connected node ids plus the top hubs (the most expensive lookups)."""
+    entities = [r["id"] for r in graph.query(SAMPLE_ENTITIES_QUERY, {"sample": sample})]
+    return list(dict.fromkeys(entities + [h["id"] for h in hubs if h["id"] is not None]))
+
+
+def warnings_for(report, max_duplicates=0):
+    """The findings worth acting on, one line each."""
+    warnings = []
+    for site, queries in report["retrieval"].items():
+        if not isinstance(queries, dict):
+            continue
+        for name, summary in queries.items():
+            if isinstance(summary, dict) and summary.get("scans"):
+                warnings.append(f"{site} {name} scans: {', '.join(summary['scans'])}")
+    coverage = report["indexes"]
+    if coverage["fulltext_index"] != "ONLINE":
+        warnings.append(f"full-text index {FULLTEXT_INDEX} is {coverage['fulltext_index']}")
+    if coverage["norm_id_index"] != "ONLINE":
+        warnings.append(f"norm_id index {NORM_INDEX} is {coverage['norm_id_index']}")
+    if coverage["labels_without_id_constraint"]:
+        warnings.append(f"no uniqueness constraint on id for: {', '.join(coverage['labels_without_id_constraint'])}")
+    dup = report["duplicates"]
+    if dup["missing_norm_id"]:
+        warnings.append(f"{dup['missing_norm_id']} nodes have no norm_id (run canonicalize.py)")
+    if dup["canonical_nodes_to_merge"] > max_duplicates:
+        warnings.append(f"{dup['canonical_nodes_to_merge']} duplicate nodes in {dup['canonical_groups']} groups (run canonicalize.py)")
+    return warnings
+
+
+def inspect(graph, sample=20, entities=None, top=20):
+    started = time.perf_counter()
+    report = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "data_version": current_data_version()}
+    report["counts"] = counts(graph)
+    report["degrees"] = degrees(graph, top)
+    report["duplicates"] = duplicates(graph)
+    report["indexes"] = index_coverage(graph, list(report["counts"]["nodes_by_label"]))
+    entities = entities or sample_entities(graph, sample, report["degrees"]["top_hubs"][:3])
+    report["retrieval_entities"] = entities
+    report["retrieval"] = retrieval_profile(graph, entities, report["indexes"]["fulltext_index"] == "ONLINE")
+    report["warnings"] = warnings_for(report)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_community.graphs import Neo4jGraph
+
+    parser = argparse.ArgumentParser(description="Graph health and retrieval-cost diagnostics (JSON).")
+    parser.add_argument("--output", help="Write the report here instead of stdout")
+    parser.add_argument("--sample", type=int, default=20, help="Random entities to profile the retrieval queries with")
+    parser.add_argument("--entities", help="Comma-separated entities to profile instead of a sample")
+    parser.add_argument("--top", type=int, default=20, help="Hub nodes to list")
+    parser.add_argument("--fail-on-scan", action="store_true", help="Exit 1 when a retrieval query plan contains a scan")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("NEO4J_PASSWORD"):
+        raise ValueError("❌ NEO4J_PASSWORD not found. Please check your .env file.")
+    graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"),
+                       password=os.getenv("NEO4J_PASSWORD"), refresh_schema=False)
+
+    entities = [e.strip() for e in args.entities.split(",") if e.strip()] if args.entities else None
+    report = inspect(graph, args.sample, entities, args.top)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Report saved to: {args.output}")
+        for warning in report["warnings"]:
+            print(f"⚠️  {warning}", file=sys.stderr)
+    else:
+        print(text)
+    scanning = any(isinstance(q, dict) and q.get("scans") for site in report["retrieval"].values()
+                   if isinstance(site, dict) for q in site.values())
+    if args.fail_on_scan and scanning:
+        sys.exit(1)
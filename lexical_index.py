@@ -0,0 +1,420 @@
+"""Local BM25 index over the Chroma chunks, fused with dense retrieval.
+
+MiniLM alone misses questions that hinge on rare terms and abbreviations
+("TERPT", drug names, gene symbols), and raising k to make up for it makes
+the prompt bigger. BM25 catches those. Reciprocal rank fusion merges both
+rankings, and the result is still k chunks.
+
+The index is a list of immutable segments. Each one is a term-major CSR
+matrix (indptr / doc / tf arrays, plus sorted terms and chunk ids), stored as
+.npy files and memory-mapped. VectorIndexBuilder writes one segment per
+build, using the same chunk ids as Chroma, and records deleted
+chunks as tombstones. Once there are more than MAX_SEGMENTS, segments are
+merged. manifest.json lists the live segments and is replaced atomically,
+so readers pick up a new build on their next query. Segments a manifest
+drops are deleted one generation later, as a reader may still be opening them.
+
+    python lexical_index.py "cyclosporine graft versus host disease"   # (re)build from Chroma if needed, then query
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from telemetry import span
+from text_tokens import tokens
+
+K1, B = 1.2, 0.75
+RRF_K = 60
+MAX_SEGMENTS = 8
+SEGMENT_DOCS = 50000  # pending chunks written as a segment before the build ends
+MAX_TERM_LENGTH = 32  # longer "words" are URLs, sequences and the like
+# Candidates each ranking contributes to the fusion (MEDGRAPH_FUSION_CANDIDATES, read by retriever_for)
+FUSION_CANDIDATES = 8
+
+
+def chunk_id(record_id, text):
+    """Content hash scoped to its record: the same text in two records is two chunks, so
+    cleaning up one record never deletes a chunk another record still has."""
+    return hashlib.sha256(f"{record_id}\0{text}".encode("utf-8")).hexdigest()
+
+
+def lexical_path(chroma_path):
+    """The index lives next to the Chroma store it mirrors: ./medical_chroma_db -> ./medical_chroma_db_bm25."""
+    return os.path.normpath(chroma_path) + "_bm25"
+
+
+def tokenize(text):
+    """text_tokens.tokens, plus the parts of hyphenated words ("graft-versus-host" also gives "graft", ...)."""
+    out = []
+    for token in tokens(text):
+        if len(token) > MAX_TERM_LENGTH:
+            continue
+        out.append(token)
+        if "-" in token:
+            out.extend(part for part in token.split("-") if len(part) > 1)
+    return out
+
+
+def save_segment(path, terms, chunk_ids, term_ids, doc_ids, tfs, doc_len):
+    """Writes one CSR segment. `terms` must be sorted; (term_ids, doc_ids, tfs) are the nonzeros."""
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    order = np.lexsort((doc_ids, term_ids))
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=indptr[1:])
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "terms.npy"), np.asarray(terms, dtype=f"S{max((len(t) for t in terms), default=1)}"))
+    np.save(os.path.join(tmp, "chunk_ids.npy"), np.asarray(chunk_ids, dtype=f"S{max((len(c) for c in chunk_ids), default=1)}"))
+    np.save(os.path.join(tmp, "indptr.npy"), indptr)
+    np.save(os.path.join(tmp, "docs.npy"), doc_ids[order])
+    np.save(os.path.join(tmp, "tfs.npy"), np.minimum(np.asarray(tfs, dtype=np.int64), 65535).astype(np.uint16)[order])
+    np.save(os.path.join(tmp, "doc_len.npy"), np.asarray(doc_len, dtype=np.int32))
+    os.replace(tmp, path)
+
+
+def build_segment(path, docs):
+    """docs: [(chunk_id, [token, ...])]; a chunk added twice keeps its last tokens."""
+    docs = list(dict(docs).items())
+    counts = [Counter(t.encode("utf-8") for t in toks) for _, toks in docs]
+    terms = sorted(set().union(*counts)) if counts else []
+    index = {t: i for i, t in enumerate(terms)}
+    term_ids, doc_ids, tfs = [], [], []
+    for doc, counter in enumerate(counts):
+        for term, tf in counter.items():
+            term_ids.append(index[term])
+            doc_ids.append(doc)
+            tfs.append(tf)
+    save_segment(path, terms, [cid.encode("utf-8") for cid, _ in docs], term_ids, doc_ids, tfs,
+                 [len(toks) for _, toks in docs])
+
+
+class Segment:
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.terms = load("terms")
+        self.chunk_ids = load("chunk_ids")
+        self.indptr = load("indptr")
+        self.docs = load("docs")
+        self.tfs = load("tfs")
+        self.doc_len = load("doc_len")
+        self.live = np.ones(len(self.chunk_ids), dtype=bool)
+
+    def postings(self, term):
+        """(doc indices, term frequencies) of `term` (bytes), or None."""
+        i = int(np.searchsorted(self.terms, term))
+        if i >= len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def nonzeros(self):
+        """(term bytes, doc, tf) of every posting, for merging."""
+        per_term = np.diff(self.indptr)
+        return np.repeat(np.asarray(self.terms), per_term), np.asarray(self.docs), np.asarray(self.tfs)
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # the open segments
+        self.write_lock = threading.Lock()
+        self.manifest_mtime = None
+        self.segments = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.live_docs = 0
+        self.avgdl = 0.0
+        self.pending = []  # (chunk_id, tokens) not committed yet
+        self.pending_deletes = set()
+
+    # --- Reading ---
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"generation": 0, "segments": [], "deleted": []}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def refresh(self):
+        """Reopens the segments if a build committed since the last look (one stat() otherwise)."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.manifest_mtime:
+            return
+        manifest = self.read_manifest()
+        with self.lock:
+            opened = {s.name: s for s in self.segments}
+        segments = [opened.get(name) or Segment(os.path.join(self.path, name)) for name in manifest["segments"]]
+        # A chunk is live in the newest segment that has it, unless it was deleted since
+        hidden = np.asarray([d.encode("utf-8") for d in manifest["deleted"]], dtype="S64")
+        for segment in reversed(segments):
+            segment.live = ~np.isin(segment.chunk_ids, hidden) if len(hidden) else np.ones(len(segment.chunk_ids), dtype=bool)
+            hidden = np.concatenate([hidden, np.asarray(segment.chunk_ids)]) if len(hidden) else np.asarray(segment.chunk_ids)
+        live_docs = sum(int(s.live.sum()) for s in segments)
+        total_len = sum(int(np.asarray(s.doc_len)[s.live].sum()) for s in segments)
+        with self.lock:
+            self.segments = segments
+            self.offsets = np.cumsum([0] + [len(s.chunk_ids) for s in segments])
+            self.live_docs = live_docs
+            self.avgdl = total_len / live_docs if live_docs else 0.0
+            self.manifest_mtime = mtime
+
+    def live_count(self):
+        self.refresh()
+        return self.live_docs
+
+    def search(self, query, k=10):
+        """[(chunk_id, bm25 score)] best first."""
+        self.refresh()
+        with self.lock:
+            segments, offsets, n, avgdl = self.segments, self.offsets, self.live_docs, self.avgdl
+        if not n:
+            return []
+        keys, weights = [], []
+        for term in dict.fromkeys(tokenize(query)):
+            hits = []
+            for i, segment in enumerate(segments):
+                found = segment.postings(term.encode("utf-8"))
+                if found is None:
+                    continue
+                docs, tfs = found
+                live = segment.live[docs]
+                if live.any():
+                    hits.append((i, segment, docs[live], tfs[live]))
+            df = sum(len(docs) for _, _, docs, _ in hits)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, segment, docs, tfs in hits:
+                tf = tfs.astype(np.float32)
+                norm = K1 * (1 - B + B * segment.doc_len[docs] / avgdl)
+                keys.append(offsets[i] + docs)
+                weights.append(idf * tf * (K1 + 1) / (tf + norm))
+        if not keys:
+            return []
+        docs, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = []
+        for j in top:
+            i = int(np.searchsorted(offsets, docs[j], side="right")) - 1
+            results.append((segments[i].chunk_ids[docs[j] - offsets[i]].decode("utf-8"), float(scores[j])))
+        return results
+
+    # --- Writing (one writer: the index builder) ---
+    def add(self, docs):
+        """docs: [(chunk_id, text)]. Visible to readers after commit()."""
+        with self.write_lock:
+            self.pending.extend((cid, tokenize(text)) for cid, text in docs)
+            self.pending_deletes.difference_update(cid for cid, _ in docs)
+            full = len(self.pending) >= SEGMENT_DOCS
+        if full:
+            self.commit()
+
+    def delete(self, chunk_ids):
+        chunk_ids = set(chunk_ids)
+        with self.write_lock:
+            self.pending_deletes.update(chunk_ids)
+            self.pending = [(cid, toks) for cid, toks in self.pending if cid not in chunk_ids]
+
+    def commit(self):
+        """Writes pending chunks as a new segment, applies deletions and merges when there are too many segments."""
+        with self.write_lock:
+            manifest = self.read_manifest()
+            if not self.pending and not self.pending_deletes:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            generation = manifest["generation"] + 1
+            segments = list(manifest["segments"])
+            deleted = set(manifest["deleted"]) | self.pending_deletes
+            if self.pending:
+                name = f"seg_{generation:06d}"
+                build_segment(os.path.join(self.path, name), self.pending)
+                segments.append(name)
+                deleted -= {cid for cid, _ in self.pending}
+            if len(segments) > MAX_SEGMENTS:
+                segments, deleted = self._merge(segments, deleted, generation)
+            self._write_manifest({"generation": generation, "segments": segments, "deleted": sorted(deleted)})
+            self.pending, self.pending_deletes = [], set()
+        self.refresh()
+
+    def _merge(self, names, deleted, generation):
+        """One segment with every live chunk of `names`; tombstones are no longer needed after it."""
+        self.manifest_mtime = None
+        self._write_manifest({"generation": generation, "segments": names, "deleted": sorted(deleted)})
+        self.refresh()
+        with self.lock:
+            segments = list(self.segments)
+        terms, docs, tfs, chunk_ids, doc_len = [], [], [], [], []
+        base = 0
+        for segment in segments:
+            # New doc numbers: live docs only, in segment order
+            remap = np.cumsum(segment.live) - 1 + base
+            t, d, f = segment.nonzeros()
+            keep = segment.live[d]
+            terms.append(t[keep])
+            docs.append(remap[d[keep]])
+            tfs.append(f[keep])
+            chunk_ids.append(np.asarray(segment.chunk_ids)[segment.live])
+            doc_len.append(np.asarray(segment.doc_len)[segment.live])
+            base += int(segment.live.sum())
+        vocabulary, term_ids = np.unique(np.concatenate(terms), return_inverse=True)
+        name = f"seg_{generation:06d}_merged"
+        save_segment(os.path.join(self.path, name), vocabulary, np.concatenate(chunk_ids), term_ids,
+                     np.concatenate(docs), np.concatenate(tfs), np.concatenate(doc_len))
+        print(f"🗜️  Lexical index: merged {len(names)} segments ({base} chunks).")
+        return [name], set()
+
+    def _write_manifest(self, manifest):
+        previous = self.read_manifest()
+        dropped = [name for name in previous["segments"] if name not in manifest["segments"]]
+        # Kept until the next generation: a reader of the previous manifest may not have opened them yet
+        if manifest["generation"] == previous["generation"]:
+            dropped += previous.get("retired", [])
+        manifest = {**manifest, "retired": sorted(set(dropped) - set(manifest["segments"]))}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+        # Readers still holding a removed segment keep their mmaps (the files stay until closed)
+        keep = set(manifest["segments"]) | set(manifest["retired"])
+        for entry in os.listdir(self.path):
+            if entry.startswith("seg_") and entry not in keep:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def rebuild(self, docs):
+        """Replaces the whole index with `docs` [(chunk_id, text)], e.g. from an existing Chroma collection."""
+        with self.write_lock:
+            self.pending, self.pending_deletes = [], set()
+            if os.path.exists(self.manifest_path):
+                manifest = self.read_manifest()
+                self._write_manifest({"generation": manifest["generation"] + 1, "segments": [], "deleted": []})
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= 1000:
+                self.add(batch)
+                batch = []
+        self.add(batch)
+        self.commit()
+
+
+def iter_collection(collection, page_size=1000):
+    """(chunk_id, text) for every chunk of a Chroma collection."""
+    offset = 0
+    while True:
+        rows = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not rows["ids"]:
+            return
+        yield from zip(rows["ids"], rows["documents"])
+        offset += len(rows["ids"])
+
+
+# --- Query time ---
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Ids from several best-first rankings, ordered by sum(1 / (k + rank)). Ties keep the first ranking's order."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class FusionRetriever:
+    """Drop-in for vector_db.as_retriever(search_kwargs={"k": k}): invoke(question) -> k Documents.
+
+    Dense and BM25 each contribute `candidates` chunks; RRF picks the k best.
+    With an empty (or unreadable) lexical index it is plain dense top-k.
+    """
+
+    def __init__(self, vector_db, lexical_index, k=4, candidates=FUSION_CANDIDATES):
+        self.vector_db = vector_db
+        self.lexical_index = lexical_index
+        self.k = k
+        self.candidates = max(candidates, k)
+
+    def dense_search(self, question):
+        """{chunk id: Document} of the dense candidates, best first, keyed by the ids Chroma stores."""
+        from langchain_core.documents import Document
+
+        embedding = self.vector_db._embedding_function.embed_query(question)
+        rows = self.vector_db._collection.query(query_embeddings=[embedding], n_results=self.candidates,
+                                                include=["documents", "metadatas"])
+        return {cid: Document(page_content=text, metadata=metadata or {})
+                for cid, text, metadata in zip(rows["ids"][0], rows["documents"][0], rows["metadatas"][0])}
+
+    def invoke(self, question):
+        from langchain_core.documents import Document
+
+        by_id = self.dense_search(question)
+        with span("lexical_retrieval") as s:
+            try:
+                lexical = self.lexical_index.search(question, self.candidates)
+            except (OSError, ValueError) as e:
+                # e.g. a segment deleted under a very slow reader: dense still answers
+                s.set(error=type(e).__name__)
+                lexical = []
+            s.set(results=len(lexical))
+        if not lexical:
+            return list(by_id.values())[: self.k]
+        fused = reciprocal_rank_fusion([list(by_id), [cid for cid, _ in lexical]])[: self.k]
+        missing = [cid for cid in fused if cid not in by_id]
+        if missing:
+            rows = self.vector_db.get(ids=missing, include=["documents", "metadatas"])
+            for cid, text, metadata in zip(rows["ids"], rows["documents"], rows["metadatas"]):
+                by_id[cid] = Document(page_content=text, metadata=metadata or {})
+        return [by_id[cid] for cid in fused if cid in by_id]
+
+
+def retriever_for(vector_db, chroma_path, k):
+    """What app.py and hybrid_rag.py retrieve chunks with.
+
+    MEDGRAPH_RETRIEVAL is "hybrid" (dense + BM25, fused; the default) or "dense" (Chroma
+    alone). Both are read here rather than at import, after the callers' load_dotenv().
+    """
+    if os.getenv("MEDGRAPH_RETRIEVAL", "hybrid") == "dense":
+        return vector_db.as_retriever(search_kwargs={"k": k})
+    candidates = int(os.getenv("MEDGRAPH_FUSION_CANDIDATES", str(FUSION_CANDIDATES)))
+    return FusionRetriever(vector_db, LexicalIndex(lexical_path(chroma_path)), k, candidates)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import chromadb
+    from vector_index import CHROMA_PATH, COLLECTION_NAME
+
+    parser = argparse.ArgumentParser(description="Query the BM25 index (rebuilt from Chroma when out of sync).")
+    parser.add_argument("query")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=args.chroma_path).get_or_create_collection(COLLECTION_NAME)
+    index = LexicalIndex(lexical_path(args.chroma_path))
+    if index.live_count() != collection.count():
+        print(f"Rebuilding {index.path} from {collection.count()} Chroma chunks...")
+        index.rebuild(iter_collection(collection))
+    index.search(args.query, args.k)  # warm the page cache
+    start = time.perf_counter()
+    results = index.search(args.query, args.k)
+    print(f"{index.live_count()} chunks, {len(index.segments)} segments: {(time.perf_counter() - start) * 1000:.3f} ms")
+    rows = collection.get(ids=[cid for cid, _ in results], include=["documents"]) if results else {"ids": [], "documents": []}
+    texts = dict(zip(rows["ids"], rows["documents"]))
+    for cid, score in results:
+        print(f"\n{score:.2f}  {texts.get(cid, '')[:200]}")
@@ -0,0 +1,167 @@
+"""Request coalescing in front of the Groq LLM.
+
+Every Groq call spends one slot of the requests-per-minute quota, whatever its
+size. Under bursty load two things recover those slots:
+
+- SingleFlight: identical prompts already in flight share one call.
+- MicroBatcher: requests arriving within a short window are packed into one
+  call (BatchedEntityExtractor asks for all their entities as one JSON object)
+  and the results are split back per request.
+"""
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from telemetry import metrics
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result (or error)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def run(self, key, fn):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+        if not leader:
+            metrics.incr("medgraph_llm_coalesced_total", kind=self.name, how="dedupe")
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+class MicroBatcher:
+    """Collects items for up to `window` seconds (or `max_batch` items) and runs batch_fn on them.
+
+    batch_fn(items) must return one result per item, in order. Batches run on
+    their own threads, so collection of the next batch starts immediately.
+    """
+
+    def __init__(self, batch_fn, window=0.02, max_batch=8, concurrency=4, name="batch"):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"{name}-batch")
+        self.collector = threading.Thread(target=self._collect, name=f"{name}-collector", daemon=True)
+        self.collector.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self._execute, batch)
+
+    def _execute(self, batch):
+        items = [item for item, _ in batch]
+        # Mean batch size = items / batches (a size label would make one series per size)
+        metrics.incr("medgraph_llm_batches_total", kind=self.name)
+        metrics.incr("medgraph_llm_batch_items_total", len(batch), kind=self.name)
+        if len(batch) > 1:
+            metrics.incr("medgraph_llm_coalesced_total", len(batch) - 1, kind=self.name, how="batch")
+        try:
+            results = self.batch_fn(items)
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a medical entity extractor. For each numbered question, extract the main medical "
+    "entities (diseases, drugs). Return ONLY a JSON object mapping every question number to a list "
+    'of entity strings, for example {{"1": ["GVHD", "Cyclosporine"], "2": []}}.'
+)
+
+
+def parse_batch_reply(raw, count):
+    """{index: [entities]} from the model's JSON; indices it skipped or mangled are left out."""
+    match = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    parsed = {}
+    for key, value in data.items() if isinstance(data, dict) else []:
+        if str(key).isdigit() and 1 <= int(key) <= count and isinstance(value, list):
+            parsed[int(key) - 1] = [str(v).strip() for v in value if str(v).strip()]
+    return parsed
+
+
+class BatchedEntityExtractor:
+    """One extractor call for every question that arrives within the window.
+
+    A lone question uses the regular single-question prompt; questions the
+    batched reply does not cover are retried one by one, so batching never
+    loses a result. window=0 turns coalescing off.
+    """
+
+    def __init__(self, llm, single_extract, window=0.02, max_batch=8):
+        self.single_extract = single_extract  # question -> [entity, ...]
+        self.batch_chain = ChatPromptTemplate.from_messages([
+            ("system", BATCH_SYSTEM_PROMPT),
+            ("human", "{questions}")
+        ]) | llm | StrOutputParser()
+        self.flight = SingleFlight("extraction")
+        self.batcher = MicroBatcher(self.extract_batch, window, max_batch, name="extraction") if window > 0 else None
+
+    def extract_batch(self, questions):
+        if len(questions) == 1:
+            metrics.incr("medgraph_llm_calls_total", kind="extraction")
+            return [self.single_extract(questions[0])]
+        # One line per question: a newline in one question must not start another's entry
+        numbered = "\n".join(f"{i + 1}. {' '.join(q.split())}" for i, q in enumerate(questions))
+        metrics.incr("medgraph_llm_calls_total", kind="extraction")
+        parsed = parse_batch_reply(self.batch_chain.invoke({"questions": numbered}), len(questions))
+        results = []
+        for i, question in enumerate(questions):
+            if i not in parsed:
+                metrics.incr("medgraph_llm_calls_total", kind="extraction")
+                parsed[i] = self.single_extract(question)
+            results.append(parsed[i])
+        return results
+
+    def extract(self, question):
+        key = " ".join(question.lower().split())
+        if self.batcher is None:
+            return self.flight.run(key, lambda: self.extract_batch([question])[0])
+        return self.flight.run(key, lambda: self.batcher.submit(question).result())
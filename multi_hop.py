@@ -0,0 +1,207 @@
+"""Bounded multi-hop retrieval ("Drug A TREATS Disease B, Disease B CAUSES Symptom C").
+
+A beam search over the graph, hop by hop, instead of a variable-length Cypher
+pattern: every hop is capped by fan-out and beam width, high-degree hub nodes
+are never expanded through, and the whole search stops at a time budget
+(against Neo4j, each query runs with the remaining budget as its transaction
+timeout). Works against the local CSR snapshot or against Neo4j (one query
+per hop).
+"""
+import math
+import time
+
+from canonicalize import ENTITY_LABEL
+from graph_lookup import FULLTEXT_INDEX, clean_entity, lookup_params
+from graph_snapshot import OUTGOING
+
+# Relationship weights for path scoring; unlisted types get DEFAULT_REL_WEIGHT
+REL_WEIGHTS = {"TREATS": 1.0, "CAUSES": 1.0, "PREVENTS": 0.9, "AFFECTS": 0.8, "ASSOCIATED_WITH": 0.6, "IS_A": 0.7}
+DEFAULT_REL_WEIGHT = 0.5
+HOP_DECAY = 0.8
+# Neighbors per node whose degree is looked at before the fan_out lowest are kept
+CANDIDATE_FACTOR = 4
+
+
+class SnapshotBackend:
+    """Neighbors from a GraphSnapshot (keys are node indices)."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def resolve(self, entities, node_limit, timeout=None):
+        return {clean_entity(e): self.snapshot.resolve(e, node_limit) for e in entities}
+
+    def name(self, node):
+        return self.snapshot.node_ids[node]
+
+    def expand(self, frontier, rel_types, fan_out, timeout=None):
+        """Returns {node: [(neighbor, rel, outgoing, neighbor_degree), ...]} with at most fan_out per node."""
+        snap = self.snapshot
+        result = {}
+        for node in frontier:
+            edges = []
+            for neighbor, rel, direction in snap.neighbors_of(node):
+                rel_name = snap.rel_names[rel]
+                if rel_types and rel_name not in rel_types:
+                    continue
+                edges.append((neighbor, rel_name, direction == OUTGOING, snap.degree(neighbor)))
+            # Prefer specific (low-degree) neighbors over hubs
+            edges.sort(key=lambda e: e[3])
+            result[node] = edges[:fan_out]
+        return result
+
+
+class Neo4jBackend:
+    """Neighbors from Neo4j, one bounded query per hop (keys are elementIds)."""
+
+    # Equality on the indexed norm_id first; full-text only for what that misses
+    EXACT_RESOLVE_QUERY = f"""
+    UNWIND $entities AS entity
+    MATCH (node:{ENTITY_LABEL} {{norm_id: entity.key}})
+    WITH entity, collect({{key: elementId(node), name: node.id, score: 2.0}}) AS nodes
+    RETURN entity.name AS entity, nodes[..$node_limit] AS nodes
+    """
+
+    RESOLVE_QUERY = """
+    UNWIND $entities AS entity
+    CALL db.index.fulltext.queryNodes($index_name, entity.query, {limit: $node_limit}) YIELD node, score
+    RETURN entity.name AS entity, collect({key: elementId(node), name: node.id, score: score}) AS nodes
+    """
+
+    EXPAND_QUERY = """
+    UNWIND $frontier AS key
+    MATCH (n) WHERE elementId(n) = key
+    CALL {
+        WITH n
+        MATCH (n)-[r]-(m)
+        WHERE $rel_types IS NULL OR type(r) IN $rel_types
+        // Degrees are only counted for a bounded sample, not for every neighbor of a big node
+        WITH r, m LIMIT $candidates
+        WITH r, m, startNode(r) = n AS outgoing, COUNT { (m)--() } AS degree
+        ORDER BY degree ASC
+        LIMIT $fan_out
+        RETURN collect({key: elementId(m), name: m.id, rel: type(r), outgoing: outgoing, degree: degree}) AS edges
+    }
+    RETURN key, edges
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.names = {}
+
+    def query(self, query, params, timeout=None):
+        """graph.query, with `timeout` seconds as the transaction timeout when there is a driver.
+
+        Raises TimeoutError when Neo4j aborts the query for taking too long.
+        """
+        driver = getattr(self.graph, "_driver", None)
+        if driver is None or timeout is None:
+            return self.graph.query(query, params)
+        from neo4j import Query
+        from neo4j.exceptions import ClientError
+        try:
+            records, _, _ = driver.execute_query(Query(query, timeout=max(timeout, 0.001)),
+                                                 parameters_=params, database_=getattr(self.graph, "_database", None))
+        except ClientError as e:
+            if "TransactionTimedOut" in (e.code or ""):
+                raise TimeoutError(e.message) from e
+            raise
+        return [record.data() for record in records]
+
+    def resolve(self, entities, node_limit, timeout=None):
+        params = lookup_params(entities)
+        args = {"entities": params, "index_name": FULLTEXT_INDEX, "node_limit": node_limit}
+        started = time.monotonic()
+        rows = self.query(self.EXACT_RESOLVE_QUERY, args, timeout)
+        found = {row["entity"] for row in rows}
+        args["entities"] = [p for p in params if p["name"] not in found]
+        if args["entities"]:
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            rows += self.query(self.RESOLVE_QUERY, args, remaining)
+        resolved = {}
+        for row in rows:
+            resolved[row["entity"]] = [(n["key"], n["score"]) for n in row["nodes"]]
+            self.names.update({n["key"]: n["name"] for n in row["nodes"]})
+        return resolved
+
+    def name(self, node):
+        return self.names.get(node, node)
+
+    def expand(self, frontier, rel_types, fan_out, timeout=None):
+        params = {"frontier": list(frontier), "rel_types": rel_types or None, "fan_out": fan_out,
+                  "candidates": fan_out * CANDIDATE_FACTOR}
+        rows = self.query(self.EXPAND_QUERY, params, timeout)
+        result = {}
+        for row in rows:
+            result[row["key"]] = [(e["key"], e["rel"], e["outgoing"], e["degree"]) for e in row["edges"]]
+            self.names.update({e["key"]: e["name"] for e in row["edges"]})
+        return result
+
+
+def expand_paths(backend, entities, depth=2, fan_out=10, beam_width=20, rel_types=None,
+                 max_degree=100, time_budget=0.5, node_limit=3, max_paths=15):
+    """Returns (paths, truncated). A path is {"score", "hops": [(source, rel, target), ...]}.
+
+    - fan_out: neighbors taken per node per hop (lowest degree first)
+    - beam_width: partial paths kept after each hop
+    - max_degree: nodes above this degree are hubs and are never expanded through
+    - time_budget: seconds; the search returns what it has when it runs out
+      (a query still running then is aborted by Neo4j)
+    """
+    deadline = time.monotonic() + time_budget
+    beam = []  # (score, path_nodes, hops)
+    try:
+        resolved = backend.resolve(entities, node_limit, timeout=time_budget)
+    except TimeoutError:
+        return [], True
+    for _, nodes in resolved.items():
+        for node, score in nodes:
+            beam.append((float(score), [node], []))
+
+    finished = []
+    truncated = False
+    for _ in range(depth):
+        if not beam:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            truncated = True
+            break
+        try:
+            expansions = backend.expand({path[-1] for _, path, _ in beam}, rel_types, fan_out, timeout=remaining)
+        except TimeoutError:
+            truncated = True
+            break
+        next_beam = []
+        for score, path, hops in beam:
+            for neighbor, rel, outgoing, degree in expansions.get(path[-1], []):
+                if neighbor in path:
+                    continue  # no cycles
+                source, target = (path[-1], neighbor) if outgoing else (neighbor, path[-1])
+                step = REL_WEIGHTS.get(rel, DEFAULT_REL_WEIGHT) * (HOP_DECAY ** len(hops))
+                # Hubs make weak evidence: damp by log-degree
+                new_score = score * step / math.log(2 + degree)
+                candidate = (new_score, path + [neighbor], hops + [(source, rel, target)])
+                finished.append(candidate)
+                if degree <= max_degree:
+                    next_beam.append(candidate)
+        next_beam.sort(key=lambda c: c[0], reverse=True)
+        beam = next_beam[:beam_width]
+
+    finished.sort(key=lambda c: c[0], reverse=True)
+    paths = []
+    seen = set()
+    for score, _, hops in finished:
+        named = tuple((backend.name(s), rel, backend.name(t)) for s, rel, t in hops)
+        if named in seen:
+            continue
+        seen.add(named)
+        paths.append({"score": round(score, 4), "hops": list(named)})
+        if len(paths) >= max_paths:
+            break
+    return paths, truncated
+
+
+def format_paths(paths):
+    """One line per path: "A TREATS B -> B CAUSES C"."""
+    return "\n".join(" -> ".join(f"{s} {rel} {t}" for s, rel, t in p["hops"]) for p in paths)
@@ -0,0 +1,298 @@
+"""Deterministic local stand-ins for Groq, Neo4j and the embedding model.
+
+Only benchmark.py uses these: before importing hybrid_rag.py and
+full_scale_builder.py it swaps their client classes for these stand-ins
+(see install()), so it can measure pipeline overhead without credentials or
+network noise. Production modules never import this file.
+
+- FakeChatModel: a LangChain chat model with configurable latency and output
+- FakeGraphTransformer: LLMGraphTransformer's contract, one "call" per document
+- InMemoryGraph: answers the exact Cypher queries the pipeline sends to Neo4j
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+from bulk_writer import BULK_QUERY_PREFIX
+from entity_dictionary import NODE_IDS_QUERY
+from graph_lookup import EXACT_LOOKUP_QUERY, INDEXED_LOOKUP_QUERY, SCAN_LOOKUP_QUERY
+from graph_snapshot import NODES_QUERY, EDGES_QUERY
+from multi_hop import Neo4jBackend
+
+# Backtick-quoted labels / types in BulkWriter's queries (bulk_writer.quote)
+_QUOTED_NAME = re.compile(r"`((?:[^`]|``)*)`")
+
+# MiniLM's dimension, so vector sizes (and Chroma's work) match production
+EMBEDDING_DIM = 384
+
+
+def stable_hash(text):
+    """Same value in every process (unlike hash())."""
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers instantly (or after `latency` seconds) with text derived from the prompt.
+
+    Extraction prompts get the capitalized words of the question back as a
+    comma-separated list, grading prompts get a score, and everything else gets
+    an `answer_words`-word answer streamed at `token_latency` seconds per word.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self):
+        return "medgraph-fake"
+
+    def respond(self, messages):
+        system = " ".join(m.content for m in messages if isinstance(m, SystemMessage))
+        human = " ".join(m.content for m in messages if isinstance(m, HumanMessage))
+        if "entit" in system.lower() and "json" in system.lower():
+            questions = re.findall(r"^(\d+)\. (.*)$", human, re.MULTILINE)
+            return json.dumps({n: self.respond([SystemMessage(content="entities"), HumanMessage(content=q)]).split(", ")
+                               for n, q in questions})
+        if "entit" in system.lower():
+            words = re.findall(r"\b[A-Z][\w-]{2,}", human)
+            return ", ".join(dict.fromkeys(words[1:] if len(words) > 1 else words))
+        if "grader" in human.lower():
+            return str(1 + stable_hash(human) % 5)
+        words = re.findall(r"\w+", human) or ["answer"]
+        return " ".join(words[i % len(words)] for i in range(self.answer_words))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages)
+        time.sleep(self.latency + self.token_latency * len(text.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, word in enumerate(self.respond(messages).split()):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+
+
+class FakeGraphTransformer:
+    """Drop-in for LLMGraphTransformer.convert_to_graph_documents.
+
+    Capitalized words become nodes and consecutive ones are linked, with labels
+    and relationship types picked deterministically from the allowed lists.
+    """
+
+    def __init__(self, allowed_nodes, allowed_relationships, latency=0.0):
+        self.allowed_nodes = allowed_nodes
+        self.allowed_relationships = allowed_relationships
+        self.latency = latency  # seconds per document, like one LLM request each
+
+    def convert_to_graph_documents(self, documents):
+        time.sleep(self.latency * len(documents))
+        graph_documents = []
+        for doc in documents:
+            names = list(dict.fromkeys(re.findall(r"\b[A-Z][a-z]{3,}\b", doc.page_content)))
+            nodes = [Node(id=n, type=self.allowed_nodes[stable_hash(n) % len(self.allowed_nodes)]) for n in names]
+            relationships = [
+                Relationship(source=a, target=b, type=self.allowed_relationships[stable_hash(a.id + b.id) % len(self.allowed_relationships)])
+                for a, b in zip(nodes, nodes[1:])
+            ]
+            graph_documents.append(GraphDocument(nodes=nodes, relationships=relationships, source=doc))
+        return graph_documents
+
+
+class InMemoryGraph:
+    """Neo4jGraph stand-in. Node ids double as element ids; full-text scoring
+    follows GraphSnapshot.resolve (exact id 2.0, substring 1.0)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = {}  # id -> label
+        self.edges = set()  # (source, rel, target)
+        self.adjacency = {}  # id -> [(neighbor, rel, outgoing)]
+        self.by_norm_id = {}  # norm_id -> ids, for nodes written by BulkWriter
+        self.aliases = {}  # id -> aliases
+        self.handlers = {
+            EXACT_LOOKUP_QUERY: self._exact_lookup,
+            INDEXED_LOOKUP_QUERY: self._lookup,
+            SCAN_LOOKUP_QUERY: self._lookup,
+            NODE_IDS_QUERY: lambda params: [{"id": n, "aliases": sorted(self.aliases.get(n, ()))} for n in self.labels],
+            NODES_QUERY: lambda params: [{"eid": n, "id": n, "labels": [l]} for n, l in self.labels.items()],
+            EDGES_QUERY: lambda params: [{"source": s, "rel": r, "target": t} for s, r, t in self.edges],
+            Neo4jBackend.EXACT_RESOLVE_QUERY: self._exact_resolve_rows,
+            Neo4jBackend.RESOLVE_QUERY: self._resolve_rows,
+            Neo4jBackend.EXPAND_QUERY: self._expand_rows,
+            "CALL db.labels() YIELD label RETURN label": lambda params: [{"label": l} for l in set(self.labels.values())],
+            "CALL db.awaitIndex($name, $seconds)": lambda params: [],
+            "MATCH (n) DETACH DELETE n": self._clear,
+            "RETURN 1 AS ok": lambda params: [{"ok": 1}],
+        }
+
+    # --- Writes ---
+    def add_graph_documents(self, graph_documents, include_source=False, baseEntityLabel=False):
+        with self.lock:
+            for doc in graph_documents:
+                for node in doc.nodes:
+                    self.labels.setdefault(str(node.id), node.type)
+                for rel in doc.relationships:
+                    self._add_edge(str(rel.source.id), rel.source.type, rel.type, str(rel.target.id), rel.target.type)
+
+    def _add_edge(self, source, source_label, rel, target, target_label):
+        self.labels.setdefault(source, source_label)
+        self.labels.setdefault(target, target_label)
+        if (source, rel, target) not in self.edges:
+            self.edges.add((source, rel, target))
+            self.adjacency.setdefault(source, []).append((target, rel, True))
+            self.adjacency.setdefault(target, []).append((source, rel, False))
+
+    def _bulk_merge(self, query, params):
+        """BulkWriter's UNWIND batches; labels and types are read from the MERGE patterns of the query."""
+        names = [name.replace("``", "`") for name in _QUOTED_NAME.findall(query)]
+        with self.lock:
+            for row in params["rows"]:
+                if len(names) == 1:  # MERGE (n:Label {id: row.id})
+                    self.labels.setdefault(row["id"], names[0])
+                    if row["id"] not in self.by_norm_id.setdefault(row["norm_id"], []):
+                        self.by_norm_id[row["norm_id"]].append(row["id"])
+                    self.aliases.setdefault(row["id"], set()).update(row["aliases"])
+                else:  # MERGE (s:Source ...) MERGE (t:Target ...) MERGE (s)-[r:Type]->(t)
+                    source_label, target_label, rel_type = names
+                    self._add_edge(row["source"], source_label, rel_type, row["target"], target_label)
+        return []
+
+    def _clear(self, params):
+        with self.lock:
+            self.labels, self.edges, self.adjacency, self.by_norm_id, self.aliases = {}, set(), {}, {}, {}
+        return []
+
+    # --- Reads ---
+    def query(self, query, params=None):
+        params = params or {}
+        if query.startswith(("CREATE FULLTEXT INDEX", "CREATE INDEX", "CREATE CONSTRAINT")):
+            return []
+        if query.startswith(BULK_QUERY_PREFIX):
+            return self._bulk_merge(query, params)
+        handler = self.handlers.get(query)
+        if handler is None:
+            raise NotImplementedError(f"InMemoryGraph does not answer this query: {query.strip()[:80]}")
+        return handler(params)
+
+    def _match(self, name, node_limit):
+        name = name.lower()
+        exact = [(n, 2.0) for n in self.labels if n.lower() == name]
+        if exact:
+            return exact[:node_limit]
+        return [(n, 1.0) for n in self.labels if name in n.lower()][:node_limit]
+
+    def _exact(self, key, node_limit):
+        return [(n, 2.0) for n in self.by_norm_id.get(key, [])[:node_limit]]
+
+    def _exact_lookup(self, params):
+        # Like the Cypher, entities without a matching node (or relationships) return no row
+        return [row for row in self._lookup(params, self._exact) if row["triples"]]
+
+    def _lookup(self, params, match=None):
+        rows = []
+        for entity in params["entities"]:
+            triples = []
+            found = match(entity["key"], params["node_limit"]) if match else self._match(entity["name"], params["node_limit"])
+            for node, score in found:
+                for neighbor, rel, outgoing in self.adjacency.get(node, []):
+                    source, target = (node, neighbor) if outgoing else (neighbor, node)
+                    triples.append({"source": source, "rel": rel, "target": target, "score": score})
+            rows.append({"entity": entity["name"], "triples": triples[: params["limit"]]})
+        return rows
+
+    def _exact_resolve_rows(self, params):
+        rows = [{"entity": e["name"], "nodes": [{"key": n, "name": n, "score": s} for n, s in self._exact(e["key"], params["node_limit"])]}
+                for e in params["entities"]]
+        return [row for row in rows if row["nodes"]]
+
+    def _resolve_rows(self, params):
+        return [
+            {"entity": e["name"], "nodes": [{"key": n, "name": n, "score": s} for n, s in self._match(e["name"], params["node_limit"])]}
+            for e in params["entities"]
+        ]
+
+    def _expand_rows(self, params):
+        rows = []
+        for key in params["frontier"]:
+            edges = [
+                {"key": m, "name": m, "rel": rel, "outgoing": outgoing, "degree": len(self.adjacency.get(m, []))}
+                for m, rel, outgoing in self.adjacency.get(key, [])
+                if not params["rel_types"] or rel in params["rel_types"]
+            ]
+            edges.sort(key=lambda e: e["degree"])
+            rows.append({"key": key, "edges": edges[: params["fan_out"]]})
+        return rows
+
+
+def install(llm_latency=0.0, token_latency=0.0):
+    """Replaces the network clients that modules imported afterwards construct.
+
+    Must run before hybrid_rag / full_scale_builder are imported: they build
+    their clients at import, from the names patched here.
+    """
+    import embedding_cache
+    import langchain_community.graphs
+    import langchain_experimental.graph_transformers
+    import langchain_groq
+
+    langchain_community.graphs.Neo4jGraph = lambda *args, **kwargs: InMemoryGraph()
+    langchain_groq.ChatGroq = lambda *args, **kwargs: FakeChatModel(latency=llm_latency, token_latency=token_latency)
+    langchain_experimental.graph_transformers.LLMGraphTransformer = (
+        lambda llm=None, allowed_nodes=(), allowed_relationships=(), **kwargs:
+        FakeGraphTransformer(list(allowed_nodes), list(allowed_relationships), latency=llm_latency)
+    )
+    embedding_cache.get_embedding_function = lambda *args, **kwargs: DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+
+
+# --- Synthetic corpus ---
+_SYLLABLES = ["ka", "lo", "ver", "ti", "mab", "zol", "rin", "dex", "os", "pra", "nu", "sil", "gen", "tor", "vi", "cor"]
+_SUFFIXES = ["itis", "osis", "emia", "inib", "umab", "azole", "pathy", "algia"]
+_TEMPLATES = [
+    "{a} is commonly treated with {b} in adult patients.",
+    "Patients with {a} frequently report {b} during follow-up.",
+    "{a} was associated with elevated markers of {b} in this cohort.",
+    "We observed that {a} may prevent {b} when given early.",
+    "{a} affects the response to {b} in a dose-dependent manner.",
+]
+
+
+def synthetic_vocabulary(size, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < size:
+        stem = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3)))
+        names.add((stem + rng.choice(_SUFFIXES)).capitalize())
+    return sorted(names)
+
+
+def synthetic_corpus(num_docs, seed=0):
+    """(record_id, text) pairs whose entity count grows with the corpus, like real abstracts."""
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(max(50, num_docs * 2), seed)
+    records = []
+    for i in range(num_docs):
+        sentences = []
+        for _ in range(rng.randint(4, 8)):
+            a, b = rng.sample(vocabulary, 2)
+            sentences.append(rng.choice(_TEMPLATES).format(a=a, b=b))
+        records.append((f"synthetic:{i}", " ".join(sentences)))
+    return records
+
+
+def synthetic_questions(records, count, seed=0):
+    """Questions about entities that occur in `records`."""
+    rng = random.Random(seed)
+    names = sorted({n for _, text in records for n in re.findall(r"\b[A-Z][a-z]{3,}\b", text)} - {"Patients"})
+    return [rng.choice(["What treats {}?", "What is {} associated with?", "Does {} cause symptoms?"]).format(rng.choice(names))
+            for _ in range(count)]
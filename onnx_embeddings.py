@@ -0,0 +1,260 @@
+"""int8 ONNX Runtime backend for all-MiniLM-L6-v2 (MEDGRAPH_EMBEDDING_BACKEND=onnx).
+
+The PyTorch model is exported to ONNX once and its weights are quantized to int8.
+At serving time only onnxruntime and tokenizers are needed, with no torch.
+Batching adapts to the load:
+
+- Large calls (index builds) are sorted by length and cut into batches under
+  a padded-token budget, so short chunks are not padded to the longest one.
+- Small calls (one query per request) from concurrent requests are coalesced
+  into one session run for a few milliseconds (llm_batcher.MicroBatcher).
+
+    python onnx_embeddings.py export                 # one-off, needs optimum[exporters] + torch
+    python onnx_embeddings.py parity --sample 2000   # recall drift vs the PyTorch vectors in medical_chroma_db
+    python onnx_embeddings.py bench                  # throughput: torch vs onnx
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# MEDGRAPH_ONNX_DIR (default ./onnx_models) and MEDGRAPH_ONNX_THREADS (0 = onnxruntime's
+# default, all cores) are read when a model is located / loaded, after the callers' load_dotenv()
+QUANTIZED_FILE = "model_int8.onnx"
+# sentence-transformers truncates all-MiniLM-L6-v2 at 256 tokens; so does this backend
+MAX_LENGTH = 256
+
+
+def model_dir(model_name):
+    return os.path.join(os.getenv("MEDGRAPH_ONNX_DIR", "./onnx_models"), model_name)
+
+
+def export_model(model_name, out_dir=None):
+    """PyTorch -> ONNX (optimum) -> int8 weights (onnxruntime dynamic quantization). Returns out_dir."""
+    from optimum.exporters.onnx import main_export
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out_dir = out_dir or model_dir(model_name)
+    # Writes model.onnx plus tokenizer.json next to it
+    main_export(f"sentence-transformers/{model_name}", output=out_dir, task="feature-extraction")
+    quantize_dynamic(os.path.join(out_dir, "model.onnx"), os.path.join(out_dir, QUANTIZED_FILE), weight_type=QuantType.QInt8)
+    print(f"✅ Exported {model_name} to {out_dir} ({QUANTIZED_FILE}: "
+          f"{os.path.getsize(os.path.join(out_dir, QUANTIZED_FILE)) / 2**20:.1f} MB)")
+    return out_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """Mean-pooled, L2-normalized sentence embeddings from an exported model (what the
+    sentence-transformers pipeline of all-MiniLM-L6-v2 computes), via onnxruntime on CPU.
+    """
+
+    def __init__(self, path, model_file=QUANTIZED_FILE, max_length=MAX_LENGTH, batch_tokens=16384,
+                 threads=None, window=0.005, max_batch=32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(path, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found: run `python onnx_embeddings.py export` first")
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()  # padded per batch instead, to the batch's own longest text
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(os.getenv("MEDGRAPH_ONNX_THREADS", "0")) if threads is None else threads
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_tokens = batch_tokens
+        self.batcher = None
+        if window > 0:
+            from llm_batcher import MicroBatcher
+            self.batcher = MicroBatcher(self._embed_texts, window, max_batch, concurrency=1, name="embedding")
+
+    @classmethod
+    def from_model_name(cls, model_name, **kwargs):
+        return cls(model_dir(model_name), **kwargs)
+
+    def _run(self, encodings):
+        width = max(len(e.ids) for e in encodings)
+        ids = np.zeros((len(encodings), width), dtype=np.int64)
+        mask = np.zeros_like(ids)
+        for row, encoding in enumerate(encodings):
+            ids[row, :len(encoding.ids)] = encoding.ids
+            mask[row, :len(encoding.ids)] = 1
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]  # last_hidden_state: (batch, tokens, dim)
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def _embed_texts(self, texts):
+        """Length-sorted batches under `batch_tokens` padded tokens; results in input order."""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        vectors = [None] * len(texts)
+        start = 0
+        while start < len(order):
+            end = start + 1
+            # Sorted ascending, so the last text in the batch sets its padded width
+            while end < len(order) and (end - start + 1) * len(encodings[order[end]].ids) <= self.batch_tokens:
+                end += 1
+            batch = order[start:end]
+            for i, vector in zip(batch, self._run([encodings[i] for i in batch])):
+                vectors[i] = vector.tolist()
+            start = end
+        return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        if self.batcher is not None and len(texts) < self.batcher.max_batch:
+            # Query-sized calls: share a session run with whatever other requests arrive meanwhile
+            futures = [self.batcher.submit(text) for text in texts]
+            return [f.result() for f in futures]
+        return self._embed_texts(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# --- Parity check and benchmark (need both backends installed) ---
+def sample_collection(chroma_path, sample, seed=0):
+    """(texts, stored PyTorch vectors) for up to `sample` random chunks of the Chroma collection."""
+    import chromadb
+    from vector_index import COLLECTION_NAME
+
+    collection = chromadb.PersistentClient(path=chroma_path).get_collection(COLLECTION_NAME)
+    ids = collection.get(include=[])["ids"]
+    ids = random.Random(seed).sample(ids, min(sample, len(ids)))
+    texts, vectors = [], []
+    for start in range(0, len(ids), 500):
+        rows = collection.get(ids=ids[start:start + 500], include=["documents", "embeddings"])
+        texts.extend(rows["documents"])
+        vectors.extend(rows["embeddings"])
+    return texts, np.asarray(vectors, dtype=np.float32)
+
+
+def recall_at_k(truth_queries, truth_docs, test_queries, test_docs, k):
+    """Mean overlap of the top-k documents under the test vectors with the top-k under the truth vectors."""
+    truth = np.argsort(-(truth_queries @ truth_docs.T), axis=1)[:, :k]
+    test = np.argsort(-(test_queries @ test_docs.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(truth, test)]))
+
+
+def parity(model_name, chroma_path, sample=2000, k=10, dataset="evaluation_dataset.json"):
+    """Compares ONNX int8 vectors with the PyTorch vectors stored in Chroma.
+
+    - cosine: per-chunk similarity of the two vectors for the same text
+    - recall@k (query only): ONNX query vectors against the stored PyTorch index,
+      i.e. switching the serving backend without re-indexing
+    - recall@k (full): ONNX queries against an ONNX re-index of the same chunks
+    Ground truth is PyTorch queries against the stored index. Queries are the
+    evaluation questions plus the first sentence of sampled chunks.
+    """
+    from embedding_cache import load_model
+
+    texts, stored = sample_collection(chroma_path, sample)
+    if not texts:
+        raise ValueError(f"No chunks in {chroma_path}: build it with vector_rag.py first")
+    with open(dataset, encoding="utf-8") as f:
+        queries = [row["question"] for row in json.load(f)]
+    queries += [t.split(". ")[0] for t in random.Random(1).sample(texts, min(200, len(texts)))]
+
+    torch_model, onnx_model = load_model(model_name, "torch"), load_model(model_name, "onnx")
+    onnx_docs = np.asarray(onnx_model.embed_documents(texts), dtype=np.float32)
+    torch_queries = np.asarray(torch_model.embed_documents(queries), dtype=np.float32)
+    onnx_queries = np.asarray(onnx_model.embed_documents(queries), dtype=np.float32)
+
+    cosine = np.sum(stored * onnx_docs, axis=1) / (np.linalg.norm(stored, axis=1) * np.linalg.norm(onnx_docs, axis=1))
+    k = min(k, len(texts))
+    report = {
+        "chunks": len(texts),
+        "queries": len(queries),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+        f"recall@{k}_query_only": round(recall_at_k(torch_queries, stored, onnx_queries, stored, k), 4),
+        f"recall@{k}_full": round(recall_at_k(torch_queries, stored, onnx_queries, onnx_docs, k), 4),
+    }
+    for key, value in report.items():
+        print(f"{key:<22} {value}")
+    return report
+
+
+def bench(model_name, chroma_path, sample=1000, queries=200, concurrency=8):
+    """Index-style throughput (chunks/s) and single-query latency for both backends."""
+    from concurrent.futures import ThreadPoolExecutor
+    from embedding_cache import load_model
+
+    try:
+        texts, _ = sample_collection(chroma_path, sample)
+    except Exception:
+        texts = []
+    if not texts:
+        from offline_backends import synthetic_corpus
+        texts = [text for _, text in synthetic_corpus(sample)]
+    questions = [t.split(". ")[0] for t in texts[:queries]]
+
+    results = {}
+    for backend in ("torch", "onnx"):
+        model = load_model(model_name, backend)
+        model.embed_documents(texts[:8])  # warm-up
+        start = time.perf_counter()
+        model.embed_documents(texts)
+        index_s = time.perf_counter() - start
+
+        latencies = []
+        def timed_query(question):
+            began = time.perf_counter()
+            model.embed_query(question)
+            latencies.append(time.perf_counter() - began)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed_query, questions))
+        query_s = time.perf_counter() - start
+
+        ms = np.asarray(latencies) * 1000
+        results[backend] = {
+            "chunks_per_s": round(len(texts) / index_s, 1),
+            "queries_per_s": round(len(questions) / query_s, 1),
+            "query_p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "query_p95_ms": round(float(np.percentile(ms, 95)), 2),
+        }
+
+    print(f"\n{'backend':<8}{'chunks/s':>11}{'queries/s':>11}{'p50 ms':>9}{'p95 ms':>9}   ({len(texts)} chunks, {concurrency} concurrent queries)")
+    for backend, r in results.items():
+        print(f"{backend:<8}{r['chunks_per_s']:>11}{r['queries_per_s']:>11}{r['query_p50_ms']:>9}{r['query_p95_ms']:>9}")
+    return results
+
+
+if __name__ == "__main__":
+    from embedding_cache import MODEL_NAME
+    from vector_index import CHROMA_PATH
+
+    parser = argparse.ArgumentParser(description="ONNX int8 embedding backend: export, parity check, benchmark.")
+    parser.add_argument("command", choices=["export", "parity", "bench"])
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--sample", type=int, default=2000, help="Chunks sampled from the Chroma collection")
+    parser.add_argument("--k", type=int, default=10, help="Cutoff for recall@k (parity)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent single queries (bench)")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(args.model)
+        report = None
+    elif args.command == "parity":
+        report = parity(args.model, args.chroma_path, args.sample, args.k)
+    else:
+        report = bench(args.model, args.chroma_path, args.sample, concurrency=args.concurrency)
+    if report is not None and args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
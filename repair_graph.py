@@ -1,6 +1,11 @@
 import os
 from dotenv import load_dotenv
 from langchain_community.graphs import Neo4jGraph
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+from data_version import bump_data_version
+from bulk_writer import BulkWriter
+from canonicalize import Canonicalizer
 
 # Load environment variables
 load_dotenv()
@@ -17,21 +22,28 @@ graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWO
 
 print("Repairing Graph Data for Demo...")
 
-# We manually insert the data that failed during the batch ingestion
-repair_query = """
-MERGE (d:Disease {id: "GVHD"})
-MERGE (c:Drug {id: "Cyclosporine"})
-MERGE (ch:Drug {id: "Chloroquine"})
-MERGE (t:Cell {id: "T cells"})
-
-MERGE (c)-[:TREATS]->(d)
-MERGE (ch)-[:TREATS]->(d)
-MERGE (d)-[:CAUSES]->(t)
-MERGE (c)-[:AFFECTS]->(t)
-"""
+# We manually insert the data that failed during the batch ingestion.
+# It goes through the same canonicalization as extracted data, so "GVHD" lands
+# on the Graft-Versus-Host Disease node instead of becoming a second one.
+d = Node(id="GVHD", type="Disease")
+c = Node(id="Cyclosporine", type="Drug")
+ch = Node(id="Chloroquine", type="Drug")
+t = Node(id="T cells", type="Cell")
+repair_doc = GraphDocument(
+    nodes=[d, c, ch, t],
+    relationships=[
+        Relationship(source=c, target=d, type="TREATS"),
+        Relationship(source=ch, target=d, type="TREATS"),
+        Relationship(source=d, target=t, type="CAUSES"),
+        Relationship(source=c, target=t, type="AFFECTS"),
+    ],
+    source=Document(page_content="manual repair"),
+)
 
 try:
-    graph.query(repair_query)
+    canonicalizer = Canonicalizer.from_file().seed(graph)
+    BulkWriter(graph, ["Disease", "Drug", "Cell"]).write(canonicalizer.canonicalize([repair_doc]))
+    bump_data_version("graph repaired")
     print("✅ SUCCESS: GVHD and Cyclosporine data injected manually.")
     print("Test 2 (What treats GVHD?) will now work.")
 except Exception as e:
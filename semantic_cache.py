@@ -0,0 +1,188 @@
+"""Semantic answer cache placed in front of hybrid_search / hybrid_search_logic.
+
+Lookups try the normalized question first, then fall back to the nearest
+cached question by cosine similarity of its all-MiniLM-L6-v2 embedding.
+
+Every caller (app.py, hybrid_rag.py, service.py) stores the same entry,
+{"answer", "entities"}, so they can share one MEDGRAPH_CACHE_PATH. The file
+is JSON lines: each put appends one entry, and the file is rewritten only
+when it holds twice as many lines as the cache keeps.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from data_version import current_data_version
+
+
+def normalize_question(question):
+    """Lowercases, collapses whitespace and drops surrounding punctuation."""
+    text = re.sub(r"\s+", " ", question.lower()).strip()
+    return text.strip(" ?!.,;:")
+
+
+class SemanticCache:
+    def __init__(self, embed_fn, threshold=0.92, ttl_seconds=24 * 3600, max_size=512, persist_path=None):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.file_lock = threading.Lock()  # appends, outside the lookup lock
+        self.file_lines = 0
+        self.entries = OrderedDict()  # normalized question -> entry, least recently used first
+        self.data_version = current_data_version()
+        self.lock = threading.Lock()
+        self._pending = {}  # embeddings computed by a missed get(), reused by put()
+        self.hits = 0
+        self.misses = 0
+        if persist_path:
+            self._load()
+
+    # --- Lookup ---
+    def get(self, question):
+        """Returns {"answer", "entities"} for this question (or a near-duplicate), else None."""
+        key = normalize_question(question)
+        with self.lock:
+            self._check_version()
+            self._evict_expired()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return _answer(self.entries[key])
+            if not self.entries:
+                self.misses += 1
+                return None
+
+        embedding = self._embed(question)
+        with self.lock:
+            if len(self._pending) >= self.max_size:
+                self._pending.clear()
+            self._pending[key] = embedding
+            keys = list(self.entries)
+            if keys:
+                matrix = np.array([self.entries[k]["embedding"] for k in keys], dtype=np.float32)
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return _answer(self.entries[keys[best]])
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, entities=()):
+        key = normalize_question(question)
+        with self.lock:
+            embedding = self._pending.pop(key, None)
+        if embedding is None:
+            embedding = self._embed(question)
+        entry = {"question": question, "embedding": embedding, "answer": answer, "entities": list(entities),
+                 "created": time.time()}
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            version = self.data_version
+        self._append(entry, version)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._pending.clear()
+        self._rewrite()
+
+    # --- Internals ---
+    def _embed(self, question):
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        # Graph or Chroma rebuilt since these answers were cached -> drop them
+        version = current_data_version()
+        if version != self.data_version:
+            self.entries.clear()
+            self._pending.clear()
+            self.data_version = version
+            # Lines on disk carry their data version, so the stale ones are skipped on load and compacted away
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in [k for k, e in self.entries.items() if e["created"] < cutoff]:
+            del self.entries[key]
+
+    def _load(self):
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        self.file_lines = len(lines)
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a half-written last line
+            # Entries of another data version, or in an older format, are skipped
+            if not isinstance(entry, dict) or entry.get("data_version") != self.data_version or "answer" not in entry:
+                continue
+            entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+            key = normalize_question(entry["question"])
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self._evict_expired()
+        if lines and not lines[-1].endswith("\n"):
+            self._rewrite()  # appends must not continue a torn line
+
+    @staticmethod
+    def _line(entry, version):
+        return json.dumps({**entry, "embedding": entry["embedding"].tolist(), "data_version": version}) + "\n"
+
+    def _append(self, entry, version):
+        if not self.persist_path:
+            return
+        line = self._line(entry, version)
+        with self.file_lock:
+            with open(self.persist_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.file_lines += 1
+            compact = self.file_lines > 2 * self.max_size
+        if compact:
+            self._rewrite()
+
+    def _rewrite(self):
+        """Replaces the file with the live entries (after a clear, a version change or too many appends)."""
+        if not self.persist_path:
+            return
+        with self.lock:
+            entries, version = list(self.entries.values()), self.data_version
+        with self.file_lock:
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(self._line(e, version) for e in entries)
+            os.replace(tmp_path, self.persist_path)
+            self.file_lines = len(entries)
+
+
+def _answer(entry):
+    return {"answer": entry["answer"], "entities": list(entry["entities"])}
+
+
+def cache_from_env(embed_fn):
+    """Builds a cache configured by MEDGRAPH_CACHE_* environment variables."""
+    return SemanticCache(
+        embed_fn,
+        threshold=float(os.getenv("MEDGRAPH_CACHE_THRESHOLD", "0.92")),
+        ttl_seconds=float(os.getenv("MEDGRAPH_CACHE_TTL", str(24 * 3600))),
+        max_size=int(os.getenv("MEDGRAPH_CACHE_SIZE", "512")),
+        persist_path=os.getenv("MEDGRAPH_CACHE_PATH") or None,
+    )
@@ -0,0 +1,344 @@
+"""Headless async HTTP service around the hybrid engine (hybrid_rag.py).
+
+One process holds one pooled Neo4j driver, one embedding model and one Chroma
+client for every request. At most MEDGRAPH_MAX_CONCURRENCY requests run at
+once, up to MEDGRAPH_MAX_QUEUE more wait, and anything beyond that gets an
+immediate 503 with Retry-After instead of piling up. A slot stays taken until
+its pipeline thread has finished, even when the request already timed out, so
+abandoned work counts against the limit and nothing queues behind it.
+
+    python service.py                      # or: uvicorn service:app --port 8000
+
+    GET  /health              liveness (the process is up)
+    GET  /ready               readiness (engine loaded, Neo4j + Chroma reachable)
+    GET  /metrics             Prometheus text (see telemetry.py)
+    POST /v1/answer           {"question", "use_cache"?} -> {"answer", "timings_ms"}
+    POST /v1/answer/stream    same body -> NDJSON events (context, token..., done, trace)
+    POST /v1/subgraph         {"question"} or {"entities"}, "depth"?, "limit"? -> {"entities", "subgraph"}
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from telemetry import metrics, span
+
+MAX_CONCURRENCY = int(os.getenv("MEDGRAPH_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("MEDGRAPH_MAX_QUEUE", "64"))
+REQUEST_TIMEOUT = float(os.getenv("MEDGRAPH_REQUEST_TIMEOUT", "60"))
+READY_TIMEOUT = 5.0
+MAX_LIMIT = 100
+MAX_DEPTH = 3
+RETRY_AFTER_SECONDS = 2
+
+
+class Overloaded(Exception):
+    """Every slot is busy and the wait queue is full, or no slot freed up within the request timeout."""
+
+
+class Backpressure:
+    """Bounded concurrency with a bounded wait queue; excess requests are rejected at once."""
+
+    def __init__(self, limit, max_waiting):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.active = 0
+
+    def full(self):
+        return self.semaphore.locked() and self.waiting >= self.max_waiting
+
+    async def acquire(self, timeout=None):
+        """Takes a slot; Overloaded if the queue is full or no slot frees up within `timeout`."""
+        if self.full():
+            metrics.incr("medgraph_service_rejected_total")
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("medgraph_service_rejected_total")
+            raise Overloaded() from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+    def hold_until_done(self, future):
+        """Releases the slot when the pool `future` finishes (or is cancelled before it started)."""
+        loop = asyncio.get_running_loop()
+
+        def done(_):
+            try:
+                loop.call_soon_threadsafe(self.release)
+            except RuntimeError:
+                pass  # loop closed at shutdown
+
+        future.add_done_callback(done)
+
+
+class Engine:
+    """Imports hybrid_rag (which connects and loads everything) off the event loop."""
+
+    def __init__(self):
+        self.module = None
+        self.error = None
+        self.load_seconds = None
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            import hybrid_rag
+            # Load the embedding model now rather than on the first request
+            hybrid_rag.embedding_function.embed_query("warm-up")
+            self.module = hybrid_rag
+        except Exception as e:
+            self.error = e
+            print(f"❌ Engine failed to load: {e}")
+        self.load_seconds = round(time.perf_counter() - start, 2)
+
+    def require(self):
+        if self.module is None:
+            raise RuntimeError("engine not ready" if self.error is None else f"engine failed to load: {self.error}")
+        return self.module
+
+
+engine = Engine()
+# Pipeline calls block (Groq, Neo4j, Chroma), so they run here; one thread per slot
+pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="service")
+backpressure = None
+
+
+def error_response(status, message, **extra):
+    headers = {"Retry-After": str(RETRY_AFTER_SECONDS)} if status == 503 else None
+    return JSONResponse({"error": message, **extra}, status_code=status, headers=headers)
+
+
+def int_param(body, name, default, high):
+    """body[name] as an int in [1, high], default when absent; None when invalid."""
+    value = body.get(name, default)
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if 1 <= value <= high else None
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def run_blocking(fn, *args):
+    """Runs fn in the pipeline pool under the concurrency limit and the request timeout (queueing included)."""
+    deadline = time.monotonic() + REQUEST_TIMEOUT
+    await backpressure.acquire(timeout=REQUEST_TIMEOUT)
+    # One thread per slot, so a held slot means a free thread: the job starts at once
+    future = pool.submit(fn, *args)
+    backpressure.hold_until_done(future)
+    return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - time.monotonic(), 0))
+
+
+async def guarded(fn, *args):
+    """run_blocking, with overload / timeout / failure mapped to HTTP errors."""
+    if engine.module is None:
+        return error_response(503, "engine not ready")
+    try:
+        return JSONResponse(await run_blocking(fn, *args))
+    except Overloaded:
+        return error_response(503, "overloaded", active=backpressure.active, waiting=backpressure.waiting)
+    except asyncio.TimeoutError:
+        # The worker thread finishes in the background and keeps its slot until then
+        return error_response(504, f"timed out after {REQUEST_TIMEOUT:.0f}s")
+    except Exception as e:
+        return error_response(500, str(e))
+
+
+# --- Pipeline calls (worker threads) ---
+def answer_question(question, use_cache):
+    hybrid_rag = engine.require()
+    timings = {}
+    answer = hybrid_rag.hybrid_search(question, use_cache=use_cache, timings=timings)
+    return {"answer": answer, "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()}}
+
+
+def subgraph_for(question, entities, depth, limit):
+    hybrid_rag = engine.require()
+    with span("service.subgraph"):
+        if entities is None:
+            entities = hybrid_rag.extract_entities(question)
+        subgraph = hybrid_rag.retrieve_subgraph(entities, depth, limit)
+    return {"entities": entities, "subgraph": subgraph}
+
+
+def check_ready():
+    hybrid_rag = engine.require()
+    components = {}
+    try:
+        hybrid_rag.graph.query("RETURN 1 AS ok")
+        components["neo4j"] = "ok"
+    except Exception as e:
+        components["neo4j"] = f"error: {e}"
+    try:
+        hybrid_rag.vector_db.get(limit=1, include=[])
+        components["chroma"] = "ok"
+    except Exception as e:
+        components["chroma"] = f"error: {e}"
+    return components
+
+
+# --- Endpoints ---
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def ready(request):
+    if engine.module is None:
+        state = "loading" if engine.error is None else f"error: {engine.error}"
+        return JSONResponse({"ready": False, "components": {"engine": state}}, status_code=503)
+    loop = asyncio.get_running_loop()
+    try:
+        # Not under backpressure: a busy service is still a ready one
+        components = await asyncio.wait_for(loop.run_in_executor(None, check_ready), READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        components = {"checks": f"timed out after {READY_TIMEOUT:.0f}s"}
+    is_ready = all(v == "ok" for v in components.values())
+    body = {"ready": is_ready, "components": {"engine": "ok", **components}, "load_seconds": engine.load_seconds}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+async def metrics_endpoint(request):
+    gauges = (
+        "# TYPE medgraph_service_active_requests gauge\n"
+        f"medgraph_service_active_requests {backpressure.active}\n"
+        "# TYPE medgraph_service_waiting_requests gauge\n"
+        f"medgraph_service_waiting_requests {backpressure.waiting}\n"
+    )
+    return PlainTextResponse(metrics.prometheus_text() + gauges, media_type="text/plain; version=0.0.4")
+
+
+async def answer(request):
+    body = await read_json(request)
+    if not body or not str(body.get("question", "")).strip():
+        return error_response(400, "body must be a JSON object with a non-empty 'question'")
+    return await guarded(answer_question, body["question"], bool(body.get("use_cache", True)))
+
+
+async def subgraph(request):
+    body = await read_json(request)
+    if not body or not (body.get("question") or isinstance(body.get("entities"), list)):
+        return error_response(400, "body must have a 'question' or an 'entities' list")
+    depth = int_param(body, "depth", engine.module.GRAPH_DEPTH if engine.module else 1, MAX_DEPTH)
+    limit = int_param(body, "limit", 20, MAX_LIMIT)
+    if depth is None or limit is None:
+        return error_response(400, f"'depth' must be an integer in 1..{MAX_DEPTH} and 'limit' one in 1..{MAX_LIMIT}")
+    return await guarded(subgraph_for, body.get("question"), body.get("entities"), depth, limit)
+
+
+async def answer_stream(request):
+    body = await read_json(request)
+    if not body or not str(body.get("question", "")).strip():
+        return error_response(400, "body must be a JSON object with a non-empty 'question'")
+    limit = int_param(body, "limit", 20, MAX_LIMIT)
+    if limit is None:
+        return error_response(400, f"'limit' must be an integer in 1..{MAX_LIMIT}")
+    if engine.module is None:
+        return error_response(503, "engine not ready")
+    # Early 503 while a status can still be sent; the slot itself is taken once the body is being sent
+    if backpressure.full():
+        metrics.incr("medgraph_service_rejected_total")
+        return error_response(503, "overloaded", active=backpressure.active, waiting=backpressure.waiting)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        # The whole generator runs on one thread, so its spans nest in one trace
+        emit = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+        try:
+            with span("service.stream") as root:
+                stream = engine.module.stream_events(body["question"], bool(body.get("use_cache", True)),
+                                                     with_context=True, graph_limit=limit)
+                for event in stream:
+                    if cancelled.is_set():
+                        stream.close()
+                        break
+                    emit(event)
+            emit({"event": "trace", "trace": root.to_dict()})
+        except Exception as e:
+            emit({"event": "error", "error": str(e)})
+        finally:
+            emit(None)
+
+    async def ndjson():
+        # Taken here, not in the handler: a body that is never iterated holds nothing
+        deadline = loop.time() + REQUEST_TIMEOUT
+        try:
+            await backpressure.acquire(timeout=REQUEST_TIMEOUT)
+        except Overloaded:
+            yield json.dumps({"event": "error", "error": "overloaded"}) + "\n"
+            return
+        future = pool.submit(produce)
+        backpressure.hold_until_done(future)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    yield json.dumps({"event": "error", "error": f"timed out after {REQUEST_TIMEOUT:.0f}s"}) + "\n"
+                    break
+                if event is None:
+                    break
+                yield json.dumps(event, default=str) + "\n"
+        finally:
+            # Client went away, timed out or finished: stop generating; the slot frees when produce returns
+            cancelled.set()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global backpressure
+    backpressure = Backpressure(MAX_CONCURRENCY, MAX_QUEUE)
+    # /health answers right away; /ready flips once the engine has loaded
+    loader = asyncio.get_running_loop().run_in_executor(None, engine.load)
+    yield
+    await loader
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/ready", ready),
+        Route("/metrics", metrics_endpoint),
+        Route("/v1/answer", answer, methods=["POST"]),
+        Route("/v1/answer/stream", answer_stream, methods=["POST"]),
+        Route("/v1/subgraph", subgraph, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # One worker process: more would load one model and one driver pool each
+    uvicorn.run(app, host=os.getenv("MEDGRAPH_SERVICE_HOST", "0.0.0.0"), port=int(os.getenv("MEDGRAPH_SERVICE_PORT", "8000")))
@@ -0,0 +1,50 @@
+"""Small synchronous client for service.py (used by app.py when MEDGRAPH_SERVICE_URL is set)."""
+import json
+
+import requests
+
+
+class ServiceBusy(RuntimeError):
+    """The service answered 503 (overloaded or still starting)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ServiceClient:
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # One session = one HTTP connection pool shared by every Streamlit session
+        self.session = requests.Session()
+
+    def _post(self, path, payload, stream=False):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, stream=stream)
+        if response.status_code == 503:
+            raise ServiceBusy(response.json().get("error", "service unavailable"), response.headers.get("Retry-After"))
+        response.raise_for_status()
+        return response
+
+    def ready(self):
+        response = self.session.get(f"{self.base_url}/ready", timeout=10)
+        return response.status_code == 200, response.json()
+
+    def answer(self, question, use_cache=True):
+        return self._post("/v1/answer", {"question": question, "use_cache": use_cache}).json()
+
+    def subgraph(self, question=None, entities=None, limit=20):
+        payload = {"limit": limit}
+        payload.update({"entities": entities} if entities is not None else {"question": question})
+        return self._post("/v1/subgraph", payload).json()
+
+    def stream_events(self, question, use_cache=True, limit=20):
+        """Yields the service's NDJSON events: context, token..., done, trace (or error)."""
+        response = self._post("/v1/answer/stream", {"question": question, "use_cache": use_cache, "limit": limit}, stream=True)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    event = json.loads(line)
+                    if event["event"] == "error":
+                        raise RuntimeError(f"Service error: {event['error']}")
+                    yield event
@@ -0,0 +1,200 @@
+"""Non-blocking cold start for app.py.
+
+Every backend client (embedding model, Chroma, Neo4j, Groq, entity dictionary)
+is built on its own background thread as soon as the first session starts, so
+the page renders right away and a question only waits for the clients it is
+still missing. A backend that failed (e.g. Neo4j briefly unreachable) is
+started again on a later page load, as the old blocking setup was. Heavy
+libraries are imported inside the init functions, and Neo4jGraph skips its
+schema introspection (nothing here reads graph.schema).
+
+    python startup.py          # headless cold start of the same backends + timing report
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import span
+
+READY, LOADING, FAILED = "ready", "loading", "failed"
+ICONS = {READY: "✅", LOADING: "⏳", FAILED: "❌"}
+# Minimum seconds between retries of a failed backend
+RETRY_SECONDS = float(os.getenv("MEDGRAPH_STARTUP_RETRY_SECONDS", "5"))
+
+
+class Startup:
+    """Runs named init functions in parallel; get(name) waits for one of them.
+
+    Init functions may call get() for the backends they depend on (the
+    dictionary needs Neo4j); there is one thread per backend, so that never
+    starves the pool.
+    """
+
+    def __init__(self, import_seconds=0.0):
+        self.created = time.perf_counter()
+        self.import_seconds = import_seconds
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.backends = {}
+        self.timings = {}  # name -> {"status", "started_s", "seconds", "error"}
+        self.pool = None
+        self.reported = False
+
+    def start(self, backends):
+        """backends: {name: fn}. Returns self right away."""
+        self.pool = ThreadPoolExecutor(max_workers=len(backends), thread_name_prefix="startup")
+        self.backends = dict(backends)
+        for name in backends:
+            self.timings[name] = {"status": LOADING, "started_s": None, "seconds": None, "error": None}
+        for name, fn in backends.items():
+            self.futures[name] = self.pool.submit(self._run, name, fn)
+        return self
+
+    def retry_failed(self, min_interval=RETRY_SECONDS):
+        """Starts failed backends again (those that failed at least min_interval ago). Returns their names.
+
+        Backends resubmit in their original order, so a dependent (the
+        dictionary) waits on its dependency's new attempt, not the failed one.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            names = [name for name, t in self.timings.items()
+                     if t["status"] == FAILED and now - self.created - t["started_s"] - t["seconds"] >= min_interval]
+            for name in names:
+                self.timings[name].update(status=LOADING, started_s=None, seconds=None, error=None)
+            if names:
+                self.reported = False
+        for name in names:
+            self.futures[name] = self.pool.submit(self._run, name, self.backends[name])
+        return names
+
+    def _run(self, name, fn):
+        started = time.perf_counter()
+        with self.lock:
+            self.timings[name]["started_s"] = started - self.created
+        try:
+            with span(f"startup.{name}"):
+                result = fn()
+        except Exception as e:
+            self._finish(name, started, FAILED, f"{type(e).__name__}: {e}")
+            raise
+        self._finish(name, started, READY)
+        return result
+
+    def _finish(self, name, started, status, error=None):
+        with self.lock:
+            self.timings[name].update(status=status, seconds=time.perf_counter() - started, error=error)
+            done = all(t["status"] != LOADING for t in self.timings.values()) and not self.reported
+            self.reported = self.reported or done
+        if done:
+            print(self.report_text())
+
+    def get(self, name, timeout=None):
+        """The backend's client, once ready. Re-raises its init error."""
+        return self.futures[name].result(timeout)
+
+    def status(self):
+        with self.lock:
+            return {name: t["status"] for name, t in self.timings.items()}
+
+    def all_ready(self):
+        return all(s == READY for s in self.status().values())
+
+    def done(self):
+        return all(s != LOADING for s in self.status().values())
+
+    def summary(self):
+        """One line for the status caption, e.g. "✅ neo4j · ⏳ embeddings · ✅ chroma"."""
+        return " · ".join(f"{ICONS[s]} {name}" for name, s in self.status().items())
+
+    def report(self):
+        """Rows for a table: when each backend started and became ready, in seconds since startup began."""
+        with self.lock:
+            timings = {name: dict(t) for name, t in self.timings.items()}
+        rows = [{"backend": "imports", "status": READY, "started_s": None, "seconds": round(self.import_seconds, 2),
+                 "ready_at_s": None, "error": None}]
+        for name, t in timings.items():
+            ready_at = t["started_s"] + t["seconds"] if t["seconds"] is not None else None
+            rows.append({
+                "backend": name,
+                "status": t["status"],
+                "started_s": round(t["started_s"], 2) if t["started_s"] is not None else None,
+                "seconds": round(t["seconds"], 2) if t["seconds"] is not None else None,
+                "ready_at_s": round(ready_at, 2) if ready_at is not None else None,
+                "error": t["error"],
+            })
+        return rows
+
+    def report_text(self):
+        rows = self.report()
+        ready_at = max((r["ready_at_s"] or 0.0) for r in rows)
+        parts = [f"{r['backend']} {r['seconds']}s" if r["status"] != FAILED else f"{r['backend']} FAILED" for r in rows]
+        return f"🚀 Cold start: ready after {ready_at:.2f}s (+{self.import_seconds:.2f}s imports) | " + ", ".join(parts)
+
+
+# --- app.py's backends ---
+def app_backends(embedding_function, chroma_path, answer_model, startup):
+    """Init functions for app.py. Each imports its own client library."""
+
+    def embeddings():
+        # CachedEmbeddings loads the model on first use; do it now, not on the first question
+        embedding_function.model
+        return embedding_function
+
+    def chroma():
+        from langchain_community.vectorstores import Chroma
+        vector_db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
+        vector_db.get(limit=1, include=[])  # opens the collection
+        return vector_db
+
+    def neo4j():
+        from langchain_community.graphs import Neo4jGraph
+        from graph_lookup import ensure_node_index
+        # refresh_schema=False: the schema introspection is the slowest part of connecting, and nothing reads it
+        graph = Neo4jGraph(url=os.getenv("NEO4J_URI"), username=os.getenv("NEO4J_USERNAME"),
+                           password=os.getenv("NEO4J_PASSWORD"), refresh_schema=False)
+        ensure_node_index(graph)
+        return graph
+
+    def groq():
+        from langchain_groq import ChatGroq
+        return ChatGroq(model=answer_model, temperature=0)
+
+    def dictionary():
+        from entity_dictionary import EntityDictionary
+        entity_dictionary = EntityDictionary(startup.get("neo4j"))
+        # Loads the node ids; a failed load is retried on later questions, as before
+        entity_dictionary.extract("")
+        return entity_dictionary
+
+    return {"embeddings": embeddings, "chroma": chroma, "neo4j": neo4j, "groq": groq, "dictionary": dictionary}
+
+
+def start_app_backends(chroma_path, answer_model, import_seconds=0.0):
+    from embedding_cache import get_embedding_function
+    startup = Startup(import_seconds)
+    return startup.start(app_backends(get_embedding_function(), chroma_path, answer_model, startup))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    began = time.perf_counter()
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Cold-start app.py's backends headlessly and report timings.")
+    parser.add_argument("--chroma-path", default="./medical_chroma_db")
+    parser.add_argument("--model", default="llama-3.1-8b-instant")
+    args = parser.parse_args()
+
+    startup = start_app_backends(args.chroma_path, args.model, import_seconds=time.perf_counter() - began)
+    for name in startup.futures:
+        try:
+            startup.get(name)
+        except Exception:
+            pass
+    print()
+    for row in startup.report():
+        print(f"{row['backend']:<12} {row['status']:<8} started {row['started_s'] if row['started_s'] is not None else '-':>6}s  "
+              f"took {row['seconds'] if row['seconds'] is not None else '-':>6}s  {row['error'] or ''}")
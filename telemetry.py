@@ -0,0 +1,254 @@
+"""Spans and counters for every pipeline stage, with JSONL and Prometheus export.
+
+    with span("graph_retrieval", entities=3) as s:
+        ...
+        s.set(triples=12)
+
+Spans nest through a context variable (use `submit` to carry it into a thread
+pool). Every finished root span is appended to MEDGRAPH_TRACE_PATH as one
+JSON line when that is set, and every span feeds
+the `medgraph_span_seconds` histogram served as Prometheus text on
+MEDGRAPH_METRICS_PORT.
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# MEDGRAPH_TRACE_PATH / MEDGRAPH_METRICS_PORT are read when used, so values from .env
+# count even though entry points import this module before load_dotenv()
+# Histogram buckets (seconds) for span durations
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+_current = contextvars.ContextVar("medgraph_span", default=None)
+_span_ids = itertools.count(1)
+
+
+def approx_tokens(text):
+    """Rough token count (~4 characters per token) for prompts and answers."""
+    return len(text or "") // 4
+
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = next(_span_ids)
+        self.attrs = attrs
+        self.children = []
+        self.status = "ok"
+        self.error = None
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration_s = None
+        if parent:
+            with _lock:
+                parent.children.append(self)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.duration_s is not None:
+            return
+        self.duration_s = time.perf_counter() - self.start
+        metrics.observe("medgraph_span_seconds", self.duration_s, span=self.name)
+        if self.status == "error":
+            metrics.incr("medgraph_errors_total", stage=self.name)
+        if self.parent is None:
+            _finish_trace(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(self.duration_s * 1000, 2) if self.duration_s is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attrs": self.attrs,
+            "children": [c.to_dict() for c in self.children],
+        }
+
+
+def start_span(name, **attrs):
+    """A span under the current one that stays open until .end() (e.g. across a streamed answer)."""
+    return Span(name, _current.get(), **attrs)
+
+
+@contextmanager
+def activate(s):
+    """Makes `s` the parent of spans opened inside the block, without ending it."""
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # a generator finished in another context; nothing left to restore
+
+
+@contextmanager
+def span(name, **attrs):
+    s = start_span(name, **attrs)
+    with activate(s):
+        try:
+            yield s
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                s.fail(e)
+            raise
+        finally:
+            s.end()
+
+
+def submit(executor, fn, *args):
+    """executor.submit that keeps the caller's current span as the parent."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def record_error(stage, error):
+    """For errors a stage recovers from: counted and attached to the current span instead of vanishing."""
+    s = _current.get()
+    if s is not None:
+        s.fail(error)
+    else:
+        metrics.incr("medgraph_errors_total", stage=stage)
+    print(f"⚠️  {stage} failed: {error}")
+
+
+# --- Metrics ---
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def incr(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def prometheus_text(self):
+        def escape(value):
+            # Label values are quoted strings: backslash, quote and newline must be escaped
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self.lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(BUCKETS, hist):
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist[-1]}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist[-2]:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_lock = threading.Lock()
+
+
+def _finish_trace(root):
+    trace_path = os.getenv("MEDGRAPH_TRACE_PATH")
+    if not trace_path:
+        return
+    line = json.dumps(root.to_dict(), default=str) + "\n"
+    with _lock:
+        with open(trace_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def timing_rows(trace, depth=0):
+    """Flattens a trace dict into rows for a table: one per span, children indented."""
+    rows = [{
+        "stage": "  " * depth + trace["name"],
+        "ms": trace["duration_ms"],
+        "status": trace["status"] if not trace["error"] else f"error: {trace['error']}",
+        "details": ", ".join(f"{k}={v}" for k, v in trace["attrs"].items()),
+    }]
+    for child in sorted(trace["children"], key=lambda c: c["started_at"]):
+        rows.extend(timing_rows(child, depth + 1))
+    return rows
+
+
+# --- Prometheus endpoint ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def serve_metrics(port):
+    """Serves /metrics on a daemon thread (once per process)."""
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"📈 Metrics on http://localhost:{port}/metrics")
+    return _server
+
+
+def exporters_from_env():
+    """Starts the Prometheus endpoint when MEDGRAPH_METRICS_PORT is set. Safe to call repeatedly."""
+    port = os.getenv("MEDGRAPH_METRICS_PORT")
+    if port:
+        try:
+            serve_metrics(port)
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint unavailable: {e}")
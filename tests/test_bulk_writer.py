@@ -0,0 +1,83 @@
+import csv
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from bulk_writer import BULK_QUERY_PREFIX, BulkWriter, CsvExporter, group_graph_documents
+from offline_backends import InMemoryGraph
+
+
+def graph_document(*edges):
+    """GraphDocument from (source, source_label, type, target, target_label) tuples."""
+    relationships = [Relationship(source=Node(id=s, type=sl), target=Node(id=t, type=tl), type=rel)
+                     for s, sl, rel, t, tl in edges]
+    nodes = {(r.source.id, r.source.type): r.source for r in relationships}
+    nodes.update({(r.target.id, r.target.type): r.target for r in relationships})
+    return GraphDocument(nodes=list(nodes.values()), relationships=relationships, source=Document(page_content="x"))
+
+
+DOCS = [
+    graph_document(("Aspirin", "Drug", "TREATS", "Pain", "Disease"), ("Aspirin", "Drug", "TREATS", "Fever", "Disease")),
+    graph_document(("Aspirin", "Drug", "TREATS", "Pain", "Disease"), ("Ibuprofen", "Drug", "TREATS", "Pain", "Disease")),
+]
+
+
+class RecordingGraph:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, query, params=None):
+        self.queries.append((query, params))
+        return []
+
+
+def test_group_graph_documents_collapses_duplicates():
+    nodes, relationships = group_graph_documents(DOCS)
+    assert {label: sorted(ids) for label, ids in nodes.items()} == {"Drug": ["Aspirin", "Ibuprofen"],
+                                                                     "Disease": ["Fever", "Pain"]}
+    assert sorted(relationships[("Drug", "TREATS", "Disease")]) == [
+        ("Aspirin", "Fever"), ("Aspirin", "Pain"), ("Ibuprofen", "Pain")]
+
+
+def test_bulk_writer_batches_one_merge_per_group():
+    graph = RecordingGraph()
+    writer = BulkWriter(graph, labels=["Drug"], tx_size=2)
+    assert writer.write(DOCS) == {"nodes": 4, "relationships": 3}
+
+    constraints = [q for q, _ in graph.queries if q.startswith("CREATE CONSTRAINT")]
+    assert len(constraints) == 2 and any("`Disease`" in q for q in constraints)
+    batches = [(q, p["rows"]) for q, p in graph.queries if q.startswith(BULK_QUERY_PREFIX)]
+    # tx_size=2: three relationships of one (label, type, label) group are two UNWIND batches
+    relationship_batches = [rows for q, rows in batches if "-[r:`TREATS`]->" in q]
+    assert [len(rows) for rows in relationship_batches] == [2, 1]
+    node_rows = {row["id"]: row for q, rows in batches if "MERGE (n:" in q for row in rows}
+    assert node_rows["Aspirin"]["aliases"] == ["Aspirin"] and node_rows["Aspirin"]["norm_id"] == "aspirin"
+
+    # Constraints are created once per label, however often it is written
+    graph.queries.clear()
+    writer.write(DOCS)
+    assert not [q for q, _ in graph.queries if q.startswith("CREATE CONSTRAINT")]
+
+
+def test_bulk_writer_round_trip_through_the_offline_graph():
+    graph = InMemoryGraph()
+    BulkWriter(graph).write(DOCS)
+    assert graph.labels == {"Aspirin": "Drug", "Ibuprofen": "Drug", "Pain": "Disease", "Fever": "Disease"}
+    assert graph.edges == {("Aspirin", "TREATS", "Pain"), ("Aspirin", "TREATS", "Fever"), ("Ibuprofen", "TREATS", "Pain")}
+
+
+def test_csv_exporter_writes_import_files_once_per_node(tmp_path):
+    exporter = CsvExporter(str(tmp_path))
+    exporter.write(DOCS[:1])
+    exporter.write(DOCS[1:])
+    command = exporter.close()
+
+    with open(tmp_path / "nodes.csv", encoding="utf-8") as f:
+        nodes = list(csv.reader(f))
+    with open(tmp_path / "relationships.csv", encoding="utf-8") as f:
+        relationships = list(csv.reader(f))
+    assert nodes[0] == [":ID", "id", "norm_id", "aliases:string[]", ":LABEL"]
+    assert sorted(row[0] for row in nodes[1:]) == ["Disease:Fever", "Disease:Pain", "Drug:Aspirin", "Drug:Ibuprofen"]
+    assert relationships[1:] == [["Drug:Aspirin", "Disease:Pain", "TREATS"], ["Drug:Aspirin", "Disease:Fever", "TREATS"],
+                                 ["Drug:Ibuprofen", "Disease:Pain", "TREATS"]]
+    assert (tmp_path / "import_command.txt").read_text().strip() == command
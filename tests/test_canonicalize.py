@@ -0,0 +1,88 @@
+import pytest
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from canonicalize import Canonicalizer, load_aliases, norm_key, plan_merge
+
+ALIASES = {"Graft-Versus-Host Disease": ["GVHD", "Graft vs Host Disease"]}
+
+
+def doc(nodes, rels=()):
+    by_id = {n.id: n for n in nodes}
+    relationships = [Relationship(source=by_id[s], target=by_id[t], type=rel) for s, rel, t in rels]
+    return GraphDocument(nodes=nodes, relationships=relationships, source=Document(page_content="x"))
+
+
+def row(eid, node_id, label="Disease", degree=1, aliases=()):
+    return {"eid": eid, "id": node_id, "labels": [label], "degree": degree, "aliases": list(aliases)}
+
+
+def test_norm_key_folds_case_and_punctuation():
+    assert norm_key("Graft-Versus-Host Disease") == norm_key("graft versus host disease")
+
+
+def test_canonicalize_maps_aliases_and_spelling_variants():
+    canonicalizer = Canonicalizer(ALIASES)
+    [result] = canonicalizer.canonicalize([doc([Node(id="GVHD", type="Disease"), Node(id="Aspirin", type="Drug"),
+                                                Node(id="aspirin", type="Drug")])])
+    assert sorted(n.id for n in result.nodes) == ["Aspirin", "Graft-Versus-Host Disease"]
+    gvhd = next(n for n in result.nodes if n.type == "Disease")
+    assert "GVHD" in gvhd.properties["aliases"]
+
+
+def test_canonicalize_drops_relationships_that_collapse_onto_one_node():
+    canonicalizer = Canonicalizer(ALIASES)
+    nodes = [Node(id="GVHD", type="Disease"), Node(id="Graft vs Host Disease", type="Disease"),
+             Node(id="Cyclosporine", type="Drug")]
+    [result] = canonicalizer.canonicalize([doc(nodes, [("GVHD", "IS_A", "Graft vs Host Disease"),
+                                                       ("Cyclosporine", "TREATS", "GVHD")])])
+    assert [(r.source.id, r.type, r.target.id) for r in result.relationships] == [
+        ("Cyclosporine", "TREATS", "Graft-Versus-Host Disease")]
+
+
+def test_same_id_with_different_labels_stays_two_nodes():
+    [result] = Canonicalizer().canonicalize([doc([Node(id="Insulin", type="Drug"), Node(id="insulin", type="Test")])])
+    assert sorted((n.type, n.id) for n in result.nodes) == [("Drug", "Insulin"), ("Test", "Insulin")]
+
+
+def test_seeded_graph_spelling_stays_canonical():
+    class Graph:
+        def query(self, query, params=None):
+            return [{"id": "Hypertension", "aliases": ["HTN"]}]
+
+    canonicalizer = Canonicalizer().seed(Graph())
+    [result] = canonicalizer.canonicalize([doc([Node(id="hypertension", type="Disease")])])
+    assert result.nodes[0].id == "Hypertension"
+    assert result.nodes[0].properties["aliases"] == ["HTN", "Hypertension", "hypertension"]
+
+
+def test_alias_claimed_twice_is_rejected():
+    with pytest.raises(ValueError):
+        Canonicalizer({"Myocardial Infarction": ["MI"], "Mitral Insufficiency": ["MI"]})
+
+
+def test_shipped_alias_table_has_no_ambiguous_abbreviations():
+    keys = {norm_key(name) for names in load_aliases().values() for name in names}
+    assert not keys & {norm_key(a) for a in ["MI", "RA", "CT", "AF", "CAD", "CHD"]}
+    Canonicalizer.from_file()
+
+
+def test_plan_merge_prefers_table_name_then_degree():
+    rows = [row("e1", "GVHD", degree=9), row("e2", "Graft-Versus-Host Disease", degree=1),
+            row("e3", "aspirin", label="Drug", degree=1), row("e4", "Aspirin", label="Drug", degree=5)]
+    groups, backfill = plan_merge(rows, Canonicalizer(ALIASES))
+    by_label = {g["label"]: g for g in groups}
+    assert by_label["Disease"]["eids"] == ["e2", "e1"]
+    assert by_label["Disease"]["id"] == "Graft-Versus-Host Disease"
+    assert by_label["Drug"]["eids"] == ["e4", "e3"]
+    assert by_label["Drug"]["merged"] == ["aspirin"]
+    gvhd = next(b for b in backfill if b["eid"] == "e2")
+    assert gvhd["norm_id"] == norm_key("Graft-Versus-Host Disease")
+    assert {"GVHD", "Graft vs Host Disease"} <= set(gvhd["aliases"])
+
+
+def test_plan_merge_keeps_labels_apart_and_backfills_singletons():
+    rows = [row("e1", "Insulin", label="Drug"), row("e2", "insulin", label="Test"), row("e3", "Asthma")]
+    groups, backfill = plan_merge(rows, Canonicalizer())
+    assert groups == []
+    assert sorted(b["eid"] for b in backfill) == ["e1", "e2", "e3"]
@@ -0,0 +1,42 @@
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.documents import Document
+
+from checkpoint_store import CheckpointStore
+
+
+def graph_document(text):
+    aspirin, pain = Node(id="Aspirin", type="Drug"), Node(id="Pain", type="Disease", properties={"chronic": True})
+    return GraphDocument(nodes=[aspirin, pain], relationships=[Relationship(source=aspirin, target=pain, type="TREATS")],
+                         source=Document(page_content=text, metadata={"record_id": "r1"}))
+
+
+def test_plan_follows_each_document_through_extraction_and_writing(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+    items = [("a", "text a"), ("b", "text b"), ("c", "text c")]
+    assert store.plan(items) == ([], items, 0)
+
+    store.record_extracted("a", "text a", [graph_document("text a")])
+    store.record_extracted("b", "text b", [graph_document("text b")])
+    store.record_failed("c", "text c", RuntimeError("429"))
+    store.mark_written(["text a"])
+    # Written: skipped; extracted only: replayed; failed: extracted again
+    assert store.plan(items) == ([("b", "text b")], [("c", "text c")], 1)
+    assert store.plan(items, rewrite=True)[0] == [("a", "text a"), ("b", "text b")]
+    assert store.summary() == {"extracted_written": 1, "extracted": 1, "failed": 1}
+
+    store.reset_written()
+    assert store.plan(items)[0] == [("a", "text a"), ("b", "text b")]
+
+
+def test_cached_graph_documents_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    CheckpointStore(path).record_extracted("a", "text a", [graph_document("text a")])
+
+    (replayed,) = CheckpointStore(path).cached_graph_documents(["text a", "never seen"])
+    assert replayed == graph_document("text a")
+
+
+def test_namespace_invalidates_earlier_extractions(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    CheckpointStore(path, namespace="llama-3.1-8b").record_extracted("a", "text a", [])
+    assert CheckpointStore(path, namespace="llama-3.3-70b").plan([("a", "text a")]) == ([], [("a", "text a")], 0)
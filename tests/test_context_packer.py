@@ -0,0 +1,48 @@
+from context_packer import NO_GRAPH_CONTEXT, context_budget, dedupe_triples, pack_context, split_sentences
+
+
+def test_split_sentences_merges_chunk_overlap():
+    first = "Tacrolimus prevents GVHD. It is given after transplant. Levels are monitored"
+    second = "Levels are monitored weekly. Renal toxicity is common."
+    sentences = [text for _, _, text in split_sentences([first, second])]
+    # The cut-off head of the first chunk is replaced by the full sentence of the second
+    assert sentences == ["Tacrolimus prevents GVHD.", "It is given after transplant.",
+                         "Levels are monitored weekly.", "Renal toxicity is common."]
+
+
+def test_split_sentences_drops_exact_repeats_only():
+    sentences = split_sentences(["Aspirin thins blood. Aspirin thins blood!", "Aspirin thins the blood."])
+    assert [text for _, _, text in sentences] == ["Aspirin thins blood.", "Aspirin thins the blood."]
+
+
+def test_dedupe_triples_keeps_the_best_score():
+    triple = {"source": "Aspirin", "rel": "TREATS", "target": "Pain"}
+    unique = dedupe_triples({"aspirin": [{**triple, "score": 0.2}], "pain": [{**triple, "score": 0.9}]})
+    assert unique == [{**triple, "score": 0.9}]
+
+
+def test_context_budget_from_env(monkeypatch):
+    monkeypatch.setenv("MEDGRAPH_CONTEXT_TOKENS", "llama-3.1-8b-instant=800, 2000")
+    assert context_budget("llama-3.1-8b-instant") == 800
+    assert context_budget("llama-3.3-70b-versatile") == 2000
+    monkeypatch.delenv("MEDGRAPH_CONTEXT_TOKENS")
+    assert context_budget("unknown-model") == 1500
+
+
+def test_pack_context_stays_within_budget_and_ranks_by_question():
+    chunks = ["Statins lower cholesterol. " * 3 + "Statins raise diabetes risk slightly.",
+              "Unrelated filler about hospital parking. " * 10]
+    subgraph = {"paths": [], "triples": {"statins": [
+        {"source": "Statins", "rel": "INCREASES_RISK_OF", "target": "Diabetes", "score": 1.0},
+        {"source": "Statins", "rel": "INCREASES_RISK_OF", "target": "Diabetes", "score": 0.5},
+    ]}}
+    vector, graph, stats = pack_context("Do statins increase diabetes risk?", chunks, subgraph, budget=30)
+    assert stats["tokens"] <= 30
+    assert graph == "Statins INCREASES_RISK_OF Diabetes" and stats["graph_items"] == "1/1"
+    assert "diabetes risk" in vector and "parking" not in vector
+    assert stats["raw_tokens"] > stats["tokens"]
+
+
+def test_pack_context_without_graph_facts():
+    vector, graph, _ = pack_context("q", ["Only text."], {"paths": [], "triples": {}}, budget=100)
+    assert (vector, graph) == ("Only text.", NO_GRAPH_CONTEXT)
@@ -0,0 +1,54 @@
+import numpy as np
+
+import data_version
+from embedding_cache import CachedEmbeddings, EmbeddingStore, cache_name, get_embedding_function
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 2.0]
+
+
+def test_settings_are_read_when_used(tmp_path, monkeypatch):
+    # As load_dotenv() would set them, after the modules were imported
+    monkeypatch.setenv("MEDGRAPH_EMBEDDING_BACKEND", "onnx")
+    monkeypatch.setenv("MEDGRAPH_EMBEDDING_CACHE", str(tmp_path / "vectors"))
+    assert cache_name("m") == "m@onnx-int8"
+    assert get_embedding_function("m").store.dir.startswith(str(tmp_path / "vectors"))
+    monkeypatch.setenv("MEDGRAPH_DATA_VERSION_FILE", str(tmp_path / "version"))
+    assert data_version.current_data_version() == ""
+    version = data_version.bump_data_version()
+    assert data_version.current_data_version() == version
+    assert (tmp_path / "version").exists()
+
+
+def test_documents_are_computed_once_and_shared(tmp_path):
+    model = CountingModel()
+    embeddings = CachedEmbeddings("m", lambda: model, cache_dir=str(tmp_path))
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    assert model.calls == 2
+    assert embeddings.embed_documents(["bb"]) == [first[1]]
+    assert model.calls == 2
+    # Another process' store sees the appended rows
+    assert np.allclose(EmbeddingStore("m", str(tmp_path)).get_many(["bb"])[0], first[1])
+
+
+def test_queries_stay_in_memory_and_bounded(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEDGRAPH_QUERY_EMBEDDING_CACHE", "2")
+    model = CountingModel()
+    embeddings = CachedEmbeddings("m", lambda: model, cache_dir=str(tmp_path))
+    for question in ["q1", "q2", "q3", "q3"]:
+        embeddings.embed_query(question)
+    assert model.calls == 3 and list(embeddings.queries) == ["q2", "q3"]
+    assert len(embeddings.store) == 0
+    embeddings.embed_documents(["chunk"])
+    assert embeddings.embed_query("chunk") == embeddings.embed_documents(["chunk"])[0]
+    assert model.calls == 4
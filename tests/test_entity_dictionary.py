@@ -0,0 +1,49 @@
+from entity_dictionary import AhoCorasick, EntityDictionary, normalize_text
+
+
+class FakeGraph:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, query, params=None):
+        return self.rows
+
+
+def dictionary(*ids, aliases=None):
+    rows = [{"id": node_id, "aliases": (aliases or {}).get(node_id, [])} for node_id in ids]
+    return EntityDictionary(FakeGraph(rows), refresh_seconds=3600)
+
+
+def test_aho_corasick_reports_overlapping_matches():
+    text = "graft versus host disease"
+    matches = set(AhoCorasick(["host disease", "graft versus host disease", "disease"]).iter_matches(text))
+    assert {text[s:e] for s, e in matches} == {"host disease", "graft versus host disease", "disease"}
+
+
+def test_normalize_text_folds_case_possessives_and_punctuation():
+    assert normalize_text("Crohn's Disease (CD)?") == "crohn disease cd"
+
+
+def test_extract_keeps_leftmost_longest():
+    entities = dictionary("Host Disease", "Graft-Versus-Host Disease", "Cyclosporine")
+    assert entities.extract("Does cyclosporine prevent graft-versus-host disease?") == [
+        "Cyclosporine", "Graft-Versus-Host Disease"]
+
+
+def test_extract_requires_word_boundaries():
+    entities = dictionary("Statin", "Iron")
+    assert entities.extract("Do statins affect environment or irony?") == []
+    assert entities.extract("Iron and statin together") == ["Iron", "Statin"]
+
+
+def test_extract_maps_aliases_and_skips_short_ids():
+    entities = dictionary("Graft-Versus-Host Disease", "T", aliases={"Graft-Versus-Host Disease": ["GVHD"]})
+    assert entities.extract("Is GVHD a T cell disease?") == ["Graft-Versus-Host Disease"]
+
+
+def test_extract_without_a_graph_returns_nothing():
+    class Down:
+        def query(self, query, params=None):
+            raise ConnectionError("neo4j down")
+
+    assert EntityDictionary(Down()).extract("aspirin") == []
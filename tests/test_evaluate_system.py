@@ -0,0 +1,33 @@
+import importlib
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def evaluate_system(tmp_path, monkeypatch):
+    """evaluate_system on the benchmark's offline stand-ins (it builds the judge at import)."""
+    from offline_backends import install
+
+    monkeypatch.setenv("NEO4J_PASSWORD", "offline")
+    monkeypatch.setenv("MEDGRAPH_CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setenv("MEDGRAPH_GRAPH_BACKEND", "neo4j")
+    monkeypatch.setenv("MEDGRAPH_CACHE_PATH", str(tmp_path / "answers.jsonl"))
+    install()
+    monkeypatch.delitem(sys.modules, "hybrid_rag", raising=False)
+    monkeypatch.delitem(sys.modules, "evaluate_system", raising=False)
+    return importlib.import_module("evaluate_system")
+
+
+@pytest.mark.parametrize("raw, score", [
+    ("4", 4),
+    (" 5\n", 5),
+    ("Score: 3", 3),
+    ("**Score:** 2 - partially wrong", 2),
+    ("Score (1-5): 4", 4),
+    ("On a scale of 1-5 I'd give 4", None),
+    ("1-5 scale: the answer is wrong", None),
+    ("I cannot grade this.", None),
+])
+def test_parse_score_reads_the_score_token(evaluate_system, raw, score):
+    assert evaluate_system.parse_score(raw) == score
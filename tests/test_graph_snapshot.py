@@ -0,0 +1,74 @@
+import pytest
+
+from graph_snapshot import INCOMING, OUTGOING, SnapshotStore, build_csr, export_snapshot
+from multi_hop import SnapshotBackend, expand_paths
+
+NODES = ["Aspirin", "Aspirin Overdose", "Headache", "Graft-Versus-Host Disease", "Cyclosporine", "Fever"]
+EDGES = [("Aspirin", "TREATS", "Headache"), ("Aspirin", "TREATS", "Fever"), ("Aspirin Overdose", "CAUSES", "Headache"),
+         ("Cyclosporine", "PREVENTS", "Graft-Versus-Host Disease"), ("Graft-Versus-Host Disease", "CAUSES", "Fever")]
+
+
+class FakeGraph:
+    def query(self, query, params=None):
+        if "-[r]->" in query:
+            return [{"source": s, "rel": rel, "target": t} for s, rel, t in EDGES]
+        return [{"eid": node_id, "id": node_id, "labels": ["__Entity__", "Disease"]} for node_id in NODES]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    export_snapshot(FakeGraph(), root=str(tmp_path))
+    return SnapshotStore(str(tmp_path)).get()
+
+
+def test_build_csr_stores_both_directions():
+    indptr, neighbors, rels, directions = build_csr(3, [0, 0], [1, 2], [5, 6])
+    assert indptr.tolist() == [0, 2, 3, 4]
+    assert neighbors.tolist() == [1, 2, 0, 0]
+    assert rels.tolist() == [5, 6, 5, 6]
+    assert directions.tolist() == [OUTGOING, OUTGOING, INCOMING, INCOMING]
+
+
+def test_neighbors_and_degree(snapshot):
+    aspirin = snapshot.node_ids.index("Aspirin")
+    triples = {(snapshot.triple(aspirin, n, r, d)["rel"], snapshot.node_ids[n]) for n, r, d in snapshot.neighbors_of(aspirin)}
+    assert triples == {("TREATS", "Headache"), ("TREATS", "Fever")}
+    assert snapshot.degree(snapshot.node_ids.index("Fever")) == 2
+
+
+def test_resolve_exact_then_word_subset(snapshot):
+    name = lambda matches: [(snapshot.node_ids[i], score) for i, score in matches]
+    assert name(snapshot.resolve("aspirin")) == [("Aspirin", 2.0)]
+    assert name(snapshot.resolve("graft versus host disease")) == [("Graft-Versus-Host Disease", 2.0)]
+    # No exact id: every node holding all the words, shortest ids first
+    assert name(snapshot.resolve("host graft")) == [("Graft-Versus-Host Disease", 1.0)]
+    assert name(snapshot.resolve("overdose")) == [("Aspirin Overdose", 1.0)]
+    assert snapshot.resolve("aspirin headache") == []
+    assert snapshot.resolve("") == []
+
+
+def test_resolve_does_not_match_inside_words(snapshot):
+    assert snapshot.resolve("aspir") == []
+
+
+def test_lookup_triples_follows_both_directions(snapshot):
+    triples = snapshot.lookup_triples(["Headache"])["Headache"]
+    assert {(t["source"], t["rel"], t["target"]) for t in triples} == {
+        ("Aspirin", "TREATS", "Headache"), ("Aspirin Overdose", "CAUSES", "Headache")}
+
+
+def test_store_swaps_to_a_new_version(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    export_snapshot(FakeGraph(), root=str(tmp_path))
+    first = store.get()
+    assert store.get() is first
+    export_snapshot(FakeGraph(), root=str(tmp_path))
+    assert store.get().version == first.version + 1
+
+
+def test_multi_hop_over_the_snapshot(snapshot):
+    paths, truncated = expand_paths(SnapshotBackend(snapshot), ["Cyclosporine"], depth=2, time_budget=5)
+    assert not truncated
+    assert all(p["score"] > 0 for p in paths)
+    assert [("Cyclosporine", "PREVENTS", "Graft-Versus-Host Disease"),
+            ("Graft-Versus-Host Disease", "CAUSES", "Fever")] in [p["hops"] for p in paths]
@@ -0,0 +1,91 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ingestion_engine import FatalIngestionError, IngestionEngine, RateLimiter, TokenBucket, extract_wait_time
+
+
+def test_token_bucket_refills_at_rate_up_to_capacity():
+    bucket = TokenBucket(60)  # one per second
+    bucket.tokens = 0.0
+    bucket.refill(bucket.updated + 2.5)
+    assert bucket.tokens == pytest.approx(2.5)
+    assert bucket.wait_for(4) == pytest.approx(1.5)
+    bucket.refill(bucket.updated + 3600)
+    assert bucket.tokens == 60
+    assert bucket.wait_for(10) == 0.0
+
+
+def test_rate_limiter_affordable_is_the_tighter_quota():
+    limiter = RateLimiter(requests_per_minute=30, tokens_per_minute=12000)
+    assert limiter.affordable(2000) == 6
+    assert limiter.affordable(1) == 30
+
+
+def test_rate_limiter_acquire_consumes_both_quotas():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    limiter.acquire(2, 1000)
+    assert limiter.requests.tokens == pytest.approx(598, abs=1)
+    assert limiter.tokens.tokens == pytest.approx(59000, abs=100)
+
+
+def test_rate_limiter_waits_for_refill():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600000)  # 10 requests/s
+    limiter.requests.tokens = 0.0
+    start = time.monotonic()
+    limiter.acquire(1, 1)
+    assert time.monotonic() - start >= 0.08
+
+
+def test_pause_blocks_every_caller():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600000)
+    limiter.pause(0.2)
+    assert limiter.tokens.tokens <= 0
+    start = time.monotonic()
+    limiter.acquire(1, 1)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_extract_wait_time_parses_groq_hints():
+    assert extract_wait_time("Rate limit. Please try again in 1m2.5s") == 63
+    assert extract_wait_time("try again in 7.5s") == 8.5
+    assert extract_wait_time("connection reset") is None
+
+
+def make_engine(extract_fn, written, **kwargs):
+    return IngestionEngine(extract_fn, written.extend, requests_per_minute=6000, tokens_per_minute=10**7,
+                           workers=3, backoff_base=0.01, backoff_cap=0.01, **kwargs)
+
+
+def test_engine_extracts_writes_and_retries():
+    calls = {"n": 0}
+
+    def extract(docs):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise RuntimeError("transient")
+        return [SimpleNamespace(key=doc.metadata["key"], nodes=[], relationships=[]) for doc in docs]
+
+    written = []
+    stats = make_engine(extract, written).run((f"k{i}", f"text {i}") for i in range(20))
+    assert sorted(g.key for g in written) == sorted(f"k{i}" for i in range(20))
+    assert stats["extracted"] == stats["written"] == 20
+    assert stats["retries"] == 1 and stats["failed"] == []
+
+
+def test_engine_reports_failed_docs_after_retries():
+    def extract(docs):
+        raise RuntimeError("always")
+
+    stats = make_engine(extract, [], max_retries=1).run([("a", "x"), ("b", "y")])
+    assert sorted(stats["failed"]) == ["a", "b"]
+    assert stats["written"] == 0
+
+
+def test_engine_stops_on_fatal_errors():
+    def extract(docs):
+        raise RuntimeError("model_decommissioned")
+
+    with pytest.raises(FatalIngestionError):
+        make_engine(extract, []).run([("a", "x")] * 10)
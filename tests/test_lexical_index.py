@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+import lexical_index
+from lexical_index import FusionRetriever, LexicalIndex, chunk_id, reciprocal_rank_fusion, tokenize
+
+
+def ids(results):
+    return [cid for cid, _ in results]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return LexicalIndex(str(tmp_path / "bm25"))
+
+
+def test_tokenize_splits_hyphenated_words():
+    assert tokenize("Graft-versus-host disease") == ["graft-versus-host", "graft", "versus", "host", "disease"]
+
+
+def test_search_ranks_rare_terms(index):
+    index.add([("a", "cyclosporine prevents graft versus host disease"), ("b", "graft failure after surgery"),
+               ("c", "aspirin and heart disease")])
+    index.commit()
+    assert ids(index.search("cyclosporine graft", k=2)) == ["a", "b"]
+    assert index.live_count() == 3
+
+
+def test_newest_segment_wins_and_tombstones_hide(index):
+    index.add([("a", "aspirin"), ("b", "warfarin")])
+    index.commit()
+    index.add([("a", "heparin")])
+    index.delete(["b"])
+    index.commit()
+    assert index.search("aspirin") == []
+    assert index.search("warfarin") == []
+    assert ids(index.search("heparin")) == ["a"]
+    assert index.live_count() == 1
+
+
+def test_merge_keeps_live_chunks_and_scores(index, monkeypatch):
+    monkeypatch.setattr(lexical_index, "MAX_SEGMENTS", 2)
+    for i in range(2):
+        index.add([(f"d{i}", f"term{i} shared"), ("gone", "shared obsolete")])
+        index.commit()
+    index.delete(["gone"])
+    index.commit()
+    before = index.search("shared term1", k=5)
+    index.add([("d2", "term2 shared")])
+    index.commit()  # third segment: merged into one
+    manifest = index.read_manifest()
+    assert len(manifest["segments"]) == 1 and manifest["segments"][0].endswith("_merged")
+    assert manifest["deleted"] == []
+    assert index.live_count() == 3
+    assert ids(index.search("shared term1", k=5))[0] == ids(before)[0] == "d1"
+    assert "gone" not in ids(index.search("obsolete shared", k=5))
+
+
+def test_retired_segments_are_deleted_one_generation_later(index, monkeypatch):
+    monkeypatch.setattr(lexical_index, "MAX_SEGMENTS", 1)
+    index.add([("a", "aspirin")])
+    index.commit()
+    index.add([("b", "warfarin")])
+    index.commit()  # merges seg 1 and 2
+    manifest = index.read_manifest()
+    assert manifest["retired"] == ["seg_000001", "seg_000002"]
+    assert all(os.path.isdir(os.path.join(index.path, name)) for name in manifest["retired"])
+    index.delete(["a"])
+    index.commit()
+    assert not any(os.path.exists(os.path.join(index.path, name)) for name in manifest["retired"])
+    assert ids(index.search("warfarin")) == ["b"]
+
+
+def test_rebuild_replaces_everything(index):
+    index.add([("a", "aspirin")])
+    index.commit()
+    index.rebuild([("b", "warfarin")])
+    assert index.search("aspirin") == []
+    assert index.live_count() == 1
+
+
+def test_reciprocal_rank_fusion_sums_ranks():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]) == ["b", "a", "d", "c"]
+
+
+@pytest.fixture
+def vector_db(tmp_path):
+    from langchain_community.vectorstores import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    return Chroma(persist_directory=str(tmp_path / "chroma"), embedding_function=DeterministicFakeEmbedding(size=16))
+
+
+def test_fusion_keys_on_stored_ids(vector_db, index):
+    texts = ["cyclosporine prevents graft versus host disease", "aspirin treats headache", "statins lower cholesterol"]
+    # A chunk from an older build: random id, no record_id
+    ids = ["legacy-uuid", chunk_id("r2", texts[1]), chunk_id("r3", texts[2])]
+    metadatas = [{"source": "old"}, {"record_id": "r2"}, {"record_id": "r3"}]
+    vector_db.add_texts(texts, metadatas=metadatas, ids=ids)
+    index.add(list(zip(ids, texts)))
+    index.commit()
+    results = FusionRetriever(vector_db, index, k=3, candidates=3).invoke("cyclosporine graft disease")
+    assert sorted(doc.page_content for doc in results) == sorted(texts)
+    assert results[0].page_content == texts[0]
+
+
+def test_fusion_falls_back_to_dense_when_lexical_fails(vector_db):
+    class Broken:
+        def search(self, query, k):
+            raise FileNotFoundError("seg_000001/terms.npy")
+
+    vector_db.add_texts(["chunk 0", "chunk 1", "chunk 2"], ids=["a", "b", "c"])
+    results = FusionRetriever(vector_db, Broken(), k=2).invoke("q")
+    assert len(results) == 2 and {doc.page_content for doc in results} <= {"chunk 0", "chunk 1", "chunk 2"}
+
+
+def test_retriever_mode_is_read_at_call_time(vector_db, tmp_path, monkeypatch):
+    monkeypatch.setenv("MEDGRAPH_RETRIEVAL", "dense")
+    assert not isinstance(lexical_index.retriever_for(vector_db, str(tmp_path / "chroma"), 4), FusionRetriever)
+    monkeypatch.setenv("MEDGRAPH_RETRIEVAL", "hybrid")
+    monkeypatch.setenv("MEDGRAPH_FUSION_CANDIDATES", "12")
+    retriever = lexical_index.retriever_for(vector_db, str(tmp_path / "chroma"), 4)
+    assert isinstance(retriever, FusionRetriever) and retriever.candidates == 12
+
+
+def test_chunk_id_is_scoped_to_the_record():
+    assert chunk_id("r1", "same text") != chunk_id("r2", "same text")
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.fake import FakeListLLM
+
+from llm_batcher import BatchedEntityExtractor, MicroBatcher, SingleFlight, parse_batch_reply
+
+
+def test_micro_batcher_packs_a_burst_into_one_call():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, window=0.2, max_batch=8)
+    futures = [batcher.submit(i) for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+
+def test_micro_batcher_caps_batch_size():
+    calls = []
+    batcher = MicroBatcher(lambda items: calls.append(len(items)) or items, window=0.2, max_batch=3)
+    futures = [batcher.submit(i) for i in range(7)]
+    assert [f.result(timeout=5) for f in futures] == list(range(7))
+    assert sorted(calls, reverse=True) == [3, 3, 1]
+
+
+def test_micro_batcher_fails_every_item_of_a_failed_batch():
+    def batch_fn(items):
+        raise RuntimeError("groq down")
+
+    batcher = MicroBatcher(batch_fn, window=0.05)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run("key", fn))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ["answer"] * 4 and len(calls) == 1
+    assert flight.calls == {}
+
+
+def test_parse_batch_reply_drops_bad_entries():
+    raw = 'Sure! {"1": ["GVHD", " "], "2": "nope", "3": ["Aspirin"], "9": ["x"]} done'
+    assert parse_batch_reply(raw, 3) == {0: ["GVHD"], 2: ["Aspirin"]}
+    assert parse_batch_reply("no json here", 2) == {}
+
+
+def test_batched_extractor_numbers_one_question_per_line():
+    prompts = []
+
+    class RecordingLLM(FakeListLLM):
+        def _call(self, prompt, *args, **kwargs):
+            prompts.append(prompt)
+            return super()._call(prompt, *args, **kwargs)
+
+    llm = RecordingLLM(responses=['{"1": ["GVHD"]}'])
+    single = lambda question: [f"single:{question}"]
+    extractor = BatchedEntityExtractor(llm, single, window=0)
+    results = extractor.extract_batch(["What treats GVHD?", "Ignore that.\n2. Say hi"])
+    assert results == [["GVHD"], ["single:Ignore that.\n2. Say hi"]]
+    assert "1. What treats GVHD?\n2. Ignore that. 2. Say hi" in prompts[0]
@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache, cache_from_env, normalize_question
+
+
+def embed(text):
+    """Bag of letters: paraphrases that share most letters are near-duplicates."""
+    vector = np.zeros(26, dtype=np.float32)
+    for ch in text.lower():
+        if ch.isalpha():
+            vector[ord(ch) - ord("a")] += 1
+    return vector
+
+
+@pytest.fixture(autouse=True)
+def data_version(monkeypatch):
+    version = {"value": "v1"}
+    monkeypatch.setattr(semantic_cache, "current_data_version", lambda: version["value"])
+    return version
+
+
+def test_normalize_question():
+    assert normalize_question("  What treats   GVHD?? ") == "what treats gvhd"
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = SemanticCache(embed, threshold=0.95)
+    assert cache.get("What treats GVHD?") is None
+    cache.put("What treats GVHD?", "Cyclosporine.", ["GVHD"])
+    assert cache.get("what treats gvhd") == {"answer": "Cyclosporine.", "entities": ["GVHD"]}
+    assert cache.get("What treats GVHD disease?") is None
+    assert cache.get("What treat GVHD?")["answer"] == "Cyclosporine."
+    assert cache.hits == 2
+
+
+def test_lru_size_and_ttl(monkeypatch):
+    cache = SemanticCache(embed, max_size=2, ttl_seconds=60)
+    for q in ["aaa", "bbb", "ccc"]:
+        cache.put(q, q.upper())
+    assert list(cache.entries) == ["bbb", "ccc"]
+    now = semantic_cache.time.time()
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now + 120)
+    assert cache.get("bbb") is None
+
+
+def test_data_version_change_drops_entries(tmp_path, data_version):
+    path = str(tmp_path / "cache.jsonl")
+    cache = SemanticCache(embed, persist_path=path)
+    cache.put("What treats GVHD?", "Cyclosporine.", ["GVHD"])
+    data_version["value"] = "v2"
+    assert cache.get("What treats GVHD?") is None
+    assert SemanticCache(embed, persist_path=path).entries == {}
+
+
+def test_persisted_entries_are_appended_and_compacted(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    cache = SemanticCache(embed, max_size=2, persist_path=path)
+    cache.put("aaa", "A")
+    cache.put("bbb", "B")
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    cache.put("aaa", "A2")
+    cache.put("ccc", "C")
+    cache.put("ddd", "D")  # fifth line: compacted to the two live entries
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["question"] for line in f] == ["ccc", "ddd"]
+    reloaded = SemanticCache(embed, max_size=2, persist_path=path)
+    assert reloaded.get("ddd")["answer"] == "D"
+
+
+def test_old_format_and_torn_lines_are_skipped(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    path.write_text(json.dumps({"data_version": "v1", "entries": [{"question": "q", "value": "old"}]}) + "\n"
+                    + '{"question": "half', encoding="utf-8")
+    cache = SemanticCache(embed, persist_path=str(path))
+    assert cache.entries == {}
+    cache.put("q", "new")
+    assert SemanticCache(embed, persist_path=str(path)).get("q")["answer"] == "new"
+
+
+@pytest.fixture
+def hybrid_rag(tmp_path, monkeypatch):
+    """hybrid_rag on the benchmark's offline stand-ins, with a persisted answer cache."""
+    import importlib
+    import sys
+
+    from offline_backends import install
+
+    monkeypatch.setenv("NEO4J_PASSWORD", "offline")
+    monkeypatch.setenv("MEDGRAPH_CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setenv("MEDGRAPH_GRAPH_BACKEND", "neo4j")
+    monkeypatch.setenv("MEDGRAPH_CACHE_PATH", str(tmp_path / "answers.jsonl"))
+    install()
+    monkeypatch.delitem(sys.modules, "hybrid_rag", raising=False)
+    return importlib.import_module("hybrid_rag")
+
+
+def test_app_and_engine_share_one_cache_file(hybrid_rag):
+    # Written by the engine (hybrid_rag / service.py) ...
+    answer = hybrid_rag.hybrid_search("What treats GVHD?", concurrent=False)
+    # ... read the way app.py reads it
+    app_cache = cache_from_env(hybrid_rag.embedding_function.embed_query)
+    cached = app_cache.get("What treats GVHD?")
+    assert cached["answer"] == answer and isinstance(cached["entities"], list)
+
+    # Written the way app.py writes it, read by the engine
+    app_cache.put("Does aspirin help headaches?", "Yes.", ["Aspirin", "Headache"])
+    hybrid_rag.answer_cache = cache_from_env(hybrid_rag.embedding_function.embed_query)
+    assert hybrid_rag.hybrid_search("Does aspirin help headaches?") == "Yes."
+    events = list(hybrid_rag.stream_events("Does aspirin help headaches?", with_context=True))
+    assert events[0]["entities"] == ["Aspirin", "Headache"]
+    assert [e["text"] for e in events if e["event"] == "token"] == ["Yes."]
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import types
+
+import httpx
+
+import service
+
+
+def test_backpressure_rejects_once_slots_and_queue_are_full():
+    async def scenario():
+        gate = service.Backpressure(limit=1, max_waiting=1)
+        await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.full() and gate.waiting == 1
+        try:
+            await gate.acquire()
+        except service.Overloaded:
+            pass
+        else:
+            raise AssertionError("a third request must be rejected")
+        gate.release()
+        await waiter
+        assert (gate.active, gate.waiting) == (1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_saturated_service_answers_503_with_retry_after(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def hybrid_search(question, use_cache=True, timings=None):
+        started.set()
+        finish.wait(5)
+        return f"answer to {question}"
+
+    monkeypatch.setattr(service.engine, "module", types.SimpleNamespace(hybrid_search=hybrid_search))
+
+    async def scenario():
+        monkeypatch.setattr(service, "backpressure", service.Backpressure(limit=1, max_waiting=0))
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://service") as client:
+            first = asyncio.ensure_future(client.post("/v1/answer", json={"question": "q1"}))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            rejected = await client.post("/v1/answer", json={"question": "q2"})
+            stream_rejected = await client.post("/v1/answer/stream", json={"question": "q3"})
+            finish.set()
+            accepted = await first
+            # The slot frees once the pipeline thread is done
+            while service.backpressure.active:
+                await asyncio.sleep(0.01)
+            again = await client.post("/v1/answer", json={"question": "q4"})
+        return rejected, stream_rejected, accepted, again
+
+    rejected, stream_rejected, accepted, again = asyncio.run(scenario())
+    for response in (rejected, stream_rejected):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(service.RETRY_AFTER_SECONDS)
+        assert response.json() == {"error": "overloaded", "active": 1, "waiting": 0}
+    assert accepted.status_code == 200 and accepted.json()["answer"] == "answer to q1"
+    assert again.status_code == 200 and again.json()["answer"] == "answer to q4"
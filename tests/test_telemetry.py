@@ -0,0 +1,39 @@
+import json
+
+from telemetry import Metrics, span, timing_rows
+
+
+def test_prometheus_text_escapes_label_values():
+    metrics = Metrics()
+    metrics.incr("medgraph_errors_total", stage='say "hi"\\\nbye')
+    assert 'medgraph_errors_total{stage="say \\"hi\\"\\\\\\nbye"} 1' in metrics.prometheus_text().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    metrics.observe("medgraph_span_seconds", 0.003, span="x")
+    metrics.observe("medgraph_span_seconds", 100.0, span="x")
+    lines = metrics.prometheus_text().splitlines()
+    assert 'medgraph_span_seconds_bucket{span="x",le="+Inf"} 2' in lines
+    assert 'medgraph_span_seconds_count{span="x"} 2' in lines
+
+
+def test_spans_nest_and_record_errors():
+    try:
+        with span("root", n=1) as root:
+            with span("child"):
+                raise ValueError("boom")
+    except ValueError:
+        pass
+    trace = root.to_dict()
+    assert [c["name"] for c in trace["children"]] == ["child"]
+    rows = timing_rows(trace)
+    assert rows[1]["stage"] == "  child" and rows[1]["status"].startswith("error")
+
+
+def test_trace_path_is_read_when_a_trace_finishes(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("MEDGRAPH_TRACE_PATH", str(path))  # as load_dotenv() would, after the import
+    with span("request"):
+        pass
+    assert json.loads(path.read_text(encoding="utf-8"))["name"] == "request"
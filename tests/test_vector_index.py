@@ -0,0 +1,42 @@
+import pytest
+
+from lexical_index import chunk_id
+from vector_index import CHUNK_IDS_KEY, EMBEDDING_KEY, VectorIndexBuilder, split_records
+
+
+class Splitter:
+    def split_text(self, text):
+        return text.split("|")
+
+
+def test_split_records_scopes_ids_to_the_record():
+    chunks = list(split_records([("r1", "a|b"), ("r2", "a")], Splitter()))
+    assert [(cid, text, meta["record_id"]) for cid, text, meta in chunks] == [
+        (chunk_id("r1", "a"), "a", "r1"), (chunk_id("r1", "b"), "b", "r1"), (chunk_id("r2", "a"), "a", "r2")]
+
+
+def test_new_store_records_backend_and_id_scheme(tmp_path):
+    builder = VectorIndexBuilder(str(tmp_path / "db"), backend="torch")
+    assert builder.collection.metadata[EMBEDDING_KEY] == "all-MiniLM-L6-v2"
+    assert CHUNK_IDS_KEY in builder.collection.metadata
+
+
+def test_store_from_an_older_build_needs_rebuild(tmp_path):
+    import chromadb
+
+    path = str(tmp_path / "db")
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection("langchain")
+    collection.add(ids=["3f2b-uuid"], embeddings=[[0.1, 0.2]], documents=["old chunk"], metadatas=[{"source": "x"}])
+    with pytest.raises(ValueError, match="--rebuild"):
+        VectorIndexBuilder(path, backend="torch")
+    builder = VectorIndexBuilder(path, backend="torch", rebuild=True)
+    assert builder.collection.count() == 0 and builder.stats["reset"]
+
+
+def test_switching_backend_needs_rebuild(tmp_path):
+    path = str(tmp_path / "db")
+    builder = VectorIndexBuilder(path, backend="torch")
+    builder.upsert([(chunk_id("r", "t"), "t", {"record_id": "r"})], [[0.1, 0.2]])
+    with pytest.raises(ValueError, match="--rebuild"):
+        VectorIndexBuilder(path, backend="onnx")
+    assert VectorIndexBuilder(path, backend="onnx", rebuild=True).collection.metadata[EMBEDDING_KEY].endswith("onnx-int8")
@@ -0,0 +1,22 @@
+"""Word tokenizer shared by context ranking (context_packer.py) and the BM25 index (lexical_index.py).
+
+Kept free of other project imports: embedding worker processes load it through
+lexical_index without pulling in the graph modules.
+"""
+import re
+
+WORD = re.compile(r"[a-z0-9][a-z0-9'-]+")
+STOPWORDS = {
+    "the", "and", "for", "with", "what", "which", "who", "how", "does", "did", "are", "was", "were",
+    "is", "of", "in", "on", "to", "by", "an", "or", "can", "its", "this", "that", "from", "be", "as",
+    "at", "it", "has", "have", "had", "not", "but", "into", "than", "then", "there", "these", "those",
+}
+
+
+def tokens(text):
+    """Lowercase words of `text` without stopwords, in order."""
+    return [w for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def terms(text):
+    return set(tokens(text))
@@ -0,0 +1,193 @@
+"""Incremental, batched vector index builder for ./medical_chroma_db.
+
+Chunk ids hash the record id and the chunk text, so reruns only embed chunks
+that are new (or changed) and upserts never duplicate. Text shared by several
+records is one chunk per record (its vector is computed once, via the
+embedding cache), so each record's stale-chunk cleanup only touches its own.
+Embeddings are computed in batches on a process pool, each worker loading the
+model once. The BM25 index next to the store (lexical_index.py) gets the same
+chunks and deletions.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chromadb
+
+from data_loader import iter_batches
+from embedding_cache import EmbeddingStore, cache_name, embedding_backend
+from lexical_index import LexicalIndex, chunk_id, iter_collection, lexical_path
+
+CHROMA_PATH = "./medical_chroma_db"
+# Default collection name used by langchain's Chroma wrapper, so app.py / hybrid_rag.py see the same data
+COLLECTION_NAME = "langchain"
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Collection metadata key naming the model / backend every vector in the store comes from
+EMBEDDING_KEY = "medgraph_embedding"
+# Collection metadata key set once every chunk id is known to be chunk_id(record_id, text)
+CHUNK_IDS_KEY = "medgraph_chunk_ids"
+CHUNK_ID_SCHEME = "record_id+text"
+
+_worker_model = None
+
+
+def _init_worker(model_name, backend):
+    global _worker_model
+    from embedding_cache import load_model
+    # Workers get large batches only, so the ONNX backend needs no query coalescing here
+    _worker_model = load_model(model_name, backend, window=0)
+
+
+def _embed_batch(texts):
+    return _worker_model.embed_documents(texts)
+
+
+def split_records(records, text_splitter):
+    """Yields (chunk_id, text, metadata) for every chunk of every (record_id, text) pair."""
+    for record_id, text in records:
+        for i, chunk in enumerate(text_splitter.split_text(text)):
+            yield chunk_id(record_id, chunk), chunk, {"record_id": record_id, "chunk": i}
+
+
+class VectorIndexBuilder:
+    def __init__(self, path=CHROMA_PATH, model_name=MODEL_NAME, workers=2, batch_size=64, window=256, backend=None,
+                 rebuild=False):
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(COLLECTION_NAME)
+        self.model_name = model_name
+        self.backend = backend = backend or embedding_backend()
+        # Vectors computed by earlier builds (or at query time) are reused, not recomputed
+        self.embedding_store = EmbeddingStore(cache_name(model_name, backend))
+        self.lexical_index = LexicalIndex(lexical_path(path))
+        self.stats = {"seen": 0, "embedded": 0, "cache_hits": 0, "skipped": 0, "deleted": 0}
+        if rebuild:
+            self.reset()
+        self.check_embedding(cache_name(model_name, backend))
+        self.check_chunk_ids()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.window = window  # records planned (existence check + stale cleanup) per round trip
+
+    def reset(self):
+        """Empties the store and its BM25 index (vector_rag.py --rebuild)."""
+        print(f"   > Emptying the vector store ({self.collection.count()} chunks)...")
+        self.client.delete_collection(COLLECTION_NAME)
+        self.collection = self.client.get_or_create_collection(COLLECTION_NAME)
+        self.lexical_index.rebuild([])
+        self.stats["reset"] = True
+
+    def record_metadata(self, key, value):
+        metadata = self.collection.metadata or {}
+        if metadata.get(key) != value:
+            self.collection.modify(metadata={**metadata, key: value})
+
+    def check_embedding(self, embedding):
+        """Keeps one embedding per store. Content-hash ids would otherwise skip
+        every chunk the previous backend embedded and leave a mixed index.
+
+        Raises ValueError on a mismatch (rebuild=True empties the store first).
+        """
+        metadata = self.collection.metadata or {}
+        # Stores built before the backend was recorded hold PyTorch vectors
+        stored = metadata.get(EMBEDDING_KEY)
+        if stored is None and self.collection.count():
+            stored = cache_name(self.model_name, "torch")
+        if stored not in (None, embedding):
+            raise ValueError(f"The vector store holds {stored} vectors, not {embedding}. "
+                             "Rebuild it for the new backend (vector_rag.py --rebuild).")
+        self.record_metadata(EMBEDDING_KEY, embedding)
+
+    def check_chunk_ids(self):
+        """Refuses stores with chunks from before ids hashed record id + text.
+
+        Those chunks have random ids and no record_id, so the builder can
+        neither find nor clean them up, and a rerun would store every chunk a
+        second time. The store is scanned once; its metadata then records
+        that every id follows the scheme.
+        """
+        if (self.collection.metadata or {}).get(CHUNK_IDS_KEY) == CHUNK_ID_SCHEME:
+            return
+        legacy = 0
+        offset = 0
+        while True:
+            rows = self.collection.get(include=["metadatas"], limit=1000, offset=offset)
+            if not rows["ids"]:
+                break
+            legacy += sum(1 for meta in rows["metadatas"] if not (meta or {}).get("record_id"))
+            offset += len(rows["ids"])
+        if legacy:
+            raise ValueError(f"{legacy} chunks in the vector store come from an older build (random ids, no "
+                             "record_id) that this build would duplicate. Rebuild it: vector_rag.py --rebuild.")
+        self.record_metadata(CHUNK_IDS_KEY, CHUNK_ID_SCHEME)
+
+    def existing_ids(self, ids):
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def delete_stale(self, window):
+        """Removes chunks of the window's records that no longer exist (record text changed)."""
+        wanted = {cid for cid, _, _ in window}
+        record_ids = list({meta["record_id"] for _, _, meta in window})
+        current = self.collection.get(where={"record_id": {"$in": record_ids}}, include=[])["ids"]
+        stale = [cid for cid in current if cid not in wanted]
+        if stale:
+            self.collection.delete(ids=stale)
+            self.lexical_index.delete(stale)
+            self.stats["deleted"] += len(stale)
+
+    def upsert(self, chunks, vectors):
+        self.collection.upsert(
+            ids=[cid for cid, _, _ in chunks],
+            embeddings=vectors,
+            documents=[text for _, text, _ in chunks],
+            metadatas=[meta for _, _, meta in chunks],
+        )
+
+    def build(self, records, text_splitter):
+        """Embeds and upserts every new chunk of `records`. Returns the stats dict."""
+        start = time.time()
+        # Stores built before the lexical index existed (or a deleted one) are indexed once, in full
+        if self.lexical_index.live_count() != self.collection.count():
+            print(f"   > Indexing {self.collection.count()} existing chunks for BM25...")
+            self.lexical_index.rebuild(iter_collection(self.collection))
+        ctx = multiprocessing.get_context("spawn")  # torch is not fork-safe
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(self.model_name, self.backend)) as pool:
+            # Windows hold whole records, so stale-chunk cleanup sees all of a record's chunks
+            for record_batch in iter_batches(records, self.window):
+                window = list(split_records(record_batch, text_splitter))
+                if not window:
+                    continue
+                self.stats["seen"] += len(window)
+                # Same text twice within a record is stored once
+                unique = list({cid: (cid, text, meta) for cid, text, meta in window}.values())
+                existing = self.existing_ids([cid for cid, _, _ in unique])
+                todo = [c for c in unique if c[0] not in existing]
+                self.stats["skipped"] += len(window) - len(todo)
+                self.delete_stale(window)
+                self.lexical_index.add([(cid, text) for cid, text, _ in todo])
+
+                cached = self.embedding_store.get_many([text for _, text, _ in todo])
+                hits = [(c, v) for c, v in zip(todo, cached) if v is not None]
+                misses = [c for c, v in zip(todo, cached) if v is None]
+                if hits:
+                    self.upsert([c for c, _ in hits], [v.tolist() for _, v in hits])
+                    self.stats["cache_hits"] += len(hits)
+
+                batches = list(iter_batches(misses, self.batch_size))
+                futures = [pool.submit(_embed_batch, [text for _, text, _ in b]) for b in batches]
+                for batch, future in zip(batches, futures):
+                    vectors = future.result()
+                    self.embedding_store.put_many([text for _, text, _ in batch], vectors)
+                    self.upsert(batch, vectors)
+                    self.stats["embedded"] += len(batch)
+
+                elapsed = time.time() - start
+                print(f"   > {self.stats['seen']} chunks seen | {self.stats['embedded']} embedded | "
+                      f"{self.stats['skipped']} unchanged | {self.stats['seen'] / elapsed:.1f} chunks/s")
+
+        self.lexical_index.commit()
+        self.stats["lexical_chunks"] = self.lexical_index.live_count()
+        elapsed = time.time() - start
+        self.stats["elapsed_s"] = round(elapsed, 1)
+        self.stats["embedded_per_s"] = round(self.stats["embedded"] / elapsed, 1) if elapsed else 0.0
+        return self.stats
@@ -1,38 +1,57 @@
-import os
+import argparse
+from dotenv import load_dotenv
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from data_loader import load_medical_data
-
-# 1. Load Data
-raw_docs = load_medical_data()
-
-# 2. Split Text (Chunks)
-# Medical texts are dense; we need smaller chunks with overlap to preserve context
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200
-)
-docs = text_splitter.create_documents(raw_docs)
-
-print(f"Split into {len(docs)} chunks. Embedding now... (this may take a minute)")
-
-# 3. Create Vector Store (ChromaDB)
-# We use a free, open-source medical-friendly embedding model
-embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-
-db = Chroma.from_documents(
-    documents=docs, 
-    embedding=embedding_function, 
-    persist_directory="./medical_chroma_db"
-)
-
-print("Vector Database created successfully!")
-
-# 4. Test Retrieval
-query = "do statins increase risk of diabetes?"
-results = db.similarity_search(query, k=3)
-
-print("\n--- TEST QUERY RESULTS ---")
-for i, res in enumerate(results):
-    print(f"\nResult {i+1}: {res.page_content[:300]}...")
\ No newline at end of file
+from data_loader import iter_medical_records, SUBSETS
+from data_version import bump_data_version
+from vector_index import VectorIndexBuilder, CHROMA_PATH, MODEL_NAME
+from embedding_cache import BACKENDS, embedding_backend, get_embedding_function
+
+# The embedding workers are spawned processes that re-import this module,
+# so everything runs under the __main__ guard.
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build / update the MedGraph vector store.")
+    parser.add_argument("--subset", default="pqa_labeled", choices=SUBSETS)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=2, help="Embedding processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding call")
+    parser.add_argument("--embedding-backend", default=embedding_backend(), choices=BACKENDS,
+                        help="onnx needs `python onnx_embeddings.py export` first; switching needs --rebuild")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Empty the store first (required after switching the embedding backend, "
+                             "or for a store from an older build)")
+    args = parser.parse_args()
+
+    # 1. Stream Data (records are read from the Arrow cache batch by batch)
+    records = iter_medical_records(args.subset, limit=args.limit)
+
+    # 2. Split Text (Chunks)
+    # Medical texts are dense; we need smaller chunks with overlap to preserve context
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+
+    # 3. Create / Update Vector Store (ChromaDB)
+    # Chunk ids hash record id + text: reruns only embed new or changed chunks
+    print("Embedding new chunks... (the first run may take a minute)")
+    builder = VectorIndexBuilder(CHROMA_PATH, model_name=MODEL_NAME, workers=args.workers,
+                                 batch_size=args.batch_size, backend=args.embedding_backend, rebuild=args.rebuild)
+    stats = builder.build(records, text_splitter)
+
+    print(f"Vector Database updated successfully! {stats}")
+    # Upserts of cached vectors change the store too (e.g. after --rebuild)
+    if stats["embedded"] or stats["cache_hits"] or stats["deleted"] or stats.get("reset"):
+        bump_data_version("vector store updated")
+
+    # 4. Test Retrieval
+    # Same cached model the builder filled, so this query is embedded at most once
+    embedding_function = get_embedding_function(MODEL_NAME, args.embedding_backend)
+    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    query = "do statins increase risk of diabetes?"
+    results = db.similarity_search(query, k=3)
+
+    print("\n--- TEST QUERY RESULTS ---")
+    for i, res in enumerate(results):
+        print(f"\nResult {i+1}: {res.page_content[:300]}...")